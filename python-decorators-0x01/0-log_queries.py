@@ -1,11 +1,30 @@
 """
 Decorator to log all SQL queries executed by a function.
+
+log_queries times every call and records the duration under the query's
+fingerprint (see query_log), so latency can be reported per query shape
+with query_log.stats(). Log lines are handed to a queue and written by a
+background thread instead of being printed synchronously. With sample_rate
+below 1 only that share of calls is logged. Calls slower than slow_ms are
+always logged.
+
+The query is the query= keyword argument, else the first positional one (the
+second when the first is a connection, as with_db_connection passes it).
+Functions taking their query elsewhere pass its index as position=; calls
+where that argument is not a string are run without being logged.
+
+    @log_queries(sample_rate=0.01, slow_ms=100)
+    def fetch_all_users(query):
+        ...
 """
 
 import sqlite3
 import functools
 import os
-import datetime
+import random
+import time
+
+query_log = __import__('query_log')
 
 # -- create dummy database for the example
 DB_FILE = 'users.db'
@@ -23,20 +42,45 @@ conn.close()
 
 #### decorator to lof SQL queries
 
-def log_queries(func):
+def _query_argument(args, kwargs, position):
+    if "query" in kwargs:
+        return kwargs["query"]
+    if position is None:
+        position = 1 if args and hasattr(args[0], "cursor") else 0
+    if position < len(args) and isinstance(args[position], str):
+        return args[position]
+    return None
+
+
+def log_queries(func=None, *, sample_rate=1.0, slow_ms=None, position=None):
+    if not 0 <= sample_rate <= 1:
+        raise ValueError("sample_rate must be between 0 and 1")
+    if func is None:
+        return functools.partial(log_queries, sample_rate=sample_rate,
+                                 slow_ms=slow_ms, position=position)
+    logger = query_log.get_logger()
+
     @functools.wraps(func)
     def wrapper(*args, **kwargs):
-        query_arg = None
-
-        if "query" in kwargs:
-            query_arg = kwargs["query"]
-        elif len(args) > 0:
-            query_arg = args[0]
+        query_arg = _query_argument(args, kwargs, position)
+        if not query_arg:
+            return func(*args, **kwargs)
 
-        if query_arg:
-            timestamp = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-            print(f"LOG [{timestamp}]: Executing query: {query_arg}")
-        return func(*args, **kwargs)
+        failed = False
+        started = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        except Exception:
+            failed = True
+            raise
+        finally:
+            elapsed = time.perf_counter() - started
+            query_log.record(query_arg, elapsed, failed)
+            slow = slow_ms is not None and elapsed * 1000 >= slow_ms
+            if slow or sample_rate == 1 or random.random() < sample_rate:
+                logger.info("%s query in %.3f ms: %s",
+                            "Failed" if failed else "Executed",
+                            elapsed * 1000, query_arg)
     return wrapper
 
 @log_queries
@@ -5,6 +5,8 @@ import sqlite3
 import functools
 import os
 
+db_pool = __import__('db_pool')
+
 # -- create dummy database for the example
 DB_FILE = 'users.db'
 if os.path.exists(DB_FILE):
@@ -19,17 +21,15 @@ conn.commit()
 conn.close()
 
 def with_db_connection(func):
+    """
+    Pass func a connection checked out of the pool for DB_FILE, and return
+    it to the pool afterwards instead of closing it.
+    """
 
     @functools.wraps(func)
     def wrapper(*args, **kwargs):
-      conn = None
-      try:
-        conn = sqlite3.connect(DB_FILE)
-        print("INFO: Opening database connection")
+      with db_pool.get_pool(DB_FILE).connection() as conn:
         return func(conn, *args, **kwargs)
-      finally:
-        if conn:
-          conn.close()
 
     return wrapper
 
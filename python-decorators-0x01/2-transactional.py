@@ -5,6 +5,9 @@ import sqlite3
 import functools
 import os
 
+db_pool = __import__('db_pool')
+result_cache = __import__('result_cache')
+
 # -- create dummy database for the example
 DB_FILE = 'users.db'
 if os.path.exists(DB_FILE):
@@ -19,35 +22,37 @@ conn.commit()
 conn.close()
 
 def with_db_connection(func):
+    @functools.wraps(func)
     def wrapper(*args, **kwargs):
-        conn = None
-        try:
-            conn = sqlite3.connect(DB_FILE)
-            print("INFO: DB Connection established")
-            result = func(conn, *args, **kwargs)
-            conn.commit()
+        with db_pool.get_pool(DB_FILE).connection() as conn, \
+                result_cache.track_writes(conn) as writes:
+            try:
+                result = func(conn, *args, **kwargs)
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                writes.rolled_back()
+                raise
+            # Cached reads of the tables just written are stale now.
+            writes.committed()
             return result
-        except Exception as e:
-          if conn:
-            conn.rollback()
-            raise e
-        finally:
-          if conn:
-            conn.close()
     return wrapper
 
 def transactional(func):
     @functools.wraps(func)
     def wrapper(conn, *args, **kwargs):
-        try:
-            result = func(conn, *args, **kwargs)
-            conn.commit()
-        except Exception as e:
-            print(f"TRANSACTION FAILED: An error occurred, rolling back. {e}")
-            conn.rollback()
-            raise e
-        else:
-            print("TRANSACTION SUCCESSFUL")
+        with result_cache.track_writes(conn) as writes:
+            try:
+                result = func(conn, *args, **kwargs)
+                conn.commit()
+            except Exception as e:
+                print(f"TRANSACTION FAILED: An error occurred, rolling back. {e}")
+                conn.rollback()
+                writes.rolled_back()
+                raise e
+            else:
+                writes.committed()
+                print("TRANSACTION SUCCESSFUL")
         return result
     return wrapper
 
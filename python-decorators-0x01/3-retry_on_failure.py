@@ -6,6 +6,10 @@ import functools
 import os
 import time
 
+db_pool = __import__('db_pool')
+result_cache = __import__('result_cache')
+retry_policy = __import__('retry_policy')
+
 # -- create dummy database for the example
 DB_FILE = 'users.db'
 if os.path.exists(DB_FILE):
@@ -23,38 +27,76 @@ conn.close()
 def with_db_connection(func):
     @functools.wraps(func)
     def wrapper(*args, **kwargs):
-        conn = sqlite3.connect(DB_FILE)
-        try:
-            result = func(conn, *args, **kwargs)
-        except Exception as e:
-            conn.rollback()
-            raise e
-        else:
+        with db_pool.get_pool(DB_FILE).connection() as conn, \
+                result_cache.track_writes(conn) as writes:
+            try:
+                result = func(conn, *args, **kwargs)
+            except Exception:
+                conn.rollback()
+                writes.rolled_back()
+                raise
             conn.commit()
-        finally:
-            conn.close()
-        return result
+            writes.committed()
+            return result
     return wrapper
 
-def retry_on_failure(retries=3, delay=1):
+def retry_on_failure(retries=3, delay=1, max_delay=30, deadline=None,
+                     retryable=None, budget=None, stats=None,
+                     sleep=time.sleep, clock=time.monotonic):
+  """
+  Make up to retries attempts at func, retrying errors that retryable
+  accepts (lock/busy errors by default; see retry_policy.classifier).
+
+  Retry n waits a random time up to min(max_delay, delay * 2 ** n). No
+  retry starts after deadline seconds from the first attempt, and every
+  retry spends a token from budget (the process-wide retry_policy.BUDGET
+  by default). When attempts, deadline or budget run out, the last error
+  is raised. Outcomes are counted in stats (retry_policy.STATS).
+  """
+  should_retry = retry_policy.classifier(retryable)
 
   def decorator(func):
     @functools.wraps(func)
     def wrapper(*args, **kwargs):
-      for attempt in range(retries):
+      tokens = retry_policy.BUDGET if budget is None else budget
+      counters = retry_policy.STATS if stats is None else stats
+      counters.count("calls")
+      tokens.deposit()
+      started = clock()
+      attempt = 0
+      while True:
         try:
-          return func(*args, **kwargs)
-        except (sqlite3.OperationalError, sqlite3.IntegrityError) as e:
-          if attempt < retries - 1:
-            print(
-              f"RETRY: Attempt {attempt + 1}/{retries} failed: {e}. Rertying in {delay} seconds..."
-            )
-
-          if 'database is locked' in str(e):
-            time.sleep(delay)
-          else:
-            print(f"ERROR: Attempt {attempt + 1}/{retries} failed: {e}")
+          result = func(*args, **kwargs)
+        except Exception as e:
+          attempt += 1
+          if not should_retry(e):
+            counters.count("not_retryable")
+            print(f"ERROR: Attempt {attempt}/{retries} failed: {e}")
+            raise
+          if attempt >= retries:
+            counters.count("exhausted")
+            print(f"ERROR: Attempt {attempt}/{retries} failed: {e}. Giving up.")
+            raise
+          wait = retry_policy.backoff(attempt - 1, delay, max_delay)
+          if deadline is not None and clock() - started + wait > deadline:
+            counters.count("past_deadline")
+            print(f"ERROR: Attempt {attempt}/{retries} failed: {e}. "
+                  f"Deadline of {deadline} seconds reached.")
             raise
+          if not tokens.withdraw():
+            counters.count("over_budget")
+            print(f"ERROR: Attempt {attempt}/{retries} failed: {e}. "
+                  "Retry budget exhausted.")
+            raise
+          counters.count("retries")
+          print(
+            f"RETRY: Attempt {attempt}/{retries} failed: {e}. Retrying in {wait:.2f} seconds..."
+          )
+          sleep(wait)
+        else:
+          if attempt:
+            counters.count("recovered")
+          return result
     return wrapper
   return decorator
 
@@ -4,8 +4,12 @@ create a decorator that caches the results of a database queries inorder to avoi
 
 import sqlite3
 import functools
+import inspect
 import os
-import time
+
+db_pool = __import__('db_pool')
+result_cache = __import__('result_cache')
+single_flight = __import__('single_flight')
 
 # -- create dummy database for the example
 DB_FILE = 'users.db'
@@ -21,35 +25,118 @@ conn.commit()
 conn.close()
 
 
-query_cache = {}
+query_cache = result_cache.ResultCache(max_entries=1024,
+                                       max_bytes=64 * 1024 * 1024, ttl=3600)
 
 def with_db_connection(func):
     @functools.wraps(func)
     def wrapper(*args, **kwargs):
-        conn = sqlite3.connect(DB_FILE)
-        try:
+        with db_pool.get_pool(DB_FILE).connection() as conn:
             return func(conn, *args, **kwargs)
-        finally:
-            conn.close()
     return wrapper
 
 
 
-def cache_query(func):
+def pooled_connection():
+    return db_pool.get_pool(DB_FILE).connection()
+
+
+def cache_query(func=None, *, cache=None, ttl=None, revalidate=None):
+    """
+    Cache func(conn, query, *params) results in query_cache (or cache),
+    keyed by the query and its parameters, for ttl seconds (the cache's
+    default when None). Hits return a copy, so callers can't modify the
+    cached rows. Entries are tagged with the tables the query reads, and
+    committed writes to those tables (see 2-transactional.py) drop them.
+
+    Concurrent misses on one key run the query once, on a connection from
+    revalidate(), a context manager factory (the pool by default); the
+    other callers wait for that result. The shared query never runs on one
+    caller's conn, whose open transaction could hold uncommitted rows that
+    would then be cached for everyone. For the same reason a caller whose
+    conn is inside a transaction bypasses the cache and queries its own
+    conn. If the cache keeps stale entries (stale=...), an expired entry is
+    still returned while a single background refresh runs the same way.
+
+    func may be a coroutine function, in which case revalidate must return
+    an async context manager. Without one, async misses run on the
+    caller's conn, are not coalesced, and stale entries are treated as
+    misses.
+    """
+    if func is None:
+        return functools.partial(cache_query, cache=cache, ttl=ttl,
+                                 revalidate=revalidate)
+
+    if inspect.iscoroutinefunction(func):
+        return _cache_async_query(func, cache, ttl, revalidate)
+
+    def fetch(store, key, conn, query, args, kwargs):
+        tables = result_cache.tables_read(query)
+        version = store.version(tables)
+        result = func(conn, query, *args, **kwargs)
+        print(f"Query '{query}' is executed and being cached...")
+        return store.set(key, result, ttl=ttl, tables=tables, version=version)
+
+    flights = single_flight.SingleFlight()
+    connect = revalidate or pooled_connection
+
+    def refresh(store, key, query, args, kwargs):
+        with connect() as conn:
+            return fetch(store, key, conn, query, args, kwargs)
+
     @functools.wraps(func)
-    def wrapper(conn, query):
-        if query in query_cache:
-
-          if time.time() > query_cache[query][1]:
-            print(f"Query '{query}' is expired")
-            del query_cache[query]
-          else:
-            print(f"Query '{query}' is cached")
-            return query_cache[query]
-        result = func(conn, query)
+    def wrapper(conn, query, *args, **kwargs):
+        if getattr(conn, "in_transaction", False):
+          return func(conn, query, *args, **kwargs)
+        store = query_cache if cache is None else cache
+        key = result_cache.make_key(query, *args, **kwargs)
+        result, fresh = store.lookup(key)
+        if result is not result_cache.MISSING:
+          print(f"Query '{query}' is cached")
+          if not fresh:
+            flights.spawn(key, functools.partial(refresh, store, key, query,
+                                                 args, kwargs))
+        else:
+          result = flights.do(key, functools.partial(refresh, store, key,
+                                                     query, args, kwargs))
+        return list(result) if isinstance(result, list) else result
+    wrapper.flights = flights
+    return wrapper
+
+
+def _cache_async_query(func, cache, ttl, revalidate):
+    flights = single_flight.AsyncSingleFlight()
+
+    async def fetch(store, key, conn, query, args, kwargs):
+        tables = result_cache.tables_read(query)
+        version = store.version(tables)
+        result = await func(conn, query, *args, **kwargs)
         print(f"Query '{query}' is executed and being cached...")
-        query_cache[query] = {result, time.time() + 3600}
-        return result
+        return store.set(key, result, ttl=ttl, tables=tables, version=version)
+
+    async def refresh(store, key, query, args, kwargs):
+        async with revalidate() as conn:
+            return await fetch(store, key, conn, query, args, kwargs)
+
+    @functools.wraps(func)
+    async def wrapper(conn, query, *args, **kwargs):
+        if getattr(conn, "in_transaction", False):
+          return await func(conn, query, *args, **kwargs)
+        store = query_cache if cache is None else cache
+        key = result_cache.make_key(query, *args, **kwargs)
+        result, fresh = store.lookup(key, allow_stale=revalidate is not None)
+        if result is not result_cache.MISSING:
+          print(f"Query '{query}' is cached")
+          if not fresh:
+            flights.spawn(key, functools.partial(refresh, store, key, query,
+                                                 args, kwargs))
+        elif revalidate is None:
+          result = await fetch(store, key, conn, query, args, kwargs)
+        else:
+          result = await flights.do(key, functools.partial(
+              refresh, store, key, query, args, kwargs))
+        return list(result) if isinstance(result, list) else result
+    wrapper.flights = flights
     return wrapper
 
 
@@ -0,0 +1,184 @@
+"""
+A bounded, thread-safe pool of SQLite connections for with_db_connection.
+
+Opening a connection per call costs a connect, re-reading the schema, and a
+cold page cache every time. ConnectionPool keeps up to size connections
+open, hands each one to a single caller at a time (checkout/return), and
+checks that a connection still works before handing it out again.
+
+Every new connection gets the PRAGMAS once, when it is opened:
+
+* journal_mode=WAL lets readers run while a writer commits;
+* synchronous=NORMAL fsyncs at checkpoints rather than on every commit,
+  which is safe in WAL mode;
+* cache_size and mmap_size keep hot pages in memory across calls.
+
+A connection waits at most busy_timeout seconds for a lock held by another
+writer before raising "database is locked". That is kept short and separate
+from timeout, the wait for a free pool slot, so that retry_on_failure's
+backoff, budget and deadline decide how long a locked database is retried
+rather than the driver blocking for the whole checkout timeout.
+
+    pool = get_pool("users.db")
+    with pool.connection() as conn:
+        conn.execute("SELECT * FROM users")
+"""
+
+import contextlib
+import queue
+import sqlite3
+import threading
+import time
+
+DEFAULT_SIZE = 8
+DEFAULT_TIMEOUT = 30.0
+DEFAULT_BUSY_TIMEOUT = 1.0
+
+PRAGMAS = {
+    "journal_mode": "WAL",
+    "synchronous": "NORMAL",
+    "cache_size": -16000,
+    "mmap_size": 256 * 1024 * 1024,
+    "temp_store": "MEMORY",
+}
+
+
+class PoolTimeout(Exception):
+    """No connection was returned to the pool within the timeout."""
+
+
+class ConnectionPool:
+    """
+    At most size connections to one SQLite file, created on demand.
+
+    A connection taken from the pool is checked with SELECT 1 if it has been
+    idle for more than check_after seconds, and replaced if the check fails.
+    A connection returned with an open transaction is rolled back first, so
+    one caller's uncommitted work never leaks into the next.
+    """
+
+    def __init__(self, path, size=DEFAULT_SIZE, timeout=DEFAULT_TIMEOUT,
+                 pragmas=None, check_after=1.0,
+                 busy_timeout=DEFAULT_BUSY_TIMEOUT):
+        if size < 1:
+            raise ValueError("size must be at least 1")
+        self.path = path
+        self.size = size
+        self.timeout = timeout
+        self.busy_timeout = busy_timeout
+        self.pragmas = PRAGMAS if pragmas is None else pragmas
+        self.check_after = check_after
+        self._idle = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(size)
+        self._closed = False
+        self._stats_lock = threading.Lock()
+        self.stats = {"connects": 0, "checkouts": 0, "failed_checks": 0}
+
+    def _count(self, name):
+        with self._stats_lock:
+            self.stats[name] += 1
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=self.busy_timeout,
+                               check_same_thread=False)
+        for name, value in self.pragmas.items():
+            conn.execute(f"PRAGMA {name} = {value}").fetchall()
+        self._count("connects")
+        return conn
+
+    @staticmethod
+    def _alive(conn):
+        try:
+            conn.execute("SELECT 1").fetchone()
+        except sqlite3.Error:
+            return False
+        return True
+
+    def acquire(self, timeout=None):
+        """Check a connection out; wait up to timeout for a free slot."""
+        if self._closed:
+            raise RuntimeError("Connection pool is closed")
+        timeout = self.timeout if timeout is None else timeout
+        if not self._slots.acquire(timeout=timeout):
+            raise PoolTimeout(f"No connection to {self.path} became free in "
+                              f"{timeout}s")
+        try:
+            self._count("checkouts")
+            while True:
+                try:
+                    conn, returned = self._idle.get_nowait()
+                except queue.Empty:
+                    return self._connect()
+                if (time.monotonic() - returned < self.check_after
+                        or self._alive(conn)):
+                    return conn
+                self._count("failed_checks")
+                _close(conn)
+        except BaseException:
+            self._slots.release()
+            raise
+
+    def release(self, conn, discard=False):
+        """Return a checked-out connection (or close it with discard)."""
+        try:
+            if not discard and conn.in_transaction:
+                conn.rollback()
+        except sqlite3.Error:
+            discard = True
+        if discard or self._closed:
+            _close(conn)
+        else:
+            self._idle.put((conn, time.monotonic()))
+        self._slots.release()
+
+    @contextlib.contextmanager
+    def connection(self):
+        conn = self.acquire()
+        try:
+            yield conn
+        except BaseException:
+            # Keep the connection unless the error left it unusable.
+            self.release(conn, discard=not self._alive(conn))
+            raise
+        else:
+            self.release(conn)
+
+    def close(self):
+        """Close idle connections; checked-out ones close when returned."""
+        self._closed = True
+        while True:
+            try:
+                conn, _ = self._idle.get_nowait()
+            except queue.Empty:
+                return
+            _close(conn)
+
+
+def _close(conn):
+    try:
+        conn.close()
+    except sqlite3.Error:
+        pass
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(path, **options):
+    """Return the process-wide pool for path, creating it on first use."""
+    pool = _pools.get(path)
+    if pool is None:
+        with _pools_lock:
+            pool = _pools.get(path)
+            if pool is None:
+                pool = _pools[path] = ConnectionPool(path, **options)
+    return pool
+
+
+def close_all():
+    with _pools_lock:
+        pools = list(_pools.values())
+        _pools.clear()
+    for pool in pools:
+        pool.close()
@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+"""
+Microbenchmark: calls/sec of a short query with a connection per call
+versus a pooled connection (db_pool), single- and multi-threaded.
+
+    python3 pool_benchmark.py --calls 20000 --threads 1 4
+"""
+
+import argparse
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+
+db_pool = __import__('db_pool')
+
+QUERY = "SELECT * FROM users WHERE id = ?"
+
+
+def create_database(path, rows):
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE users (id INTEGER PRIMARY KEY, name TEXT,"
+                 " email TEXT)")
+    conn.executemany("INSERT INTO users (name, email) VALUES (?, ?)",
+                     [(f"user {i}", f"user{i}@example.com")
+                      for i in range(rows)])
+    conn.commit()
+    conn.close()
+
+
+def per_call(path, rows):
+    def call(i):
+        conn = sqlite3.connect(path)
+        try:
+            return conn.execute(QUERY, (i % rows + 1,)).fetchone()
+        finally:
+            conn.close()
+    return call
+
+
+def pooled(path, rows, size):
+    pool = db_pool.ConnectionPool(path, size=size)
+
+    def call(i):
+        with pool.connection() as conn:
+            return conn.execute(QUERY, (i % rows + 1,)).fetchone()
+    call.pool = pool
+    return call
+
+
+def measure(call, calls, threads):
+    per_thread = calls // threads
+
+    def work(offset):
+        for i in range(offset, offset + per_thread):
+            call(i)
+
+    workers = [threading.Thread(target=work, args=(n * per_thread,))
+               for n in range(threads)]
+    started = time.perf_counter()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    return per_thread * threads / (time.perf_counter() - started)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--calls", type=int, default=20000)
+    parser.add_argument("--rows", type=int, default=10000)
+    parser.add_argument("--threads", type=int, nargs="*", default=[1, 4])
+    parser.add_argument("--pool-size", type=int, default=db_pool.DEFAULT_SIZE)
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "bench.db")
+        create_database(path, args.rows)
+        results = {}
+        for threads in args.threads:
+            baseline = measure(per_call(path, args.rows), args.calls,
+                               threads)
+            call = pooled(path, args.rows, args.pool_size)
+            reused = measure(call, args.calls, threads)
+            call.pool.close()
+            results[threads] = (baseline, reused)
+            print(f"threads={threads:<3} per-call {baseline:>10,.0f} calls/s"
+                  f"   pooled {reused:>10,.0f} calls/s"
+                  f"   x{reused / baseline:.1f}")
+    return results
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,251 @@
+"""
+Query timing, fingerprinting and non-blocking logging for log_queries.
+
+fingerprint() normalizes a query so that calls differing only in literal
+values group together:
+
+    SELECT * FROM users WHERE id = 42 AND name = 'Bob'
+    select * from users where id = ? and name = ?
+
+record() adds a duration to the LatencyHistogram of the query's fingerprint,
+and stats() reports count, errors and latency quantiles per fingerprint.
+
+Log lines go through a QueueHandler, so the decorated call only puts a
+record on an in-memory queue; a QueueListener thread formats and writes it.
+If the queue is full, the record is dropped and counted rather than making
+the caller wait.
+"""
+
+import atexit
+import bisect
+import functools
+import logging
+import logging.handlers
+import queue
+import re
+import sys
+import threading
+
+LOGGER_NAME = "query_log"
+QUEUE_SIZE = 10000
+LOG_FORMAT = "LOG [%(asctime)s]: %(message)s"
+DATE_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+_TOKENS = re.compile(r"""
+    (?P<comment>--[^\n]*|/\*.*?\*/)
+  | (?P<string>'(?:[^']|'')*')
+  | (?P<number>\b0x[0-9a-f]+\b|(?<![\w.])\d+(?:\.\d*)?(?:e[-+]?\d+)?\b)
+  | (?P<space>\s+)
+""", re.VERBOSE | re.IGNORECASE | re.DOTALL)
+_LIST = r"\(\s*\?(?:\s*,\s*\?)*\s*\)"
+_LISTS = re.compile(_LIST + r"(?:\s*,\s*" + _LIST + ")*")
+
+
+def _replace(match):
+    if match.lastgroup in ("comment", "space"):
+        return " "
+    return "?"
+
+
+@functools.lru_cache(maxsize=4096)
+def fingerprint(query):
+    """Return query with literals replaced by ? and whitespace collapsed."""
+    normalized = _TOKENS.sub(_replace, query).strip().lower()
+    # IN (1, 2, 3) and multi-row VALUES lists of any length look the same.
+    normalized = _LISTS.sub("(?+)", normalized)
+    return re.sub(r" {2,}", " ", normalized)
+
+
+class LatencyHistogram:
+    """
+    Durations in log-spaced buckets: each bucket is growth times wider than
+    the last, so quantiles are accurate to within that ratio from
+    microseconds to minutes in a few hundred counters.
+    """
+
+    def __init__(self, smallest=1e-6, largest=600.0, growth=1.1):
+        bounds, bound = [], smallest
+        while bound < largest:
+            bounds.append(bound)
+            bound *= growth
+        bounds.append(largest)
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.min = None
+        self.max = None
+
+    def add(self, seconds):
+        self.counts[bisect.bisect_left(self.bounds, seconds)] += 1
+        self.count += 1
+        self.total += seconds
+        if self.min is None or seconds < self.min:
+            self.min = seconds
+        if self.max is None or seconds > self.max:
+            self.max = seconds
+
+    def merge(self, other):
+        if other.bounds != self.bounds:
+            raise ValueError("Can only merge histograms with the same buckets")
+        self.counts = [a + b for a, b in zip(self.counts, other.counts)]
+        self.count += other.count
+        self.total += other.total
+        for value in (other.min, other.max):
+            if value is not None:
+                self.min = value if self.min is None else min(self.min, value)
+                self.max = value if self.max is None else max(self.max, value)
+        return self
+
+    def quantile(self, q):
+        """Upper bound of the bucket holding the q-th quantile."""
+        if not self.count:
+            return None
+        rank = q * (self.count - 1)
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen > rank:
+                if index >= len(self.bounds):
+                    return self.max
+                return min(self.bounds[index], self.max)
+        return self.max
+
+    @property
+    def mean(self):
+        return self.total / self.count if self.count else None
+
+
+class QueryStats:
+    """Per-fingerprint latency histograms, safe to update from threads."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._queries = {}
+
+    def record(self, query, seconds, error=False):
+        key = fingerprint(query)
+        with self._lock:
+            entry = self._queries.get(key)
+            if entry is None:
+                entry = self._queries[key] = {
+                    "histogram": LatencyHistogram(),
+                    "errors": 0,
+                    "example": query,
+                }
+            entry["histogram"].add(seconds)
+            entry["errors"] += error
+        return key
+
+    def snapshot(self, quantiles=(0.5, 0.95, 0.99)):
+        """Return {fingerprint: summary dict}, slowest total time first."""
+        with self._lock:
+            entries = list(self._queries.items())
+        report = {}
+        for key, entry in sorted(entries,
+                                 key=lambda item: -item[1]["histogram"].total):
+            histogram = entry["histogram"]
+            summary = {
+                "count": histogram.count,
+                "errors": entry["errors"],
+                "total_ms": histogram.total * 1000,
+                "mean_ms": histogram.mean * 1000,
+                "max_ms": histogram.max * 1000,
+                "example": entry["example"],
+            }
+            for q in quantiles:
+                summary[f"p{q * 100:g}_ms"] = histogram.quantile(q) * 1000
+            report[key] = summary
+        return report
+
+    def reset(self):
+        with self._lock:
+            self._queries.clear()
+
+
+class _QueueHandler(logging.handlers.QueueHandler):
+    """
+    Enqueue records without formatting them first, and drop them rather
+    than block or raise when the queue is full.
+
+    The stock QueueHandler formats every record in the calling thread so it
+    can be pickled; records that stay in this process don't need that, so
+    formatting is left to the listener thread.
+    """
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record):
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+_stats = QueryStats()
+_listener = None
+_handler = None
+_setup_lock = threading.Lock()
+
+
+def get_logger(handler=None):
+    """
+    Return the query logger, starting its queue listener on first use.
+
+    handler is where records are finally written (stdout by default); it is
+    only used by the first call.
+    """
+    global _listener, _handler
+    logger = logging.getLogger(LOGGER_NAME)
+    if _listener is not None:
+        return logger
+    with _setup_lock:
+        if _listener is None:
+            if handler is None:
+                handler = logging.StreamHandler(sys.stdout)
+                handler.setFormatter(logging.Formatter(LOG_FORMAT,
+                                                       DATE_FORMAT))
+            log_queue = queue.Queue(QUEUE_SIZE)
+            _handler = _QueueHandler(log_queue)
+            logger.addHandler(_handler)
+            logger.setLevel(logging.INFO)
+            logger.propagate = False
+            _listener = logging.handlers.QueueListener(log_queue, handler)
+            _listener.start()
+            atexit.register(stop_logging)
+    return logger
+
+
+def stop_logging():
+    """Flush queued records and stop the listener thread."""
+    global _listener, _handler
+    with _setup_lock:
+        if _listener is None:
+            return
+        _listener.stop()
+        logging.getLogger(LOGGER_NAME).removeHandler(_handler)
+        _listener = _handler = None
+
+
+def dropped():
+    """How many log records were dropped because the queue was full."""
+    return _handler.dropped if _handler is not None else 0
+
+
+def record(query, seconds, error=False):
+    """Record one execution of query in the process-wide stats."""
+    return _stats.record(query, seconds, error)
+
+
+def stats(quantiles=(0.5, 0.95, 0.99)):
+    """Per-fingerprint latency summary of everything recorded so far."""
+    return _stats.snapshot(quantiles)
+
+
+def reset_stats():
+    _stats.reset()
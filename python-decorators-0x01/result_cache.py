@@ -0,0 +1,373 @@
+"""
+A bounded, thread-safe LRU cache with per-entry TTLs for query results.
+
+ResultCache holds at most max_entries results and roughly max_bytes of
+them, evicting the least recently used entries first. Each entry expires
+ttl seconds after it was stored. Keys combine the SQL text with the bound
+parameters, so the same statement with different parameters is cached
+separately:
+
+    cache = ResultCache(max_entries=1024, max_bytes=64 * 2 ** 20, ttl=300)
+    key = make_key("SELECT * FROM users WHERE id = ?", (1,))
+    rows = cache.get(key)
+    if rows is MISSING:
+        rows = cache.set(key, run_query())
+
+With stale=N, an expired entry is kept N more seconds, and lookup() can
+still return it (flagged as not fresh) while the caller refreshes it in
+the background. stats() exposes hit, miss, eviction and expiration
+counters.
+
+Entries can be tagged with the tables their query reads (tables_read()).
+track_writes() records the tables a connection writes to, and when the
+transaction commits, invalidate_tables() drops the entries of every cache
+that depend on them, so a long TTL no longer means serving stale rows:
+
+    with track_writes(conn) as writes:
+        conn.execute("UPDATE users SET email = ? WHERE id = ?", ...)
+        conn.commit()
+        writes.committed()      # drops cached reads of users
+
+Writes made without track_writes (other processes, triggers updating other
+tables, writes through views) are not seen; the TTL still bounds those.
+"""
+
+import collections
+import contextlib
+import re
+import sys
+import threading
+import time
+import weakref
+
+MISSING = object()
+ALL_TABLES = "*"
+
+_IDENTIFIER = r"""(?:"[^"]+"|`[^`]+`|\[[^\]]+\]|[A-Za-z_][\w$]*)"""
+_TABLE = rf"(?:{_IDENTIFIER}\s*\.\s*)?({_IDENTIFIER})"
+_LITERALS = re.compile(r"--[^\n]*|/\*.*?\*/|'(?:[^']|'')*'", re.DOTALL)
+# Words that can follow a table name and must not be taken for its alias.
+_CLAUSES = ("JOIN", "LEFT", "RIGHT", "FULL", "INNER", "OUTER", "CROSS",
+            "NATURAL", "ON", "USING", "WHERE", "GROUP", "ORDER", "HAVING",
+            "LIMIT", "OFFSET", "UNION", "INTERSECT", "EXCEPT", "WINDOW",
+            "INDEXED", "NOT", "SET", "VALUES", "RETURNING")
+_ALIAS = (rf"(?:\s+(?:AS\s+)?(?!(?:{'|'.join(_CLAUSES)})\b){_IDENTIFIER})?")
+_READS = re.compile(
+    rf"\b(?:FROM|JOIN)\s+{_TABLE}({_ALIAS}"
+    rf"(?:\s*,\s*{_TABLE}{_ALIAS})*)",
+    re.IGNORECASE)
+_LISTED = re.compile(rf",\s*{_TABLE}", re.IGNORECASE)
+_WRITES = re.compile(
+    rf"\b(?:INSERT(?:\s+OR\s+\w+)?\s+INTO|REPLACE\s+INTO"
+    rf"|UPDATE(?:\s+OR\s+\w+)?|DELETE\s+FROM"
+    rf"|(?:DROP|ALTER)\s+TABLE(?:\s+IF\s+EXISTS)?)\s+{_TABLE}",
+    re.IGNORECASE)
+_NO_WRITES = {"select", "values", "explain", "begin", "commit", "end",
+              "rollback", "savepoint", "release", "pragma", "analyze",
+              "with"}
+
+
+def _name(identifier):
+    return identifier.strip('"`[]').lower()
+
+
+def _strip_literals(query):
+    return _LITERALS.sub(" ", query)
+
+
+def tables_read(query):
+    """
+    The lower-cased names of the tables (and views) a SELECT reads, from
+    its FROM and JOIN clauses, subqueries included.
+    """
+    tables = set()
+    for match in _READS.finditer(_strip_literals(query)):
+        tables.add(_name(match.group(1)))
+        tables.update(_name(name) for name in _LISTED.findall(match.group(2)))
+    return frozenset(tables)
+
+
+def tables_written(query):
+    """
+    The lower-cased names of the tables a statement modifies: none for
+    reads and transaction control, {ALL_TABLES} for statements it can't
+    tell (CREATE, VACUUM, ...), so that callers err towards invalidating.
+    """
+    query = _strip_literals(query)
+    tables = {_name(match) for match in _WRITES.findall(query)}
+    if tables:
+        return frozenset(tables)
+    words = query.split(None, 1)
+    if not words or words[0].lower() in _NO_WRITES:
+        return frozenset()
+    return frozenset((ALL_TABLES,))
+
+
+def _freeze(value):
+    if isinstance(value, (list, tuple)):
+        return tuple(_freeze(item) for item in value)
+    if isinstance(value, dict):
+        return tuple(sorted((key, _freeze(item))
+                            for key, item in value.items()))
+    if isinstance(value, (set, frozenset)):
+        return frozenset(_freeze(item) for item in value)
+    return value
+
+
+def make_key(query, *params, **named):
+    """
+    Key for a query and its parameters. Runs of whitespace in the SQL are
+    collapsed so reformatting a query does not split its entries.
+    """
+    return (" ".join(query.split()), _freeze(params), _freeze(named))
+
+
+def sizeof(value, _depth=0):
+    """Approximate deep size in bytes of a query result."""
+    size = sys.getsizeof(value)
+    if _depth < 3:
+        if isinstance(value, (list, tuple, set, frozenset)):
+            size += sum(sizeof(item, _depth + 1) for item in value)
+        elif isinstance(value, dict):
+            size += sum(sizeof(key, _depth + 1) + sizeof(item, _depth + 1)
+                        for key, item in value.items())
+    return size
+
+
+class _Entry:
+    __slots__ = ("value", "expires", "size", "tables")
+
+    def __init__(self, value, expires, size, tables):
+        self.value = value
+        self.expires = expires
+        self.size = size
+        self.tables = tables
+
+
+_caches = weakref.WeakSet()
+_caches_lock = threading.Lock()
+
+
+class ResultCache:
+    """
+    LRU by entry count and approximate bytes, with per-entry TTLs.
+
+    Entries stored with tables= are dropped by invalidate_tables() on any
+    of those tables. Every ResultCache is registered for the module-level
+    invalidate_tables(), which committed writes go through.
+    """
+
+    def __init__(self, max_entries=1024, max_bytes=64 * 1024 * 1024,
+                 ttl=3600.0, stale=0.0, clock=time.monotonic):
+        if max_entries < 1 or max_bytes < 1:
+            raise ValueError("max_entries and max_bytes must be positive")
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.stale = stale
+        self.clock = clock
+        self._entries = collections.OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._by_table = collections.defaultdict(set)
+        # Bumped per table on each invalidation; see version().
+        self._versions = collections.Counter()
+        self.hits = self.misses = self.evictions = self.expirations = 0
+        self.invalidations = self.stale_hits = 0
+        with _caches_lock:
+            _caches.add(self)
+
+    def get(self, key, default=MISSING):
+        """The fresh value of key, or default."""
+        value, fresh = self.lookup(key, allow_stale=False)
+        return value if fresh else default
+
+    def lookup(self, key, allow_stale=True):
+        """
+        Return (value, fresh). value is MISSING when key has no entry (or
+        only a stale one and not allow_stale); fresh is False when value
+        expired less than stale seconds ago.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return MISSING, False
+            now = self.clock()
+            if entry.expires is not None and entry.expires <= now:
+                if entry.expires + self.stale <= now:
+                    self._remove(key)
+                    self.expirations += 1
+                    self.misses += 1
+                    return MISSING, False
+                if not allow_stale:
+                    self.misses += 1
+                    return MISSING, False
+                self._entries.move_to_end(key)
+                self.stale_hits += 1
+                return entry.value, False
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry.value, True
+
+    def version(self, tables):
+        """
+        A token that changes whenever any of tables is invalidated. Take it
+        before running a query and pass it to set(), so a result read
+        before a concurrent write commits is not cached after it.
+        """
+        with self._lock:
+            return (self._versions[ALL_TABLES],
+                    sum(self._versions[table] for table in tables))
+
+    def set(self, key, value, ttl=None, tables=(), version=None):
+        """
+        Store value under key and return it. ttl overrides the default;
+        tables are what the value depends on; version is from version().
+        """
+        ttl = self.ttl if ttl is None else ttl
+        size = sizeof(value)
+        if size > self.max_bytes:
+            # Caching it would evict everything else; don't.
+            return value
+        expires = None if ttl is None else self.clock() + ttl
+        tables = frozenset(tables)
+        with self._lock:
+            if version is not None and version != (
+                    self._versions[ALL_TABLES],
+                    sum(self._versions[table] for table in tables)):
+                return value
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = _Entry(value, expires, size, tables)
+            self._bytes += size
+            for table in tables:
+                self._by_table[table].add(key)
+            while (len(self._entries) > self.max_entries
+                   or self._bytes > self.max_bytes):
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+                self.evictions += 1
+        return value
+
+    def _remove(self, key):
+        entry = self._entries.pop(key)
+        self._bytes -= entry.size
+        for table in entry.tables:
+            keys = self._by_table[table]
+            keys.discard(key)
+            if not keys:
+                del self._by_table[table]
+
+    def invalidate_tables(self, tables):
+        """
+        Drop the entries depending on any of tables (all entries for
+        ALL_TABLES); return how many were dropped.
+        """
+        with self._lock:
+            if ALL_TABLES in tables:
+                self._versions[ALL_TABLES] += 1
+                keys = list(self._entries)
+            else:
+                keys = set()
+                for table in tables:
+                    self._versions[table] += 1
+                    keys.update(self._by_table.get(table, ()))
+            for key in keys:
+                self._remove(key)
+            self.invalidations += len(keys)
+            return len(keys)
+
+    def invalidate(self, key):
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._by_table.clear()
+            self._bytes = 0
+
+    def __contains__(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            return entry is not None and (entry.expires is None
+                                          or entry.expires > self.clock())
+
+    def __len__(self):
+        return len(self._entries)
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.stale_hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "hits": self.hits,
+                "stale_hits": self.stale_hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else None,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "invalidations": self.invalidations,
+            }
+
+
+def invalidate_tables(tables):
+    """Drop the entries depending on tables from every ResultCache."""
+    tables = frozenset(tables)
+    if not tables:
+        return 0
+    with _caches_lock:
+        caches = list(_caches)
+    return sum(cache.invalidate_tables(tables) for cache in caches)
+
+
+class WriteTracker:
+    """The tables written on one connection since its last commit."""
+
+    def __init__(self):
+        self.tables = set()
+        self._depth = 0
+
+    def trace(self, statement):
+        self.tables.update(tables_written(statement))
+
+    def committed(self):
+        """Call after commit: invalidate cached reads of what was written."""
+        tables, self.tables = self.tables, set()
+        return invalidate_tables(tables)
+
+    def rolled_back(self):
+        self.tables = set()
+
+
+_trackers = {}
+_trackers_lock = threading.Lock()
+
+
+@contextlib.contextmanager
+def track_writes(conn):
+    """
+    Record the tables written through an sqlite3 connection, using its
+    trace callback (which replaces any other one while this is active).
+
+    Nested uses on one connection share a tracker, matching the single
+    transaction they share: a commit anywhere invalidates everything
+    written so far, and a rollback forgets it.
+    """
+    with _trackers_lock:
+        tracker = _trackers.get(id(conn))
+        if tracker is None:
+            tracker = _trackers[id(conn)] = WriteTracker()
+            conn.set_trace_callback(tracker.trace)
+        tracker._depth += 1
+    try:
+        yield tracker
+    finally:
+        with _trackers_lock:
+            tracker._depth -= 1
+            if not tracker._depth:
+                del _trackers[id(conn)]
+                conn.set_trace_callback(None)
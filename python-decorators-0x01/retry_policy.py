@@ -0,0 +1,124 @@
+"""
+Backoff, retry budgets and retry metrics for retry_on_failure.
+
+* backoff() is "full jitter" exponential backoff: attempt n sleeps a
+  uniformly random time in [0, min(cap, base * 2 ** n)], so clients that
+  failed together don't all retry together.
+* is_transient() is the default classifier: only lock and busy errors are
+  worth retrying; constraint violations and SQL errors fail the same way
+  every time.
+* RetryBudget is a token bucket shared by the whole process. Every call
+  adds ratio tokens and every retry spends one, so retries add at most
+  about ratio extra load once the initial burst is spent, however many
+  callers are failing at once.
+* RetryStats counts calls, retries and why retrying stopped.
+
+    budget = RetryBudget(ratio=0.2, burst=10)
+    if is_transient(error) and budget.withdraw():
+        time.sleep(backoff(attempt, base=0.05, cap=2.0))
+"""
+
+import random
+import sqlite3
+import threading
+
+TRANSIENT_MESSAGES = ("database is locked", "database table is locked",
+                      "database is busy")
+
+
+def is_transient(error):
+    """True for SQLite errors caused by another connection holding a lock."""
+    if not isinstance(error, sqlite3.OperationalError):
+        return False
+    message = str(error).lower()
+    return any(text in message for text in TRANSIENT_MESSAGES)
+
+
+def classifier(retryable):
+    """
+    Turn retryable into a predicate on exceptions: None means
+    is_transient, an exception class or tuple of them means isinstance,
+    and a callable is used as is.
+    """
+    if retryable is None:
+        return is_transient
+    if isinstance(retryable, tuple) or (isinstance(retryable, type)
+                                        and issubclass(retryable,
+                                                       BaseException)):
+        return lambda error: isinstance(error, retryable)
+    return retryable
+
+
+def backoff(attempt, base, cap, rng=random):
+    """Seconds to wait before retry number attempt (0 for the first)."""
+    return rng.uniform(0, min(cap, base * 2 ** attempt))
+
+
+class RetryBudget:
+    """
+    Token bucket limiting retries to about ratio per call, with up to
+    burst retries banked for a quiet process's first failures.
+    """
+
+    def __init__(self, ratio=0.2, burst=10.0):
+        if ratio < 0 or burst < 1:
+            raise ValueError("ratio must be >= 0 and burst >= 1")
+        self.ratio = ratio
+        self.burst = burst
+        self._tokens = burst
+        self._lock = threading.Lock()
+
+    def deposit(self):
+        """Credit one call."""
+        with self._lock:
+            self._tokens = min(self.burst, self._tokens + self.ratio)
+
+    def withdraw(self):
+        """Spend a token for one retry; False if the budget is exhausted."""
+        with self._lock:
+            if self._tokens < 1:
+                return False
+            self._tokens -= 1
+            return True
+
+    @property
+    def tokens(self):
+        return self._tokens
+
+
+class RetryStats:
+    """Thread-safe retry counters."""
+
+    FIELDS = ("calls", "retries", "recovered", "exhausted", "over_budget",
+              "past_deadline", "not_retryable")
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counts = dict.fromkeys(self.FIELDS, 0)
+
+    def count(self, name):
+        with self._lock:
+            self._counts[name] += 1
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self._counts)
+
+    def reset(self):
+        with self._lock:
+            self._counts = dict.fromkeys(self.FIELDS, 0)
+
+
+BUDGET = RetryBudget()
+STATS = RetryStats()
+
+
+def stats():
+    """
+    Counters of every retry_on_failure call in the process:
+
+    calls, retries, recovered (succeeded after retrying), and the reason
+    for each failure that was raised: exhausted (out of attempts),
+    over_budget, past_deadline or not_retryable.
+    """
+    return STATS.snapshot()
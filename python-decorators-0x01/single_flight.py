@@ -0,0 +1,153 @@
+"""
+Single-flight call coalescing, for threads and for asyncio.
+
+When a hot cache entry expires, every caller that misses at the same time
+would run the same query. With a SingleFlight, the first caller for a key
+runs the function and the others wait for its result (or its exception)
+instead:
+
+    flights = SingleFlight()
+    rows = flights.do(key, lambda: run_query(conn, query))
+
+AsyncSingleFlight does the same for coroutines on an event loop:
+
+    rows = await async_flights.do(key, lambda: run_query(conn, query))
+
+Both also have spawn(), which starts the call in the background unless one
+is already running for the key; cache_query uses it to refresh a stale
+entry once while callers keep getting the stale value.
+"""
+
+import asyncio
+import threading
+
+
+class _Call:
+    __slots__ = ("done", "value", "error")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = None
+        self.error = None
+
+
+class SingleFlight:
+    """Coalesces concurrent calls for the same key across threads."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+        self.calls = self.coalesced = 0
+
+    def in_flight(self, key):
+        with self._lock:
+            return key in self._calls
+
+    def do(self, key, function):
+        """
+        Return function() for the first caller of key; callers arriving
+        while it runs block and get the same value or exception.
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            if call is None:
+                call = self._register(key)
+                leader = True
+            else:
+                self.coalesced += 1
+                leader = False
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.value
+        return self._run(key, call, function)
+
+    def _register(self, key):
+        # Called with self._lock held.
+        call = self._calls[key] = _Call()
+        self.calls += 1
+        return call
+
+    def _run(self, key, call, function):
+        try:
+            call.value = function()
+        except BaseException as error:
+            call.error = error
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.value
+
+    def spawn(self, key, function):
+        """
+        Run do(key, function) in a daemon thread unless a call for key is
+        already running; return the thread, or None. Errors are dropped:
+        the caller has moved on.
+        """
+        with self._lock:
+            if key in self._calls:
+                return None
+            # Registered before the thread starts, so a second spawn (or a
+            # do()) for key joins this call instead of starting another.
+            call = self._register(key)
+
+        def run():
+            try:
+                self._run(key, call, function)
+            except Exception:
+                pass
+
+        thread = threading.Thread(target=run, daemon=True,
+                                  name=f"single-flight {key!r:.40}")
+        thread.start()
+        return thread
+
+
+class AsyncSingleFlight:
+    """
+    Coalesces concurrent awaits for the same key on one event loop.
+
+    The shared call runs as its own task, so a waiter being cancelled
+    does not cancel it for the others.
+    """
+
+    def __init__(self):
+        self._tasks = {}
+        self.calls = self.coalesced = 0
+
+    def _start(self, slot, coroutine_function):
+        task = asyncio.ensure_future(coroutine_function())
+        self._tasks[slot] = task
+        self.calls += 1
+
+        def finished(task):
+            if self._tasks.get(slot) is task:
+                del self._tasks[slot]
+            if not task.cancelled():
+                # Mark the exception retrieved; awaiters re-raise it.
+                task.exception()
+        task.add_done_callback(finished)
+        return task
+
+    def in_flight(self, key):
+        return (asyncio.get_running_loop(), key) in self._tasks
+
+    async def do(self, key, coroutine_function):
+        """Await coroutine_function() once for all concurrent callers."""
+        slot = (asyncio.get_running_loop(), key)
+        task = self._tasks.get(slot)
+        if task is None:
+            task = self._start(slot, coroutine_function)
+        else:
+            self.coalesced += 1
+        return await asyncio.shield(task)
+
+    def spawn(self, key, coroutine_function):
+        """Start the call as a task unless one is running; return it."""
+        slot = (asyncio.get_running_loop(), key)
+        if slot in self._tasks:
+            return None
+        return self._start(slot, coroutine_function)
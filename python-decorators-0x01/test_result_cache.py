@@ -0,0 +1,178 @@
+#!/usr/bin/env python3
+
+import os
+import sqlite3
+import sys
+import tempfile
+import unittest
+from contextlib import redirect_stdout
+from io import StringIO
+from unittest import TestCase
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+if HERE not in sys.path:
+  sys.path.insert(0, HERE)
+
+result_cache = __import__('result_cache')
+
+
+class FakeClock:
+  """A clock the tests move by hand"""
+
+  def __init__(self):
+    self.now = 0.0
+
+  def __call__(self):
+    return self.now
+
+
+class TestTablesRead(TestCase):
+  """tables_read() finds every table a SELECT depends on"""
+
+  def test_reads(self):
+    """FROM and JOIN clauses, aliases, lists and subqueries"""
+    cases = {
+      "SELECT * FROM users": {"users"},
+      "SELECT * FROM users JOIN orders ON users.id = orders.user_id":
+        {"users", "orders"},
+      "SELECT * FROM users u LEFT JOIN orders o ON u.id = o.user_id":
+        {"users", "orders"},
+      "SELECT * FROM users INNER JOIN orders USING (id)":
+        {"users", "orders"},
+      "SELECT * FROM users NATURAL JOIN orders": {"users", "orders"},
+      "SELECT * FROM users AS u CROSS JOIN orders": {"users", "orders"},
+      "SELECT * FROM users, orders AS o, main.items WHERE 1":
+        {"users", "orders", "items"},
+      "SELECT * FROM users WHERE id IN (SELECT user_id FROM orders)":
+        {"users", "orders"},
+      'select * from "Order Items" join Users on 1': {"order items", "users"},
+      "SELECT * FROM users WHERE name = 'x FROM secret'": {"users"},
+      "SELECT 1": set(),
+    }
+    for query, tables in cases.items():
+      with self.subTest(query=query):
+        self.assertEqual(result_cache.tables_read(query), tables)
+
+
+class TestTablesWritten(TestCase):
+  """tables_written() finds what a statement modifies"""
+
+  def test_writes(self):
+    """DML names its table; reads write nothing; the rest writes all"""
+    cases = {
+      "INSERT INTO users (name) VALUES (?)": {"users"},
+      "INSERT OR REPLACE INTO users VALUES (1)": {"users"},
+      "UPDATE users SET email = ? WHERE id = ?": {"users"},
+      "DELETE FROM orders WHERE id = 1": {"orders"},
+      "DROP TABLE IF EXISTS orders": {"orders"},
+      "SELECT * FROM users": set(),
+      "BEGIN": set(),
+      "COMMIT": set(),
+      "CREATE TABLE t (x)": {result_cache.ALL_TABLES},
+    }
+    for query, tables in cases.items():
+      with self.subTest(query=query):
+        self.assertEqual(result_cache.tables_written(query), tables)
+
+
+class TestResultCache(TestCase):
+  """LRU, TTL and table invalidation of ResultCache"""
+
+  def setUp(self):
+    self.clock = FakeClock()
+    self.cache = result_cache.ResultCache(max_entries=2, ttl=10,
+                                          clock=self.clock)
+
+  def test_lru_eviction(self):
+    """The least recently used entry goes first"""
+    self.cache.set("a", 1)
+    self.cache.set("b", 2)
+    self.cache.get("a")
+    self.cache.set("c", 3)
+    self.assertIn("a", self.cache)
+    self.assertNotIn("b", self.cache)
+    self.assertEqual(self.cache.stats()["evictions"], 1)
+
+  def test_ttl(self):
+    """Entries expire ttl seconds after they were stored"""
+    self.cache.set("a", 1)
+    self.clock.now = 9.9
+    self.assertEqual(self.cache.get("a"), 1)
+    self.clock.now = 10
+    self.assertIs(self.cache.get("a"), result_cache.MISSING)
+
+  def test_invalidate_tables(self):
+    """Only entries depending on the written tables are dropped"""
+    self.cache.set("users", 1, tables={"users", "orders"})
+    self.cache.set("items", 2, tables={"items"})
+    self.assertEqual(self.cache.invalidate_tables({"orders"}), 1)
+    self.assertNotIn("users", self.cache)
+    self.assertIn("items", self.cache)
+
+  def test_stale_version_not_cached(self):
+    """A result read before an invalidation is not stored after it"""
+    version = self.cache.version({"users"})
+    self.cache.invalidate_tables({"users"})
+    self.cache.set("a", 1, tables={"users"}, version=version)
+    self.assertNotIn("a", self.cache)
+
+
+class TestInvalidationOnCommit(TestCase):
+  """Committed writes drop the cached reads of the tables they touch"""
+
+  @classmethod
+  def setUpClass(cls):
+    """Import 2-transactional in a temporary directory (it seeds users.db)"""
+    cls.directory = tempfile.TemporaryDirectory()
+    cls.cwd = os.getcwd()
+    os.chdir(cls.directory.name)
+    with redirect_stdout(StringIO()):
+      cls.transactions = __import__('2-transactional')
+    cls.path = os.path.join(cls.directory.name, "users.db")
+    conn = sqlite3.connect(cls.path)
+    conn.execute("CREATE TABLE orders (id INTEGER PRIMARY KEY, user_id)")
+    conn.commit()
+    conn.close()
+
+  @classmethod
+  def tearDownClass(cls):
+    # Pools are keyed by the relative DB_FILE; don't leave this one behind.
+    __import__('db_pool').close_all()
+    os.chdir(cls.cwd)
+    cls.directory.cleanup()
+
+  def setUp(self):
+    self.conn = sqlite3.connect(self.path)
+    self.cache = result_cache.ResultCache()
+    self.join = ("SELECT * FROM users JOIN orders "
+                 "ON users.id = orders.user_id")
+    self.cache.set("join", [], tables=result_cache.tables_read(self.join))
+    self.cache.set("users", [], tables={"users"})
+
+  def tearDown(self):
+    self.conn.close()
+
+  def run_quietly(self, func):
+    with redirect_stdout(StringIO()):
+      return self.transactions.transactional(func)(self.conn)
+
+  def test_commit_invalidates_joined_table(self):
+    """A write to the joined table drops the join's entry"""
+    self.run_quietly(lambda conn: conn.execute(
+        "INSERT INTO orders (user_id) VALUES (1)"))
+    self.assertNotIn("join", self.cache)
+    self.assertIn("users", self.cache)
+
+  def test_rollback_keeps_entries(self):
+    """A rolled back write invalidates nothing"""
+    def fail(conn):
+      conn.execute("INSERT INTO orders (user_id) VALUES (1)")
+      raise ValueError("abort")
+    with self.assertRaises(ValueError):
+      self.run_quietly(fail)
+    self.assertIn("join", self.cache)
+    self.assertIn("users", self.cache)
+
+
+if __name__ == "__main__":
+  unittest.main()
@@ -0,0 +1,148 @@
+#!/usr/bin/env python3
+
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import unittest
+from contextlib import redirect_stdout
+from io import StringIO
+from unittest import TestCase
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+if HERE not in sys.path:
+  sys.path.insert(0, HERE)
+
+retry_policy = __import__('retry_policy')
+
+LOCKED = sqlite3.OperationalError("database is locked")
+
+
+class TestPolicy(TestCase):
+  """Classifier, backoff and budget of retry_policy"""
+
+  def test_is_transient(self):
+    """Only lock and busy errors are retried by default"""
+    self.assertTrue(retry_policy.is_transient(LOCKED))
+    self.assertTrue(retry_policy.is_transient(
+        sqlite3.OperationalError("database table is locked: users")))
+    self.assertFalse(retry_policy.is_transient(
+        sqlite3.OperationalError("no such table: users")))
+    self.assertFalse(retry_policy.is_transient(
+        sqlite3.IntegrityError("UNIQUE constraint failed")))
+
+  def test_classifier(self):
+    """None, exception classes and callables all become predicates"""
+    self.assertIs(retry_policy.classifier(None), retry_policy.is_transient)
+    by_type = retry_policy.classifier((KeyError, ValueError))
+    self.assertTrue(by_type(ValueError()))
+    self.assertFalse(by_type(TypeError()))
+    self.assertTrue(retry_policy.classifier(lambda error: True)(TypeError()))
+
+  def test_backoff_bounds(self):
+    """Full jitter stays within [0, min(cap, base * 2 ** attempt)]"""
+    rng = random.Random(1)
+    for attempt in range(10):
+      with self.subTest(attempt=attempt):
+        waits = [retry_policy.backoff(attempt, 0.1, 2.0, rng)
+                 for _ in range(200)]
+        self.assertGreaterEqual(min(waits), 0)
+        self.assertLessEqual(max(waits), min(2.0, 0.1 * 2 ** attempt))
+
+  def test_budget(self):
+    """The burst is spent first, then retries earn ratio per call"""
+    budget = retry_policy.RetryBudget(ratio=0.5, burst=2)
+    self.assertTrue(budget.withdraw())
+    self.assertTrue(budget.withdraw())
+    self.assertFalse(budget.withdraw())
+    budget.deposit()
+    self.assertFalse(budget.withdraw())
+    budget.deposit()
+    self.assertTrue(budget.withdraw())
+
+
+class TestRetryOnFailure(TestCase):
+  """retry_on_failure's attempts, deadline, budget and counters"""
+
+  @classmethod
+  def setUpClass(cls):
+    """Import 3-retry_on_failure in a temporary directory (it seeds users.db)"""
+    cls.directory = tempfile.TemporaryDirectory()
+    cls.cwd = os.getcwd()
+    os.chdir(cls.directory.name)
+    with redirect_stdout(StringIO()):
+      cls.module = __import__('3-retry_on_failure')
+
+  @classmethod
+  def tearDownClass(cls):
+    # Pools are keyed by the relative DB_FILE; don't leave this one behind.
+    __import__('db_pool').close_all()
+    os.chdir(cls.cwd)
+    cls.directory.cleanup()
+
+  def setUp(self):
+    self.now = 0.0
+    self.sleeps = []
+    self.stats = retry_policy.RetryStats()
+
+  def sleep(self, seconds):
+    self.sleeps.append(seconds)
+    self.now += seconds
+
+  def call(self, failures, error=LOCKED, **options):
+    """Run a function failing failures times; return (result, calls)"""
+    calls = []
+
+    def flaky():
+      calls.append(1)
+      if len(calls) <= failures:
+        raise error
+      return "rows"
+    options.setdefault("budget", retry_policy.RetryBudget())
+    decorated = self.module.retry_on_failure(
+        stats=self.stats, sleep=self.sleep, clock=lambda: self.now,
+        **options)(flaky)
+    with redirect_stdout(StringIO()):
+      try:
+        return decorated(), len(calls)
+      except Exception as error:
+        return error, len(calls)
+
+  def test_recovers(self):
+    """Transient errors are retried until the call succeeds"""
+    self.assertEqual(self.call(2, retries=3), ("rows", 3))
+    self.assertEqual(len(self.sleeps), 2)
+    counts = self.stats.snapshot()
+    self.assertEqual((counts["retries"], counts["recovered"]), (2, 1))
+
+  def test_exhausted(self):
+    """The last error is raised after retries attempts"""
+    self.assertEqual(self.call(5, retries=3), (LOCKED, 3))
+    self.assertEqual(self.stats.snapshot()["exhausted"], 1)
+
+  def test_not_retryable(self):
+    """Errors the classifier rejects are raised at once"""
+    error = sqlite3.OperationalError("no such table: users")
+    self.assertEqual(self.call(1, error=error), (error, 1))
+    self.assertEqual(self.stats.snapshot()["not_retryable"], 1)
+
+  def test_deadline(self):
+    """No retry starts past the deadline"""
+    result, calls = self.call(5, retries=10, delay=1, max_delay=1,
+                              deadline=0.5)
+    self.assertIs(result, LOCKED)
+    self.assertEqual(calls, 1 + len(self.sleeps))
+    self.assertLessEqual(sum(self.sleeps), 0.5)
+    self.assertEqual(self.stats.snapshot()["past_deadline"], 1)
+
+  def test_budget_limits_retries(self):
+    """An empty budget stops retrying"""
+    budget = retry_policy.RetryBudget(ratio=0, burst=1)
+    budget.withdraw()
+    self.assertEqual(self.call(1, budget=budget), (LOCKED, 1))
+    self.assertEqual(self.stats.snapshot()["over_budget"], 1)
+
+
+if __name__ == "__main__":
+  unittest.main()
@@ -0,0 +1,151 @@
+#!/usr/bin/env python3
+
+import asyncio
+import contextlib
+import os
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+import unittest
+from contextlib import redirect_stdout
+from io import StringIO
+from unittest import TestCase
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+if HERE not in sys.path:
+  sys.path.insert(0, HERE)
+
+result_cache = __import__('result_cache')
+single_flight = __import__('single_flight')
+
+
+class TestSingleFlight(TestCase):
+  """Concurrent calls for one key run once"""
+
+  def test_do_coalesces(self):
+    """Callers arriving while the call runs share its result"""
+    flights = single_flight.SingleFlight()
+    release = threading.Event()
+    runs = []
+
+    def slow():
+      runs.append(1)
+      release.wait(5)
+      return "rows"
+
+    results = []
+    threads = [threading.Thread(
+        target=lambda: results.append(flights.do("key", slow)))
+               for _ in range(5)]
+    for thread in threads:
+      thread.start()
+    while flights.calls + flights.coalesced < 5:
+      time.sleep(0.001)
+    release.set()
+    for thread in threads:
+      thread.join(5)
+    self.assertEqual(results, ["rows"] * 5)
+    self.assertEqual(len(runs), 1)
+
+  def test_spawn_once(self):
+    """Spawning again while a call is registered starts nothing"""
+    flights = single_flight.SingleFlight()
+    release = threading.Event()
+    first = flights.spawn("key", lambda: release.wait(5))
+    self.assertIsNotNone(first)
+    self.assertIsNone(flights.spawn("key", lambda: None))
+    release.set()
+    first.join(5)
+    self.assertEqual(flights.calls, 1)
+    self.assertFalse(flights.in_flight("key"))
+
+  def test_async_follower_survives_leader_cancel(self):
+    """Cancelling the first awaiter does not cancel the shared call"""
+    flights = single_flight.AsyncSingleFlight()
+
+    async def fetch():
+      await asyncio.sleep(0.05)
+      return "rows"
+
+    async def run():
+      leader = asyncio.ensure_future(flights.do("key", fetch))
+      await asyncio.sleep(0)
+      follower = asyncio.ensure_future(flights.do("key", fetch))
+      await asyncio.sleep(0)
+      leader.cancel()
+      return await follower
+    self.assertEqual(asyncio.run(run()), "rows")
+    self.assertEqual(flights.calls, 1)
+
+
+class TestCacheQueryConnections(TestCase):
+  """cache_query runs shared queries on connections it owns"""
+
+  @classmethod
+  def setUpClass(cls):
+    """Import 4-cache_query in a temporary directory (it seeds users.db)"""
+    cls.directory = tempfile.TemporaryDirectory()
+    cls.cwd = os.getcwd()
+    os.chdir(cls.directory.name)
+    with redirect_stdout(StringIO()):
+      cls.module = __import__('4-cache_query')
+    cls.path = os.path.join(cls.directory.name, cls.module.DB_FILE)
+
+  @classmethod
+  def tearDownClass(cls):
+    # Pools are keyed by the relative DB_FILE; don't leave this one behind.
+    __import__('db_pool').close_all()
+    os.chdir(cls.cwd)
+    cls.directory.cleanup()
+
+  def setUp(self):
+    self.cache = result_cache.ResultCache()
+    self.used = []
+
+    @contextlib.contextmanager
+    def owned():
+      conn = sqlite3.connect(self.path)
+      try:
+        yield conn
+      finally:
+        conn.close()
+
+    def fetch(conn, query):
+      self.used.append(conn)
+      return conn.execute(query).fetchall()
+    self.fetch = self.module.cache_query(cache=self.cache,
+                                         revalidate=owned)(fetch)
+
+  def run_quietly(self, conn, query):
+    with redirect_stdout(StringIO()):
+      return self.fetch(conn, query)
+
+  def test_miss_runs_on_owned_connection(self):
+    """A miss queries a connection from revalidate(), not the caller's"""
+    caller = sqlite3.connect(self.path)
+    try:
+      rows = self.run_quietly(caller, "SELECT * FROM users")
+    finally:
+      caller.close()
+    self.assertEqual(len(rows), 3)
+    self.assertIsNot(self.used[0], caller)
+
+  def test_open_transaction_bypasses_cache(self):
+    """Uncommitted rows a caller can see are neither cached nor shared"""
+    caller = sqlite3.connect(self.path)
+    try:
+      caller.execute("INSERT INTO users (name, email) VALUES ('X', 'x@x')")
+      mine = self.run_quietly(caller, "SELECT * FROM users")
+      caller.rollback()
+      shared = self.run_quietly(caller, "SELECT * FROM users")
+    finally:
+      caller.close()
+    self.assertEqual(len(mine), 4)
+    self.assertEqual(len(shared), 3)
+    self.assertEqual(len(self.cache), 1)
+
+
+if __name__ == "__main__":
+  unittest.main()
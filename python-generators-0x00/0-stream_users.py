@@ -1,26 +1,26 @@
+"""
+Stream rows from the users table one by one using a generator.
 
-import mysql.connector
+A pooled connection is checked out lazily on the first iteration and rows
+are read through an unbuffered server-side cursor, so client memory stays
+flat regardless of the size of the table.
+"""
 
+db = __import__('db')
 
-try:
-    connection = mysql.connector.connect(
-        host="localhost",
-        user="root",
-        password="password",
-        database="mydatabase"
-    )
-    cursor = connection.cursor()
-except mysql.connector.Error as err:
-    print(f"Error: {err}")
-    exit(1)
 
 def stream_users():
-  try :
-    cursor.execute("SELECT * FROM users")
-    for row in cursor:
-        yield row
-  except mysql.connector.Error as err:
-      print(f"Error: {err}")
-  finally:
-    cursor.close()
-    connection.close()
+    connection = None
+    cursor = None
+    finished = False
+    try:
+        connection = db.acquire()
+        cursor = db.server_side_cursor(connection)
+        cursor.execute("SELECT * FROM users")
+        for row in cursor:
+            yield row
+        finished = True
+    except db.errors() as err:
+        print(f"Error: {err}")
+    finally:
+        db.release(cursor, connection, abandoned=not finished)
@@ -2,35 +2,148 @@
 Write a function stream_users_in_batches(batch_size) that fetches rows in batches
 
 Write a function batch_processing() that processes each batch to filter users over the age of25`
+
+Batches are lists of row tuples by default. With output="columns" each batch
+is instead a dict mapping column names to NumPy arrays, so filters such as the
+age check run as vectorized masks rather than per-row Python comparisons.
+output="records" yields lists of __slots__ records and output="batch" yields
+compact column-packed UserBatch objects (see user_batch).
+
+where= takes a predicates expression such as col("age") > 25. Whatever part of
+it can be expressed in SQL is sent to the server as a parameterized WHERE
+clause, so non-matching rows are never transferred; the rest is applied to
+each batch in-process: row by row, or as a NumPy mask over the column arrays
+with output="columns".
+
+batch_size is fixed by default. Passing memory_budget (bytes per batch) and/or
+target_latency (seconds per fetch) lets an AdaptiveBatchSizer grow or shrink
+fetchmany() sizes from measured row sizes and fetch times; pass a BatchStats
+as stats= to inspect the sizes it chose.
+
+prefetch=N fetches up to N batches ahead on a background thread, overlapping
+database round trips with the caller's processing.
+
+Database errors are printed and end the stream, like stream_users(). Callers
+that must not mistake a failed scan for a short one (aggregates, exports)
+pass raise_errors=True to have them raised instead.
 """
 
-import mysql.connector
+import time
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+db = __import__('db')
+predicates = __import__('predicates')
+prefetcher = __import__('prefetch')
+batch_sizing = __import__('batch_sizing')
+user_batch = __import__('user_batch')
+col = predicates.col
+
+OUTPUTS = ("rows", "columns", "records", "batch")
+
+
+def _to_column(values):
+    """Build a NumPy array for one column, preferring a numeric dtype."""
+    column = np.array(values)
+    if column.dtype == object:
+        try:
+            numeric = column.astype(np.float64)
+        except (TypeError, ValueError):
+            return column
+        if np.all(np.mod(numeric, 1) == 0):
+            return numeric.astype(np.int64)
+        return numeric
+    return column
+
+
+def _to_columns(names, rows):
+    return {name: _to_column(values) for name, values in zip(names, zip(*rows))}
+
+
+def stream_users_in_batches(batch_size, output="rows", where=None,
+                            pushdown=True, order_by=None, prefetch=0,
+                            memory_budget=None, target_latency=None,
+                            stats=None, raise_errors=False):
+    sizer = batch_sizing.AdaptiveBatchSizer(
+        initial=batch_size, memory_budget=memory_budget,
+        target_latency=target_latency, stats=stats)
+    batches = _fetch_batches(sizer, output, where, pushdown, order_by,
+                             raise_errors)
+    if prefetch:
+        batches = prefetcher.prefetch(batches, depth=prefetch)
+    yield from batches
+
+
+def _fetch_batches(sizer, output, where, pushdown, order_by,
+                   raise_errors=False):
+    if output not in OUTPUTS:
+        raise ValueError(f"output must be one of {OUTPUTS}, got {output!r}")
+    if output == "columns" and np is None:
+        raise RuntimeError('output="columns" requires numpy to be installed')
 
+    if pushdown:
+        pushed, residual = predicates.split(where)
+    else:
+        pushed, residual = None, where
 
-def stream_users_in_batches(batch_size):
-    connection = mysql.connector.connect(
-      host="localhost",
-      user="root",
-      password="password",
-      database="mydatabase"
-    )
-    cursor = connection.cursor()
+    connection = db.acquire()
+    cursor = None
+    finished = False
 
     try:
-        cursor.execute("SELECT * FROM users")
+        cursor = db.server_side_cursor(connection)
+        query, params = "SELECT * FROM users", []
+        if pushed is not None:
+            clause, params = pushed.to_sql(db.placeholder(connection))
+            query += " WHERE " + clause
+        if order_by:
+            query += " ORDER BY " + ", ".join(col(c).name for c in order_by)
+        cursor.execute(query, params)
+        names = [d[0] for d in cursor.description]
+        keep = residual.bind(names) if residual is not None else None
         while True:
-            rows = cursor.fetchmany(batch_size)
+            started = time.perf_counter()
+            rows = cursor.fetchmany(sizer.next_size())
             if not rows:
                 break
-            yield rows
-    except mysql.connector.Error as err:
+            sizer.observe(rows, time.perf_counter() - started)
+            if output == "columns":
+                columns = _to_columns(names, rows)
+                if residual is not None:
+                    selected = residual.mask(columns)
+                    if not selected.any():
+                        continue
+                    columns = {name: values[selected]
+                               for name, values in columns.items()}
+                yield columns
+                continue
+            if keep is not None:
+                rows = [row for row in rows if keep(row)]
+                if not rows:
+                    continue
+            if output == "records":
+                record = user_batch.record_type(names)
+                yield [record.from_row(row) for row in rows]
+            elif output == "batch":
+                yield user_batch.UserBatch(names, rows)
+            else:
+                yield rows
+        finished = True
+    except db.errors() as err:
+        if raise_errors:
+            raise
         print(f"Error: {err}")
     finally:
-        cursor.close()
-        connection.close()
+        db.release(cursor, connection, abandoned=not finished)
 
 
-def batch_processing():
-    for batch in stream_users_in_batches(100):
-        filtered_batch = [user for user in batch if user[2] > 25]
+def batch_processing(output="rows", batch_size=100, memory_budget=None,
+                     target_latency=None, stats=None):
+    for filtered_batch in stream_users_in_batches(
+            batch_size, output=output, where=col("age") > 25,
+            memory_budget=memory_budget, target_latency=target_latency,
+            stats=stats):
         print(f"Processed batch: {filtered_batch}")
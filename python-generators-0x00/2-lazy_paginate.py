@@ -1,34 +1,129 @@
 """
 Implement a generator function lazypaginate(pagesize) that implements the paginate_users(page_size, offset) that will only fetch the next page when needed at an offset of 0.
+
+lazy_pagination() pages with a keyset (seek) query instead of LIMIT/OFFSET:
+each page asks for the rows that sort after the last row already seen, so the
+server never has to skip over earlier pages, and every page is read over the
+same connection.
 """
 
-import mysql.connector
+import base64
+import json
+import re
+
+db = __import__('db')
+
+_IDENTIFIER = re.compile(r"^[A-Za-z_][A-Za-z0-9_]*$")
+
 
 def paginate_users(pagesize, offset=0):
-  connection = mysql.connector.connect(
-    host="localhost",
-    user="root",
-    password="password",
-    database="users"
-  )
-  cursor = connection.cursor()
+  connection = db.acquire()
+  cursor = None
 
   try:
-    cursor.execute("SELECT * FROM users LIMIT %s OFFSET %s", (pagesize, offset))
+    marker = db.placeholder(connection)
+    cursor = connection.cursor()
+    cursor.execute(f"SELECT * FROM users LIMIT {marker} OFFSET {marker}",
+                   (pagesize, offset))
     users = cursor.fetchall()
     yield users
-  except mysql.connector.Error as err:
+  except db.errors() as err:
     print(f"Error: {err}")
   finally:
-    cursor.close()
-    connection.close()
+    db.release(cursor, connection)
+
+
+def encode_token(key):
+  """Encode the sort key of the last row of a page as an opaque token."""
+  payload = json.dumps(list(key), default=str).encode()
+  return base64.urlsafe_b64encode(payload).decode()
+
+
+def decode_token(token):
+  """Decode a continuation token produced by encode_token()."""
+  try:
+    key = json.loads(base64.urlsafe_b64decode(token.encode()))
+  except (ValueError, TypeError, AttributeError) as err:
+    raise ValueError(f"Invalid continuation token: {token!r}") from err
+  if not isinstance(key, list):
+    raise ValueError(f"Invalid continuation token: {token!r}")
+  return tuple(key)
+
+
+def _seek_condition(order_by, marker):
+  """
+  Build "rows after key" for a composite sort key, e.g. for (a, b):
+  a > ? OR (a = ? AND b > ?). The expanded form is used instead of a row
+  constructor because it is what MySQL reliably resolves to an index range.
+  """
+  clauses = []
+  for i, column in enumerate(order_by):
+    terms = [f"{prev} = {marker}" for prev in order_by[:i]]
+    terms.append(f"{column} > {marker}")
+    clauses.append("(" + " AND ".join(terms) + ")")
+  return " OR ".join(clauses)
+
+
+def _seek_params(key):
+  params = []
+  for i in range(len(key)):
+    params.extend(key[:i + 1])
+  return params
+
+
+def keyset_pages(pagesize, order_by=("user_id",), token=None, connection=None):
+  """
+  Yield (page, token) pairs, seeking past the last key of each page.
+
+  order_by must be unique across rows (end it with the primary key), since
+  rows sharing the last key of a page would otherwise be skipped. token
+  resumes after the page that produced it. When connection is given it is
+  reused and left open; otherwise one is checked out of the pool for the
+  whole scan.
+  """
+  order_by = tuple(order_by)
+  for column in order_by:
+    if not _IDENTIFIER.match(column):
+      raise ValueError(f"Invalid sort column: {column!r}")
+  # Validate the client-supplied token before checking a connection out,
+  # so a bad one cannot hold a pooled connection.
+  key = decode_token(token) if token else None
+  if key is not None and len(key) != len(order_by):
+    raise ValueError("Continuation token does not match the sort key")
+
+  own_connection = connection is None
+  if own_connection:
+    connection = db.acquire()
+  cursor = None
+  try:
+    marker = db.placeholder(connection)
+    base = "SELECT * FROM users"
+    order = " ORDER BY " + ", ".join(order_by) + f" LIMIT {marker}"
+    cursor = connection.cursor()
+    key_positions = None
+    while True:
+      if key is None:
+        cursor.execute(base + order, (pagesize,))
+      else:
+        where = " WHERE " + _seek_condition(order_by, marker)
+        cursor.execute(base + where + order, (*_seek_params(key), pagesize))
+      page = cursor.fetchall()
+      if not page:
+        break
+      if key_positions is None:
+        names = [d[0] for d in cursor.description]
+        key_positions = [names.index(c) for c in order_by]
+      key = tuple(page[-1][i] for i in key_positions)
+      yield page, encode_token(key)
+      if len(page) < pagesize:
+        break
+  finally:
+    if own_connection:
+      db.release(cursor, connection)
+    elif cursor is not None:
+      cursor.close()
 
 
 def lazy_pagination(pagesize):
-  offset = 0
-  while True:
-    users = next(paginate_users(pagesize, offset), None)
-    if users is None:
-      break
-    yield users
-    offset += pagesize
+  for page, _ in keyset_pages(pagesize):
+    yield page
@@ -1,22 +1,33 @@
 """
 Memory-efficient average age calculator using Python generators.
+
+compute_age_statistics() goes further in the same single pass: count, mean,
+variance, min/max and approximate quantiles, in state that can be merged with
+results computed elsewhere (see stream_stats).
 """
 
-import mysql.connector
+db = __import__('db')
+stream_stats = __import__('stream_stats')
+
 
 def stream_user_ages():
-  connection = mysql.connector.connect(
-    host="localhost",
-    user="root",
-    password="password",
-    database="mydatabase"
-  )
-  cursor = connection.cursor()
-  cursor.execute("SELECT age FROM users")
-  for row in cursor:
-    yield row[0]
-  cursor.close()
-  connection.close()
+  connection = db.acquire()
+  cursor = None
+  finished = False
+  try:
+    cursor = db.server_side_cursor(connection)
+    cursor.execute("SELECT age FROM users")
+    for row in cursor:
+      yield row[0]
+    finished = True
+  finally:
+    db.release(cursor, connection, abandoned=not finished)
+
+
+def compute_age_statistics(ages=None, k=200):
+  """Return a StreamStatistics over ages (defaults to stream_user_ages())."""
+  stats = stream_stats.StreamStatistics(k=k)
+  return stats.update_many(stream_user_ages() if ages is None else ages)
 
 
 def compute_average_age():
@@ -26,8 +37,6 @@ def compute_average_age():
     total_age += age
     count += 1
 
-  if count > 0:
-    print(f"Average age of users: {compute_average_age()}")
-  else:
-    avg = total_age / count if count > 0 else 0
-    return avg
+  avg = total_age / count if count > 0 else 0
+  print(f"Average age of users: {avg}")
+  return avg
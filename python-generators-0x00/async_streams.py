@@ -0,0 +1,339 @@
+"""
+asyncio versions of the user streamers.
+
+stream_users, stream_users_in_batches, lazy_pagination and stream_user_ages
+are async generators here, so they can be consumed with `async for` without
+blocking the event loop:
+
+    async for batch in stream_users_in_batches(1000, prefetch=2):
+        ...
+
+Connections come from an AsyncConnectionPool shared per event loop and per
+driver. The driver is chosen like db.py does: aiosqlite (DB_ENGINE=sqlite)
+or aiomysql, which streams through a server-side SSCursor. Other async
+drivers can be plugged in by implementing connect(), execute() and
+placeholder.
+
+Cancelling a consumer, breaking out of `async for` or calling aclose()
+closes the cursor. A MySQL connection whose result set was abandoned midway
+is closed instead of being returned to the pool; SQLite connections are
+reused. Like db.ConnectionPool, the pool rolls a connection back when it is
+returned (discarding it if that fails) and checks it is alive before
+handing it out again.
+
+Pooled connections are closed when asyncio.run() finishes, which cancels
+the pool's closer task. aiosqlite runs each connection on a non-daemon
+thread, so an idle connection left open would keep the interpreter from
+exiting. With a loop that is not shut down that way, close the pool
+explicitly with `await close_pool()` (or `async with AsyncConnectionPool()`).
+"""
+
+import asyncio
+import os
+import weakref
+
+db = __import__('db')
+lazy_paginate = __import__('2-lazy_paginate')
+col = __import__('predicates').col
+
+FETCH_SIZE = 1000
+
+
+class AiosqliteDriver:
+    placeholder = "?"
+    streams_on_connection = False
+
+    def __init__(self, path=None):
+        self.path = path or os.environ.get("DB_PATH", "users.db")
+
+    async def connect(self):
+        import aiosqlite
+
+        return await aiosqlite.connect(self.path)
+
+    async def execute(self, connection, query, params=()):
+        return await connection.execute(query, params)
+
+    async def is_alive(self, connection):
+        try:
+            await (await connection.execute("SELECT 1")).close()
+        except Exception:
+            return False
+        return True
+
+    async def reset(self, connection):
+        await connection.rollback()
+
+    async def close(self, connection):
+        await connection.close()
+
+
+class AiomysqlDriver:
+    placeholder = "%s"
+    # An unread SSCursor result set ties up the connection.
+    streams_on_connection = True
+
+    def __init__(self, **config):
+        self.config = {
+            "host": os.environ.get("DB_HOST", "localhost"),
+            "port": int(os.environ.get("DB_PORT", 3306)),
+            "user": os.environ.get("DB_USER", "root"),
+            "password": os.environ.get("DB_PASSWORD", "password"),
+            "db": os.environ.get("DB_NAME", "mydatabase"),
+        }
+        self.config.update(config)
+
+    async def connect(self):
+        import aiomysql
+
+        return await aiomysql.connect(**self.config)
+
+    async def execute(self, connection, query, params=()):
+        import aiomysql
+
+        cursor = await connection.cursor(aiomysql.SSCursor)
+        await cursor.execute(query, params)
+        return cursor
+
+    async def is_alive(self, connection):
+        try:
+            await connection.ping(reconnect=False)
+        except Exception:
+            return False
+        return True
+
+    async def reset(self, connection):
+        # Ends the read transaction, so the next user does not see the
+        # REPEATABLE READ snapshot taken by the previous one.
+        await connection.rollback()
+
+    async def close(self, connection):
+        connection.close()
+
+
+def default_driver():
+    if db.engine() == "sqlite":
+        return AiosqliteDriver()
+    return AiomysqlDriver()
+
+
+class AsyncConnectionPool:
+    """A bounded pool of connections for one event loop."""
+
+    def __init__(self, driver=None, size=4):
+        self.driver = driver or default_driver()
+        self.size = size
+        self._idle = []
+        self._slots = asyncio.Semaphore(size)
+        self._closed = False
+
+    async def acquire(self):
+        if self._closed:
+            raise RuntimeError("Connection pool is closed")
+        await self._slots.acquire()
+        try:
+            while self._idle:
+                connection = self._idle.pop()
+                if await self.driver.is_alive(connection):
+                    return connection
+                await self._close_quietly(connection)
+            return await self.driver.connect()
+        except BaseException:
+            self._slots.release()
+            raise
+
+    async def _close_quietly(self, connection):
+        try:
+            await self.driver.close(connection)
+        except Exception:
+            pass
+
+    async def release(self, connection, discard=False):
+        try:
+            if not (discard or self._closed):
+                try:
+                    await self.driver.reset(connection)
+                except Exception:
+                    discard = True
+            if discard or self._closed:
+                await self.driver.close(connection)
+            else:
+                self._idle.append(connection)
+        finally:
+            self._slots.release()
+
+    async def close(self):
+        """Close idle connections; checked-out ones close on release."""
+        self._closed = True
+        while self._idle:
+            await self.driver.close(self._idle.pop())
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+
+_pools = weakref.WeakKeyDictionary()
+
+
+async def _close_at_shutdown(pool):
+    try:
+        await asyncio.get_running_loop().create_future()
+    finally:
+        await pool.close()
+
+
+def get_pool(size=4):
+    """Return the shared pool for the running event loop."""
+    loop = asyncio.get_running_loop()
+    pool = _pools.get(loop)
+    if pool is None or pool._closed:
+        pool = _pools[loop] = AsyncConnectionPool(size=size)
+        # asyncio.run() cancels outstanding tasks before closing the loop;
+        # this one closes the pool when that happens.
+        pool._closer = loop.create_task(_close_at_shutdown(pool))
+    return pool
+
+
+async def close_pool():
+    """Close the running loop's shared pool, if it has one."""
+    pool = _pools.pop(asyncio.get_running_loop(), None)
+    if pool is not None:
+        pool._closer.cancel()
+        await pool.close()
+
+
+async def _query_batches(query, params=(), batch_size=FETCH_SIZE, pool=None):
+    """Run query on a pooled connection and yield fetchmany() batches."""
+    pool = pool or get_pool()
+    connection = await pool.acquire()
+    cursor = None
+    finished = False
+    try:
+        cursor = await pool.driver.execute(connection, query, params)
+        while True:
+            rows = await cursor.fetchmany(batch_size)
+            if not rows:
+                break
+            yield rows
+        finished = True
+    finally:
+        try:
+            if cursor is not None:
+                await cursor.close()
+        finally:
+            await pool.release(connection, discard=not finished and
+                               pool.driver.streams_on_connection)
+
+
+async def prefetch_ahead(source, depth=2):
+    """Yield from an async iterator while a task fetches up to depth ahead."""
+    if depth < 1:
+        raise ValueError("depth must be at least 1")
+    buffer = asyncio.Queue(maxsize=depth)
+    done = object()
+
+    async def produce():
+        try:
+            async for item in source:
+                await buffer.put((item, None))
+            await buffer.put((done, None))
+        except asyncio.CancelledError:
+            raise
+        except BaseException as error:
+            await buffer.put((done, error))
+        finally:
+            await source.aclose()
+
+    task = asyncio.ensure_future(produce())
+    try:
+        while True:
+            item, error = await buffer.get()
+            if error is not None:
+                raise error
+            if item is done:
+                return
+            yield item
+    finally:
+        task.cancel()
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+
+
+async def stream_users(pool=None):
+    batches = _query_batches("SELECT * FROM users", pool=pool)
+    try:
+        async for rows in batches:
+            for row in rows:
+                yield row
+    finally:
+        # Leaving `async for` does not close an async generator; close it
+        # here so the cursor is released now rather than by the GC.
+        await batches.aclose()
+
+
+async def stream_users_in_batches(batch_size, pool=None, prefetch=0):
+    batches = _query_batches("SELECT * FROM users", batch_size=batch_size,
+                             pool=pool)
+    if prefetch:
+        batches = prefetch_ahead(batches, prefetch)
+    try:
+        async for rows in batches:
+            yield rows
+    finally:
+        await batches.aclose()
+
+
+async def lazy_pagination(pagesize, order_by=("user_id",), pool=None):
+    """Keyset pagination, one query per page on a pooled connection."""
+    pool = pool or get_pool()
+    marker = pool.driver.placeholder
+    order_by = [col(column).name for column in order_by]
+    order = " ORDER BY " + ", ".join(order_by) + f" LIMIT {marker}"
+    key = None
+    key_positions = None
+    connection = await pool.acquire()
+    in_query = False
+    try:
+        while True:
+            if key is None:
+                query, params = "SELECT * FROM users" + order, (pagesize,)
+            else:
+                where = lazy_paginate._seek_condition(order_by, marker)
+                query = "SELECT * FROM users WHERE " + where + order
+                params = (*lazy_paginate._seek_params(key), pagesize)
+            in_query = True
+            cursor = await pool.driver.execute(connection, query, params)
+            try:
+                page = list(await cursor.fetchall())
+                names = [d[0] for d in cursor.description]
+            finally:
+                await cursor.close()
+            in_query = False
+            if not page:
+                break
+            if key_positions is None:
+                key_positions = [names.index(c) for c in order_by]
+            key = tuple(page[-1][i] for i in key_positions)
+            yield page
+            if len(page) < pagesize:
+                break
+    finally:
+        # Pages are read in full before they are yielded, so the connection
+        # is only suspect if we were interrupted in the middle of a query.
+        await pool.release(connection, discard=in_query and
+                           pool.driver.streams_on_connection)
+
+
+async def stream_user_ages(pool=None):
+    batches = _query_batches("SELECT age FROM users", pool=pool)
+    try:
+        async for rows in batches:
+            for row in rows:
+                yield row[0]
+    finally:
+        await batches.aclose()
@@ -0,0 +1,127 @@
+"""
+Adaptive fetchmany sizing for the batch streamers.
+
+AdaptiveBatchSizer picks the size of the next fetchmany() from what it has
+measured so far: the approximate in-memory size of a row and the time spent
+fetching each row. Given a memory budget (bytes per batch) and/or a target
+latency (seconds per fetch), it steers the batch size towards the largest
+size that satisfies both. Without either it simply keeps the initial size.
+
+Every decision is recorded on a BatchStats object so jobs can be tuned from
+real numbers. Measuring row sizes costs a sys.getsizeof() pass over a sample
+of each batch, so a sizer that is neither adaptive nor given a BatchStats
+skips it and records zero bytes.
+"""
+
+import sys
+from collections import deque
+
+SAMPLE_ROWS = 32
+
+
+def row_size(row):
+    """Approximate in-memory size of a row tuple and its values in bytes."""
+    return sys.getsizeof(row) + sum(sys.getsizeof(value) for value in row)
+
+
+class BatchStats:
+    """Counters and recent history of the batches a sizer has produced."""
+
+    def __init__(self, history=100):
+        self.batches = 0
+        self.rows = 0
+        self.bytes = 0
+        self.fetch_seconds = 0.0
+        self.history = deque(maxlen=history)
+
+    def record(self, size, rows, nbytes, seconds):
+        self.batches += 1
+        self.rows += rows
+        self.bytes += nbytes
+        self.fetch_seconds += seconds
+        self.history.append({"size": size, "rows": rows, "bytes": nbytes,
+                             "seconds": seconds})
+
+    @property
+    def sizes(self):
+        return [entry["size"] for entry in self.history]
+
+    @property
+    def bytes_per_row(self):
+        return self.bytes / self.rows if self.rows else 0.0
+
+    @property
+    def rows_per_second(self):
+        return self.rows / self.fetch_seconds if self.fetch_seconds else 0.0
+
+    def as_dict(self):
+        return {
+            "batches": self.batches,
+            "rows": self.rows,
+            "bytes": self.bytes,
+            "fetch_seconds": self.fetch_seconds,
+            "bytes_per_row": self.bytes_per_row,
+            "rows_per_second": self.rows_per_second,
+            "recent_sizes": self.sizes,
+        }
+
+
+class AdaptiveBatchSizer:
+    """Choose fetchmany() sizes from a memory budget and/or latency target."""
+
+    def __init__(self, initial=100, memory_budget=None, target_latency=None,
+                 min_size=1, max_size=100000, smoothing=0.3, max_growth=2.0,
+                 stats=None):
+        if initial < 1 or min_size < 1 or max_size < min_size:
+            raise ValueError("Batch sizes must be positive and min <= max")
+        self.size = max(min_size, min(initial, max_size))
+        self.memory_budget = memory_budget
+        self.target_latency = target_latency
+        self.min_size = min_size
+        self.max_size = max_size
+        self.smoothing = smoothing
+        self.max_growth = max_growth
+        # Row sizes are only worth measuring if something reads them.
+        self._measure_bytes = stats is not None or self.adaptive
+        self.stats = stats if stats is not None else BatchStats()
+        self._bytes_per_row = None
+        self._seconds_per_row = None
+
+    @property
+    def adaptive(self):
+        return self.memory_budget is not None or self.target_latency is not None
+
+    def next_size(self):
+        return self.size
+
+    def _smooth(self, current, sample):
+        if current is None:
+            return sample
+        return current + self.smoothing * (sample - current)
+
+    def observe(self, rows, seconds):
+        """Record a fetched batch and adjust the size of the next one."""
+        if not rows:
+            return
+        if not self._measure_bytes:
+            self.stats.record(self.size, len(rows), 0, seconds)
+            return
+        sample = rows[:SAMPLE_ROWS]
+        per_row = sum(row_size(row) for row in sample) / len(sample)
+        self.stats.record(self.size, len(rows), int(per_row * len(rows)),
+                          seconds)
+        if not self.adaptive:
+            return
+
+        self._bytes_per_row = self._smooth(self._bytes_per_row, per_row)
+        self._seconds_per_row = self._smooth(self._seconds_per_row,
+                                             seconds / len(rows))
+        limits = []
+        if self.memory_budget is not None:
+            limits.append(self.memory_budget / self._bytes_per_row)
+        if self.target_latency is not None and self._seconds_per_row > 0:
+            limits.append(self.target_latency / self._seconds_per_row)
+        if not limits:
+            return
+        wanted = min(min(limits), self.size * self.max_growth)
+        self.size = int(max(self.min_size, min(wanted, self.max_size)))
@@ -0,0 +1,508 @@
+#!/usr/bin/env python3
+"""
+Benchmark suite for the generator streaming exercises.
+
+Synthesizes a users table with the user_data.csv schema (user_id, name,
+email, age) into a local SQLite file, or uses the configured MySQL database,
+then measures each streamer for rows/sec, time to first row and peak RSS.
+Every case runs in a fresh child process so peak RSS is not polluted by
+earlier cases. The filter_age cases apply the age > 25 filter of
+batch_processing() in-process to every batch, as a Python comprehension over
+row tuples and as a NumPy mask over columnar batches; both count the rows
+they keep, so their row counts must agree. The "slow db" cases add
+FETCH_DELAY to every batch fetch and WORK_DELAY of processing per batch,
+with and without prefetching. The page latency report times fetching one
+page at increasing depths with LIMIT/OFFSET (paginate_users) and with a
+keyset seek (keyset_pages). The seeding report loads the same synthetic
+users into a scratch SQLite file row by row (one INSERT and commit per row,
+as the original seed did) and through seed.insert_data()'s chunked
+executemany upserts. Results are written as JSON, and --compare prints the
+change against an earlier results file:
+
+    python3 benchmark.py --rows 1000000 --output bench.json
+    python3 benchmark.py --rows 1000000 --compare bench.json
+"""
+
+import argparse
+import contextlib
+import csv
+import io
+import json
+import multiprocessing
+import os
+import platform
+import random
+import resource
+import sqlite3
+import sys
+import tempfile
+import time
+import uuid
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_CSV = os.path.join(HERE, os.pardir, "user_data.csv")
+DEFAULT_DB = os.path.join(HERE, "bench_users.db")
+SEED_CHUNK = 50000
+MODULES = ('db', '0-stream_users', '1-batch_processing', '2-lazy_paginate',
+           '4-stream_ages', 'parallel_scan', 'user_batch')
+MEMORY_SAMPLE_ROWS = 100000
+FETCH_DELAY = 0.005
+WORK_DELAY = 0.005
+SEED_ROWS = 200000
+SEED_SINGLE_ROWS = 2000
+PAGE_SIZE = 100
+PAGE_DEPTHS = (1, 10, 100, 1000, 10000)
+
+
+def _sample_people(csv_file):
+    with open(csv_file, newline="", encoding="utf-8") as handle:
+        reader = csv.reader(handle)
+        next(reader, None)
+        people = [(row[0], row[1]) for row in reader if len(row) >= 2]
+    return people or [("Jane Doe", "jane@example.com")]
+
+
+def synthesize(db_path, rows, csv_file=DEFAULT_CSV, rebuild=False, seed=42):
+    """Create db_path with a users table of rows synthetic users."""
+    connection = sqlite3.connect(db_path)
+    try:
+        exists = connection.execute(
+            "SELECT COUNT(*) FROM sqlite_master WHERE name = 'users'"
+        ).fetchone()[0]
+        if exists and not rebuild:
+            cursor = connection.execute("SELECT COUNT(*) FROM users")
+            if cursor.fetchone()[0] == rows:
+                return
+        connection.execute("DROP TABLE IF EXISTS users")
+        connection.execute(
+            "CREATE TABLE users (user_id TEXT PRIMARY KEY, name TEXT NOT NULL,"
+            " email TEXT NOT NULL, age INTEGER NOT NULL)")
+        people = _sample_people(csv_file)
+        rng = random.Random(seed)
+        for start in range(0, rows, SEED_CHUNK):
+            chunk = []
+            for i in range(start, min(start + SEED_CHUNK, rows)):
+                name, email = people[i % len(people)]
+                local, _, domain = email.partition("@")
+                user_id = uuid.UUID(int=rng.getrandbits(128), version=4)
+                chunk.append((str(user_id), name, f"{local}.{i}@{domain}",
+                              rng.randint(18, 100)))
+            connection.executemany("INSERT INTO users VALUES (?, ?, ?, ?)",
+                                   chunk)
+            connection.commit()
+    finally:
+        connection.close()
+
+
+def synthetic_records(rows, csv_file=DEFAULT_CSV, seed=42):
+    """Yield rows (name, email, age) records shaped like user_data.csv."""
+    people = _sample_people(csv_file)
+    rng = random.Random(seed)
+    for i in range(rows):
+        name, email = people[i % len(people)]
+        local, _, domain = email.partition("@")
+        yield name, f"{local}.{i}@{domain}", str(rng.randint(18, 100))
+
+
+def _module(name):
+    if HERE not in sys.path:
+        sys.path.insert(0, HERE)
+    return __import__(name)
+
+
+def case_stream_users():
+    for _ in _module('0-stream_users').stream_users():
+        yield 1
+
+
+def case_stream_users_in_batches():
+    batches = _module('1-batch_processing').stream_users_in_batches
+    for batch in batches(1000):
+        yield len(batch)
+
+
+def case_stream_users_in_batches_prefetch():
+    batches = _module('1-batch_processing').stream_users_in_batches
+    for batch in batches(1000, prefetch=2):
+        yield len(batch)
+
+
+def _slow_fetches(batches, delay):
+    # Each next() on the source is one fetchmany(); add delay to each, as a
+    # remote or loaded database would.
+    for batch in batches:
+        time.sleep(delay)
+        yield batch
+
+
+def _slow_database(prefetch):
+    def case():
+        batches = _module('1-batch_processing').stream_users_in_batches
+        source = _slow_fetches(batches(1000), FETCH_DELAY)
+        if prefetch:
+            source = _module('prefetch').prefetch(source, depth=prefetch)
+        for batch in source:
+            # Simulated per-batch processing, which prefetch overlaps with
+            # the next fetch.
+            time.sleep(WORK_DELAY)
+            yield len(batch)
+    return case
+
+
+def case_stream_users_in_batches_columns():
+    batches = _module('1-batch_processing').stream_users_in_batches
+    for batch in batches(1000, output="columns"):
+        yield len(batch["user_id"])
+
+
+def case_filter_age_python():
+    batches = _module('1-batch_processing').stream_users_in_batches
+    age = _module('db').column_names("users").index("age")
+    for batch in batches(1000):
+        kept = [row for row in batch if row[age] > 25]
+        yield len(kept)
+
+
+def case_filter_age_vectorized():
+    batches = _module('1-batch_processing').stream_users_in_batches
+    for batch in batches(1000, output="columns"):
+        mask = batch["age"] > 25
+        kept = {name: column[mask] for name, column in batch.items()}
+        yield len(kept["user_id"])
+
+
+def case_stream_users_in_batches_batch():
+    batches = _module('1-batch_processing').stream_users_in_batches
+    for batch in batches(1000, output="batch"):
+        yield len(batch)
+
+
+def case_lazy_pagination():
+    for page in _module('2-lazy_paginate').lazy_pagination(1000):
+        yield len(page)
+
+
+def case_compute_average_age():
+    ages = _module('4-stream_ages')
+    with contextlib.redirect_stdout(io.StringIO()):
+        ages.compute_average_age()
+    yield int(_count_rows())
+
+
+def _parallel_ages(workers):
+    def case():
+        parallel_scan = _module('parallel_scan')
+        stats = parallel_scan.parallel_age_statistics(workers=workers)
+        yield stats.moments.count
+    case.__name__ = f"case_parallel_age_statistics_{workers}"
+    return case
+
+
+def _count_rows():
+    db = _module('db')
+    connection = db.connect()
+    try:
+        cursor = connection.cursor()
+        cursor.execute("SELECT COUNT(*) FROM users")
+        return cursor.fetchone()[0]
+    finally:
+        connection.close()
+
+
+CASES = {
+    "stream_users": case_stream_users,
+    "stream_users_in_batches": case_stream_users_in_batches,
+    "stream_users_in_batches[prefetch]":
+        case_stream_users_in_batches_prefetch,
+    "stream_users_in_batches[columns]":
+        case_stream_users_in_batches_columns,
+    "stream_users_in_batches[batch]": case_stream_users_in_batches_batch,
+    "filter_age[python]": case_filter_age_python,
+    "filter_age[vectorized]": case_filter_age_vectorized,
+    "stream_users_in_batches[slow db]": _slow_database(0),
+    "stream_users_in_batches[slow db, prefetch]": _slow_database(2),
+    "lazy_pagination": case_lazy_pagination,
+    "compute_average_age": case_compute_average_age,
+}
+for _workers in (1, 2, 4, 8):
+    CASES[f"parallel_age_statistics[{_workers}]"] = _parallel_ages(_workers)
+
+
+def _sample():
+    db = _module('db')
+    connection = db.connect()
+    try:
+        cursor = connection.cursor()
+        cursor.execute(f"SELECT * FROM users LIMIT {MEMORY_SAMPLE_ROWS}")
+        names = [d[0] for d in cursor.description]
+        return names, cursor.fetchall()
+    finally:
+        connection.close()
+
+
+def memory_report():
+    """Bytes per row of tuples, slotted records and UserBatch on a sample."""
+    names, rows = _sample()
+    return _module('user_batch').memory_per_row(names, rows)
+
+
+def filter_report(batch_size=1000, repeat=5):
+    """
+    Rows/sec of the age > 25 filter alone on already-fetched batches: a
+    comprehension over row tuples versus a NumPy mask over columns. The
+    filter_age cases include fetching and building the batches as well.
+    """
+    batching = _module('1-batch_processing')
+    if batching.np is None:
+        return None
+    names, rows = _sample()
+    age = names.index("age")
+    tuples = [rows[i:i + batch_size] for i in range(0, len(rows), batch_size)]
+    columns = [batching._to_columns(names, batch) for batch in tuples]
+
+    def python_filter():
+        kept = 0
+        for batch in tuples:
+            kept += len([row for row in batch if row[age] > 25])
+        return kept
+
+    def vectorized_filter():
+        kept = 0
+        for batch in columns:
+            mask = batch["age"] > 25
+            kept += len({name: column[mask]
+                         for name, column in batch.items()}["user_id"])
+        return kept
+
+    if python_filter() != vectorized_filter():
+        raise AssertionError("Python and vectorized filters kept different "
+                             "rows")
+    return {"python_rows_per_second":
+            len(rows) / _best_of(repeat, python_filter),
+            "vectorized_rows_per_second":
+            len(rows) / _best_of(repeat, vectorized_filter)}
+
+
+def _best_of(repeat, func):
+    best = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def _first_page(pages):
+    try:
+        return next(pages)
+    finally:
+        pages.close()
+
+
+def page_latency_report(pagesize=PAGE_SIZE, depths=PAGE_DEPTHS, repeat=5):
+    """
+    Milliseconds (best of repeat) to fetch page number depth by OFFSET and
+    by keyset seek, for each depth that lies within the table.
+    """
+    paginate = _module('2-lazy_paginate')
+    db = _module('db')
+    total = _count_rows()
+    report = {}
+    for depth in depths:
+        offset = (depth - 1) * pagesize
+        if offset >= total:
+            break
+        token = None
+        if offset:
+            connection = db.connect()
+            try:
+                cursor = connection.cursor()
+                cursor.execute("SELECT user_id FROM users ORDER BY user_id "
+                               f"LIMIT 1 OFFSET {offset - 1}")
+                token = paginate.encode_token(cursor.fetchone())
+            finally:
+                connection.close()
+        by_offset = _best_of(repeat, lambda: _first_page(
+            paginate.paginate_users(pagesize, offset)))
+        by_keyset = _best_of(repeat, lambda: _first_page(
+            paginate.keyset_pages(pagesize, token=token)))
+        report[depth] = {"offset_ms": by_offset * 1000,
+                         "keyset_ms": by_keyset * 1000}
+    return report
+
+
+def seed_report(rows=SEED_ROWS, single_rows=SEED_SINGLE_ROWS,
+                csv_file=DEFAULT_CSV):
+    """
+    Rows/sec inserting users one row and one commit at a time versus
+    seed.insert_data() in chunks, each into a fresh scratch SQLite file.
+    """
+    seed = _module('seed')
+
+    def load(path, method):
+        connection = sqlite3.connect(path)
+        try:
+            seed.create_table(connection)
+            started = time.perf_counter()
+            if method == "row":
+                count = 0
+                for record in synthetic_records(single_rows, csv_file):
+                    row = seed._parse(record)
+                    connection.execute(seed.SQLITE_UPSERT, row)
+                    connection.commit()
+                    count += 1
+            else:
+                count = seed.insert_data(connection,
+                                         synthetic_records(rows, csv_file),
+                                         progress=False)
+            return count / (time.perf_counter() - started)
+        finally:
+            connection.close()
+
+    with tempfile.TemporaryDirectory() as directory:
+        row_at_a_time = load(os.path.join(directory, "row.db"), "row")
+        bulk = load(os.path.join(directory, "bulk.db"), "bulk")
+    return {"row_at_a_time_rows_per_second": row_at_a_time,
+            "bulk_rows_per_second": bulk,
+            "speedup": bulk / row_at_a_time}
+
+
+def _peak_rss_bytes():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def _run_case(name, results):
+    try:
+        # Import everything up front so module (and numpy) import time is
+        # not charged to the first row.
+        for module in MODULES:
+            _module(module)
+        baseline = _peak_rss_bytes()
+        started = time.perf_counter()
+        first = None
+        rows = 0
+        for count in CASES[name]():
+            if first is None:
+                first = time.perf_counter() - started
+            rows += count
+        elapsed = time.perf_counter() - started
+        peak = _peak_rss_bytes()
+        results.put({
+            "case": name,
+            "rows": rows,
+            "seconds": elapsed,
+            "rows_per_second": rows / elapsed if elapsed else None,
+            "time_to_first_row": first,
+            "peak_rss_bytes": peak,
+            "peak_rss_growth_bytes": peak - baseline,
+        })
+    except Exception as err:
+        results.put({"case": name, "error": f"{type(err).__name__}: {err}"})
+
+
+def run_case(name):
+    """Run one case in a child process and return its measurements."""
+    context = multiprocessing.get_context()
+    results = context.Queue()
+    child = context.Process(target=_run_case, args=(name, results))
+    child.start()
+    result = results.get()
+    child.join()
+    return result
+
+
+def compare(current, previous):
+    """Print the relative change of every case against a previous run."""
+    before = {r["case"]: r for r in previous.get("results", [])}
+    print(f"{'case':40} {'rows/s':>10} {'first row':>10} {'peak rss':>10}")
+    for result in current["results"]:
+        old = before.get(result["case"])
+        if old is None or "error" in result or "error" in old:
+            continue
+
+        def change(key):
+            if not old.get(key) or result.get(key) is None:
+                return "n/a"
+            return f"{(result[key] - old[key]) / old[key]:+.1%}"
+
+        print(f"{result['case']:40} {change('rows_per_second'):>10} "
+              f"{change('time_to_first_row'):>10} "
+              f"{change('peak_rss_bytes'):>10}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--rows", type=int, default=100000)
+    parser.add_argument("--engine", choices=("sqlite", "mysql"),
+                        default="sqlite")
+    parser.add_argument("--db-path", default=DEFAULT_DB)
+    parser.add_argument("--csv", default=DEFAULT_CSV)
+    parser.add_argument("--rebuild", action="store_true")
+    parser.add_argument("--cases", nargs="*", choices=sorted(CASES),
+                        default=None)
+    parser.add_argument("--seed-rows", type=int, default=SEED_ROWS)
+    parser.add_argument("--page-depths", type=int, nargs="*",
+                        default=list(PAGE_DEPTHS))
+    parser.add_argument("--output", default=None)
+    parser.add_argument("--compare", default=None)
+    args = parser.parse_args(argv)
+
+    os.environ["DB_ENGINE"] = args.engine
+    if args.engine == "sqlite":
+        os.environ["DB_PATH"] = args.db_path
+        synthesize(args.db_path, args.rows, args.csv, rebuild=args.rebuild)
+
+    report = {
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "engine": args.engine,
+        "rows": args.rows,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "results": [],
+    }
+    for name in args.cases or CASES:
+        result = run_case(name)
+        report["results"].append(result)
+        if "error" in result:
+            print(f"{name:40} error: {result['error']}")
+        else:
+            print(f"{name:40} {result['rows_per_second']:>12,.0f} rows/s "
+                  f"first row {result['time_to_first_row'] * 1000:8.1f} ms "
+                  f"peak rss {result['peak_rss_bytes'] / 2 ** 20:8.1f} MiB")
+
+    report["memory_per_row"] = memory_report()
+    print("bytes per row: " + ", ".join(
+        f"{form} {size:.0f}" for form, size in report["memory_per_row"].items()))
+
+    report["filter"] = filter_report()
+    if report["filter"] is not None:
+        print(f"age filter only: python "
+              f"{report['filter']['python_rows_per_second']:>12,.0f} rows/s"
+              f"   vectorized "
+              f"{report['filter']['vectorized_rows_per_second']:>12,.0f}"
+              " rows/s")
+
+    report["page_latency"] = page_latency_report(depths=args.page_depths)
+    for depth, timing in report["page_latency"].items():
+        print(f"page {depth:<6} OFFSET {timing['offset_ms']:8.2f} ms   "
+              f"keyset {timing['keyset_ms']:8.2f} ms")
+
+    report["seed"] = seed_report(args.seed_rows)
+    print(f"seed row-at-a-time "
+          f"{report['seed']['row_at_a_time_rows_per_second']:>12,.0f} rows/s"
+          f"   bulk {report['seed']['bulk_rows_per_second']:>12,.0f} rows/s"
+          f"   x{report['seed']['speedup']:.0f}")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as handle:
+            json.dump(report, handle, indent=2)
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as handle:
+            compare(report, json.load(handle))
+    return report
+
+
+if __name__ == "__main__":
+    main()
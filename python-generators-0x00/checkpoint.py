@@ -0,0 +1,121 @@
+"""
+Checkpointed, resumable streaming over the users table.
+
+resumable_stream_users_in_batches() pages through users with the keyset
+seek from 2-lazy_paginate and, every `every` batches, writes the
+continuation token of the last fully processed batch to a checkpoint file.
+If the job dies, running it again with the same checkpoint file continues
+with a seek past that key instead of starting from the first row.
+
+Delivery is at-least-once. A batch counts as processed once the consumer
+asks for the next one, so rows in batches delivered after the last saved
+checkpoint are delivered again on restart (at most every * batch_size rows
+plus the batch in flight). Consumers that need exactly-once effects should
+make their writes idempotent, e.g. upsert on user_id.
+
+The checkpoint file is replaced atomically: the new state is written to a
+temporary file in the same directory, fsynced, and renamed over the old one,
+so a crash mid-write leaves the previous checkpoint intact.
+"""
+
+import json
+import os
+import tempfile
+import time
+
+lazy_paginate = __import__('2-lazy_paginate')
+
+
+class Checkpoint:
+    """A small JSON state file updated by atomic rename."""
+
+    def __init__(self, path):
+        self.path = path
+
+    def load(self):
+        """Return the saved state dict, or None if there is no checkpoint."""
+        try:
+            with open(self.path, encoding="utf-8") as handle:
+                return json.load(handle)
+        except FileNotFoundError:
+            return None
+
+    def save(self, **state):
+        state["updated"] = time.time()
+        directory = os.path.dirname(os.path.abspath(self.path))
+        descriptor, temporary = tempfile.mkstemp(
+            dir=directory, prefix=".checkpoint-", suffix=".tmp")
+        try:
+            with os.fdopen(descriptor, "w", encoding="utf-8") as handle:
+                json.dump(state, handle)
+                handle.flush()
+                os.fsync(handle.fileno())
+            os.replace(temporary, self.path)
+        except BaseException:
+            if os.path.exists(temporary):
+                os.remove(temporary)
+            raise
+        self._sync_directory(directory)
+
+    @staticmethod
+    def _sync_directory(directory):
+        """Persist the rename itself (not supported on every platform)."""
+        try:
+            descriptor = os.open(directory, os.O_RDONLY)
+        except OSError:
+            return
+        try:
+            os.fsync(descriptor)
+        except OSError:
+            pass
+        finally:
+            os.close(descriptor)
+
+    def clear(self):
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+
+
+def resumable_stream_users_in_batches(batch_size, checkpoint_path, every=1,
+                                      order_by=("user_id",)):
+    """
+    Yield batches of users, resuming after the last checkpointed batch.
+
+    order_by must be unique (end it with the primary key) and must not
+    change between runs of the same checkpoint.
+    """
+    if every < 1:
+        raise ValueError("every must be at least 1")
+    checkpoint = Checkpoint(checkpoint_path)
+    state = checkpoint.load() or {}
+    order_by = list(order_by)
+    if state and state.get("order_by") != order_by:
+        raise ValueError(
+            f"Checkpoint {checkpoint_path!r} was written for ORDER BY "
+            f"{state.get('order_by')}, not {order_by}")
+    token = state.get("token")
+    rows = state.get("rows", 0)
+
+    pending = 0
+    pages = lazy_paginate.keyset_pages(batch_size, order_by, token=token)
+    for page, next_token in pages:
+        yield page
+        # Resumed: the consumer has finished with this page.
+        token = next_token
+        rows += len(page)
+        pending += 1
+        if pending >= every:
+            checkpoint.save(token=token, rows=rows, order_by=order_by,
+                            complete=False)
+            pending = 0
+    checkpoint.save(token=token, rows=rows, order_by=order_by, complete=True)
+
+
+def resumable_stream_users(checkpoint_path, batch_size=1000, every=1,
+                           order_by=("user_id",)):
+    """Yield users one by one with the same checkpointing as above."""
+    for batch in resumable_stream_users_in_batches(
+            batch_size, checkpoint_path, every=every, order_by=order_by):
+        yield from batch
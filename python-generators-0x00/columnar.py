@@ -0,0 +1,386 @@
+"""
+Streaming export of user tables to a chunked columnar file, and its reader.
+
+The layout follows Parquet: rows are cut into row groups, each row group
+stores every column as a separate compressed chunk, and a footer at the end
+of the file records where each chunk is plus its min/max/null statistics:
+
+    MAGIC | row group 0: chunk(col 0) chunk(col 1) ... | row group 1 ... |
+    footer (JSON) | footer length (8 bytes) | MAGIC
+
+Chunks are zlib-compressed (level 1 by default: higher levels cost several
+times the CPU for a few percent smaller files on this data). Integers are
+packed into an array of the narrowest fitting type, floats as doubles, and
+strings as one UTF-8 buffer plus lengths, or dictionary-encoded when at most
+half of them are distinct.
+
+The writer only holds one row group in memory, so exporting a table of any
+size takes bounded memory:
+
+    export_users("users.ucf", row_group_size=100000)
+
+and the reader decodes only the projected columns, skipping row groups whose
+statistics show that no row can match the filter:
+
+    with ColumnarReader("users.ucf") as reader:
+        for batch in reader.iter_batches(columns=("email",),
+                                         where=col("age") > 90):
+            ...
+"""
+
+import collections
+import decimal
+import itertools
+import json
+import math
+import os
+import struct
+import zlib
+from array import array
+
+db = __import__('db')
+predicates = __import__('predicates')
+user_batch = __import__('user_batch')
+col = predicates.col
+
+MAGIC = b"UCF1"
+FOOTER_LENGTH = struct.Struct("<Q")
+ROW_GROUP_SIZE = 65536
+OUTPUTS = ("rows", "columns")
+
+ColumnStats = collections.namedtuple(
+    "ColumnStats", ("min", "max", "null_count", "count"))
+
+
+def _pack_strings(values):
+    lengths = array("I", [len(value) for value in values])
+    return [lengths.tobytes(), "".join(values).encode("utf-8")], "I"
+
+
+def _unpack_strings(parts, typecode):
+    lengths = array(typecode)
+    lengths.frombytes(parts[0])
+    text = parts[1].decode("utf-8")
+    ends = itertools.accumulate(lengths)
+    values, start = [], 0
+    for end in ends:
+        values.append(text[start:end])
+        start = end
+    return values
+
+
+def _as_floats(values):
+    floats = []
+    for value in values:
+        if isinstance(value, bool) or not isinstance(
+                value, (int, float, decimal.Decimal)):
+            return None
+        floats.append(float(value))
+    return floats
+
+
+def _encode(values):
+    """
+    Return (encoding, typecode, parts, values) for the non-null values; the
+    returned values are the ones that will read back (e.g. Decimal as int).
+    """
+    ints = user_batch._as_ints(values)
+    if ints is not None:
+        typecode = user_batch._int_typecode(ints or [0]) or "q"
+        return "int", typecode, [array(typecode, ints).tobytes()], ints
+    if all(isinstance(value, str) for value in values):
+        distinct = dict.fromkeys(values)
+        if len(distinct) <= user_batch.DICTIONARY_RATIO * len(values):
+            lookup = {value: code for code, value in enumerate(distinct)}
+            codes = [lookup[value] for value in values]
+            typecode = user_batch._int_typecode(codes or [0]) or "q"
+            parts, _ = _pack_strings(list(distinct))
+            parts.insert(0, array(typecode, codes).tobytes())
+            return "dict", typecode, parts, values
+        parts, typecode = _pack_strings(values)
+        return "str", typecode, parts, values
+    floats = _as_floats(values)
+    if floats is not None:
+        return "float", "d", [array("d", floats).tobytes()], floats
+    kinds = sorted({type(value).__name__ for value in values})
+    raise TypeError(f"Cannot store values of type {', '.join(kinds)}")
+
+
+def _decode(encoding, typecode, parts):
+    if encoding == "str":
+        return _unpack_strings(parts, typecode)
+    if encoding == "dict":
+        codes = array(typecode)
+        codes.frombytes(parts[0])
+        dictionary = _unpack_strings(parts[1:], "I")
+        return [dictionary[code] for code in codes]
+    values = array(typecode)
+    values.frombytes(parts[0])
+    return values.tolist()
+
+
+def _min_max(values):
+    if values and isinstance(values[0], float):
+        values = [value for value in values if not math.isnan(value)]
+        if any(math.isinf(value) for value in values):
+            # JSON has no infinity; leave the chunk without stats.
+            return None, None
+    if not values:
+        return None, None
+    return min(values), max(values)
+
+
+class ColumnarWriter:
+    """
+    Write rows or column batches to a columnar file, one row group at a time.
+
+    Rows are buffered column by column until row_group_size rows have been
+    written, then compressed and appended as a row group.
+    """
+
+    def __init__(self, path, names, row_group_size=ROW_GROUP_SIZE,
+                 compression=1):
+        if row_group_size < 1:
+            raise ValueError("row_group_size must be at least 1")
+        self.path = path
+        self.names = list(names)
+        self.row_group_size = row_group_size
+        self.compression = compression
+        self.row_groups = []
+        self.rows = 0
+        self._buffer = [[] for _ in self.names]
+        self._file = open(path, "wb")
+        self._file.write(MAGIC)
+
+    def write_rows(self, rows):
+        rows = list(rows)
+        start = 0
+        while start < len(rows):
+            room = self.row_group_size - len(self._buffer[0])
+            chunk = rows[start:start + room]
+            for column, values in zip(self._buffer, zip(*chunk)):
+                column.extend(values)
+            start += room
+            if len(self._buffer[0]) >= self.row_group_size:
+                self.flush()
+
+    def write_columns(self, columns):
+        """Write a mapping of column name -> equally long list of values."""
+        values = [list(columns[name]) for name in self.names]
+        count = len(values[0]) if values else 0
+        start = 0
+        while start < count:
+            room = self.row_group_size - len(self._buffer[0])
+            for column, column_values in zip(self._buffer, values):
+                column.extend(column_values[start:start + room])
+            start += room
+            if len(self._buffer[0]) >= self.row_group_size:
+                self.flush()
+
+    def flush(self):
+        """Write the buffered rows out as a row group."""
+        count = len(self._buffer[0]) if self._buffer else 0
+        if not count:
+            return
+        group = {"rows": count, "columns": {}}
+        for name, values in zip(self.names, self._buffer):
+            group["columns"][name] = self._write_chunk(values)
+        self.row_groups.append(group)
+        self.rows += count
+        self._buffer = [[] for _ in self.names]
+
+    def _write_chunk(self, values):
+        present = [value for value in values if value is not None]
+        nulls = len(values) - len(present)
+        encoding, typecode, parts, stored = _encode(present)
+        if nulls:
+            parts.append(bytes(value is None for value in values))
+        low, high = _min_max(stored)
+        payload = zlib.compress(b"".join(parts), self.compression)
+        offset = self._file.tell()
+        self._file.write(payload)
+        return {
+            "offset": offset,
+            "length": len(payload),
+            "encoding": encoding,
+            "typecode": typecode,
+            "parts": [len(part) for part in parts],
+            "null_count": nulls,
+            "min": low,
+            "max": high,
+        }
+
+    def close(self):
+        if self._file.closed:
+            return
+        try:
+            self.flush()
+            footer = json.dumps({
+                "version": 1,
+                "names": self.names,
+                "rows": self.rows,
+                "row_groups": self.row_groups,
+            }).encode("utf-8")
+            self._file.write(footer)
+            self._file.write(FOOTER_LENGTH.pack(len(footer)))
+            self._file.write(MAGIC)
+        finally:
+            self._file.close()
+
+    def abort(self):
+        """Close and delete the file, so no half-written export is left."""
+        self._file.close()
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+
+class ColumnarReader:
+    """Read a file written by ColumnarWriter."""
+
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, "rb")
+        try:
+            self._read_footer()
+        except BaseException:
+            self._file.close()
+            raise
+        self.skipped_row_groups = 0
+
+    def _read_footer(self):
+        tail = len(MAGIC) + FOOTER_LENGTH.size
+        if self._file.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f"{self.path} is not a columnar file")
+        self._file.seek(-tail, os.SEEK_END)
+        length_bytes = self._file.read(FOOTER_LENGTH.size)
+        if self._file.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f"{self.path} is truncated (no footer)")
+        length, = FOOTER_LENGTH.unpack(length_bytes)
+        self._file.seek(-(tail + length), os.SEEK_END)
+        footer = json.loads(self._file.read(length))
+        self.names = footer["names"]
+        self.num_rows = footer["rows"]
+        self.row_groups = footer["row_groups"]
+
+    def stats(self, index):
+        """Return {column: ColumnStats} for row group index."""
+        group = self.row_groups[index]
+        return {
+            name: ColumnStats(chunk["min"], chunk["max"], chunk["null_count"],
+                              group["rows"])
+            for name, chunk in group["columns"].items()
+        }
+
+    def _read_chunk(self, chunk):
+        self._file.seek(chunk["offset"])
+        data = zlib.decompress(self._file.read(chunk["length"]))
+        parts, start = [], 0
+        for size in chunk["parts"]:
+            parts.append(data[start:start + size])
+            start += size
+        if chunk["null_count"]:
+            mask = parts.pop()
+            present = iter(_decode(chunk["encoding"], chunk["typecode"],
+                                   parts))
+            return [None if null else next(present) for null in mask]
+        return _decode(chunk["encoding"], chunk["typecode"], parts)
+
+    def read_row_group(self, index, columns=None):
+        """Return {column: values} for row group index."""
+        chunks = self.row_groups[index]["columns"]
+        return {name: self._read_chunk(chunks[name])
+                for name in (columns or self.names)}
+
+    def _projection(self, columns):
+        columns = list(columns or self.names)
+        unknown = set(columns) - set(self.names)
+        if unknown:
+            raise KeyError(f"Unknown column(s): {sorted(unknown)}")
+        return columns
+
+    def iter_batches(self, columns=None, where=None, output="rows"):
+        """
+        Yield one batch per row group: a list of tuples of the projected
+        columns, or with output="columns" a dict of column -> list.
+
+        Row groups whose statistics rule out where are not read at all; in
+        the others only the projected and filtered columns are decoded.
+        """
+        if output not in OUTPUTS:
+            raise ValueError(
+                f"output must be one of {OUTPUTS}, got {output!r}")
+        columns = self._projection(columns)
+        needed = list(columns)
+        if where is not None:
+            needed += sorted(where.columns() - set(columns))
+            self._projection(needed)
+            keep = where.bind(needed)
+        for index in range(len(self.row_groups)):
+            if where is not None and not where.may_match(self.stats(index)):
+                self.skipped_row_groups += 1
+                continue
+            data = self.read_row_group(index, needed)
+            rows = zip(*(data[name] for name in needed))
+            if where is not None:
+                rows = [row[:len(columns)] for row in rows if keep(row)]
+                if not rows:
+                    continue
+                if output == "columns":
+                    yield {name: [row[i] for row in rows]
+                           for i, name in enumerate(columns)}
+                else:
+                    yield rows
+            elif output == "columns":
+                yield {name: data[name] for name in columns}
+            else:
+                yield list(rows)
+
+    def __iter__(self):
+        for batch in self.iter_batches():
+            yield from batch
+
+    def close(self):
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+def export_batches(path, names, batches, row_group_size=ROW_GROUP_SIZE,
+                   compression=1):
+    """Write an iterable of row batches to path; return the row count."""
+    with ColumnarWriter(path, names, row_group_size=row_group_size,
+                        compression=compression) as writer:
+        for batch in batches:
+            writer.write_rows(batch)
+    return writer.rows
+
+
+def export_users(path, batch_size=1000, row_group_size=ROW_GROUP_SIZE,
+                 where=None, order_by=None, compression=1):
+    """
+    Export the users table through stream_users_in_batches(); return the
+    row count. Exporting with order_by on a column makes its row group
+    min/max ranges narrow, so filters on it skip more row groups. A
+    database error aborts the export instead of finishing a truncated file.
+    """
+    batches = __import__('1-batch_processing').stream_users_in_batches
+    return export_batches(
+        path, db.column_names("users"),
+        batches(batch_size, where=where, order_by=order_by,
+                raise_errors=True),
+        row_group_size=row_group_size, compression=compression)
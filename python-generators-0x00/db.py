@@ -0,0 +1,428 @@
+"""
+Connection helpers shared by the generator exercises.
+
+Connection settings come from the same DB_* environment variables as
+.env.example, falling back to the values the exercises were written against.
+Set DB_ENGINE=sqlite (and optionally DB_PATH) to run the generators against a
+local SQLite file instead of MySQL.
+
+Each engine is a Backend (MySQLBackend, SQLiteBackend; more can be added
+with register_backend()). The streamers check connections out of one
+process-wide ConnectionPool instead of connecting on every call or page:
+
+    connection = db.acquire()
+    cursor = db.server_side_cursor(connection)
+    ...
+    db.release(cursor, connection)
+
+The pool holds up to DB_POOL_SIZE connections (default 4), checks that a
+connection is still alive before handing it out, and closes connections that
+have been idle for more than DB_POOL_IDLE_TIMEOUT seconds (default 300).
+A checkout waits at most DB_POOL_TIMEOUT seconds (default 30) for a free
+connection and then raises PoolTimeout, so streamers nested deeper than the
+pool is large fail loudly instead of deadlocking.
+configure_pool() replaces it with different settings. A forked child process
+(e.g. a ProcessPoolExecutor worker) starts its own pool on first use, so
+every worker pays the connect cost once.
+"""
+
+import collections
+import os
+import sqlite3
+import threading
+import time
+
+DEFAULT_POOL_SIZE = 4
+DEFAULT_IDLE_TIMEOUT = 300.0
+DEFAULT_ACQUIRE_TIMEOUT = 30.0
+
+
+def engine():
+    """Return the configured database engine name ('mysql' or 'sqlite')."""
+    return os.environ.get("DB_ENGINE", "mysql").lower()
+
+
+class Backend:
+    """How to connect to, and reuse connections of, one database engine."""
+
+    name = None
+    placeholder = "%s"
+    # True when an unread result set ties up the connection, so a stream that
+    # was abandoned midway leaves the connection unusable.
+    streams_on_connection = False
+
+    def connect(self):
+        raise NotImplementedError
+
+    def errors(self):
+        return ()
+
+    def server_side_cursor(self, connection):
+        return connection.cursor()
+
+    def is_alive(self, connection):
+        """Cheap liveness check run when the pool hands a connection out."""
+        return True
+
+    def reset(self, connection):
+        """
+        Put a connection back into a clean state before it is reused. Rolling
+        back ends any read transaction, so the next user does not see a
+        REPEATABLE READ snapshot taken by the previous one.
+        """
+        connection.rollback()
+
+
+class SQLiteBackend(Backend):
+    name = "sqlite"
+    placeholder = "?"
+
+    def __init__(self, path=None):
+        self.path = path or os.environ.get("DB_PATH", "users.db")
+
+    def connect(self):
+        # Pooled connections move between threads (e.g. prefetch workers);
+        # the pool guarantees only one thread uses a connection at a time.
+        return sqlite3.connect(self.path, check_same_thread=False)
+
+    def errors(self):
+        return (sqlite3.Error,)
+
+    def is_alive(self, connection):
+        try:
+            connection.execute("SELECT 1").close()
+        except sqlite3.Error:
+            return False
+        return True
+
+
+class MySQLBackend(Backend):
+    name = "mysql"
+    placeholder = "%s"
+    streams_on_connection = True
+
+    def __init__(self, **config):
+        self.config = {
+            "host": os.environ.get("DB_HOST", "localhost"),
+            "port": int(os.environ.get("DB_PORT", 3306)),
+            "user": os.environ.get("DB_USER", "root"),
+            "password": os.environ.get("DB_PASSWORD", "password"),
+            "database": os.environ.get("DB_NAME", "mydatabase"),
+        }
+        self.config.update(config)
+
+    def connect(self):
+        import mysql.connector
+
+        return mysql.connector.connect(**self.config)
+
+    def errors(self):
+        try:
+            import mysql.connector
+        except ImportError:
+            return ()
+        return (mysql.connector.Error,)
+
+    def server_side_cursor(self, connection):
+        return connection.cursor(buffered=False)
+
+    def is_alive(self, connection):
+        # is_connected() pings the server without reconnecting.
+        try:
+            return connection.is_connected()
+        except Exception:
+            return False
+
+
+BACKENDS = {
+    "sqlite": SQLiteBackend,
+    "mysql": MySQLBackend,
+}
+
+
+def register_backend(name, factory):
+    """Make DB_ENGINE=name use the Backend returned by factory()."""
+    BACKENDS[name.lower()] = factory
+
+
+def get_backend(name=None):
+    """Return a Backend for name (defaults to the configured engine)."""
+    name = (name or engine()).lower()
+    try:
+        factory = BACKENDS[name]
+    except KeyError:
+        raise ValueError(f"Unknown DB_ENGINE {name!r}; expected one of "
+                         f"{sorted(BACKENDS)}") from None
+    return factory()
+
+
+def connect():
+    """Open a new, unpooled connection to the configured database."""
+    return get_backend().connect()
+
+
+def errors():
+    """
+    Return the exception classes the generators should handle: PoolTimeout
+    and the driver errors of the backend the pool connects with.
+    """
+    return (PoolTimeout,) + tuple(get_pool().backend.errors())
+
+
+def backend_for(connection):
+    """
+    Return the Backend connection came from: the pool's backend while it is
+    checked out of the pool, otherwise the configured engine's.
+    """
+    pool = get_pool()
+    if pool.owns(connection):
+        return pool.backend
+    return get_backend()
+
+
+def placeholder(connection):
+    """Return the parameter marker used by the connection's driver."""
+    return backend_for(connection).placeholder
+
+
+def server_side_cursor(connection):
+    """
+    Return a cursor that streams rows from the server instead of buffering
+    the whole result set on the client.
+
+    mysql.connector cursors must be created with buffered=False for this;
+    sqlite3 cursors already step through the result one row at a time.
+    """
+    return backend_for(connection).server_side_cursor(connection)
+
+
+def close_quietly(cursor, connection):
+    """
+    Close a cursor and its connection, ignoring errors from unread results.
+
+    Closing an unbuffered MySQL cursor before the result set is exhausted
+    raises, and draining millions of unread rows just to close it would
+    defeat the point of streaming, so the connection is dropped instead.
+    """
+    if cursor is not None:
+        try:
+            cursor.close()
+        except Exception:
+            pass
+    if connection is not None:
+        try:
+            connection.close()
+        except Exception:
+            pass
+
+
+class PoolTimeout(Exception):
+    """No pooled connection became available within the timeout."""
+
+
+class ConnectionPool:
+    """
+    A thread-safe pool of at most size connections from one backend.
+
+    Idle connections are reused newest first, so the oldest ones are the
+    ones that go unused long enough to be evicted after idle_timeout
+    seconds. With health_check, a connection is checked with
+    Backend.is_alive() when it is checked out and replaced if it is dead.
+    """
+
+    def __init__(self, backend=None, size=None, idle_timeout=None,
+                 health_check=True, acquire_timeout=None):
+        self.backend = backend or get_backend()
+        if size is None:
+            size = int(os.environ.get("DB_POOL_SIZE", DEFAULT_POOL_SIZE))
+        if size < 1:
+            raise ValueError("Pool size must be at least 1")
+        if idle_timeout is None:
+            idle_timeout = float(os.environ.get("DB_POOL_IDLE_TIMEOUT",
+                                                DEFAULT_IDLE_TIMEOUT))
+        if acquire_timeout is None:
+            acquire_timeout = float(os.environ.get("DB_POOL_TIMEOUT",
+                                                   DEFAULT_ACQUIRE_TIMEOUT))
+        self.size = size
+        self.idle_timeout = idle_timeout
+        self.acquire_timeout = acquire_timeout
+        self.health_check = health_check
+        self.pid = os.getpid()
+        self._idle = collections.deque()
+        self._checked_out = 0
+        self._in_use = set()
+        self._closed = False
+        self._condition = threading.Condition()
+        self.stats = {"connects": 0, "reuses": 0, "failed_checks": 0,
+                      "evictions": 0, "discards": 0}
+
+    def _evict_idle(self):
+        """Pop connections idle too long; the caller closes them unlocked."""
+        expired = []
+        if self.idle_timeout is None:
+            return expired
+        deadline = time.monotonic() - self.idle_timeout
+        while self._idle and self._idle[0][1] < deadline:
+            expired.append(self._idle.popleft()[0])
+        self.stats["evictions"] += len(expired)
+        return expired
+
+    def acquire(self, timeout=None):
+        """
+        Check a connection out, waiting up to timeout seconds (the pool's
+        acquire_timeout by default) for one.
+        """
+        if timeout is None:
+            timeout = self.acquire_timeout
+        with self._condition:
+            if self._closed:
+                raise RuntimeError("Connection pool is closed")
+            expired = self._evict_idle()
+            ready = self._condition.wait_for(
+                lambda: self._idle or self._checked_out < self.size, timeout)
+            if not ready:
+                raise PoolTimeout(f"No connection available after {timeout}s")
+            connection = self._idle.pop()[0] if self._idle else None
+            self._checked_out += 1
+        for stale in expired:
+            close_quietly(None, stale)
+
+        counts = []
+        try:
+            if connection is not None:
+                if not self.health_check or self.backend.is_alive(connection):
+                    counts.append("reuses")
+                else:
+                    counts.append("failed_checks")
+                    close_quietly(None, connection)
+                    connection = None
+            if connection is None:
+                connection = self.backend.connect()
+                counts.append("connects")
+        except BaseException:
+            with self._condition:
+                self._count(counts)
+            self._give_back(None)
+            raise
+        with self._condition:
+            self._count(counts)
+            self._in_use.add(id(connection))
+        return connection
+
+    def _count(self, names):
+        # Called with self._condition held.
+        for name in names:
+            self.stats[name] += 1
+
+    def owns(self, connection):
+        """Whether connection is currently checked out of this pool."""
+        return id(connection) in self._in_use
+
+    def release(self, connection, discard=False):
+        """Return a connection, or close it for good with discard=True."""
+        if not self.owns(connection):
+            raise ValueError("Connection was not checked out of this pool")
+        if not discard:
+            try:
+                self.backend.reset(connection)
+            except Exception:
+                discard = True
+        with self._condition:
+            if discard:
+                self.stats["discards"] += 1
+            self._in_use.discard(id(connection))
+        if discard or self._closed:
+            close_quietly(None, connection)
+            connection = None
+        self._give_back(connection)
+
+    def _give_back(self, connection):
+        with self._condition:
+            self._checked_out -= 1
+            if connection is not None:
+                self._idle.append((connection, time.monotonic()))
+            self._condition.notify()
+
+    def close(self):
+        """Close idle connections; checked-out ones close on release."""
+        with self._condition:
+            self._closed = True
+            idle = [connection for connection, _ in self._idle]
+            self._idle.clear()
+            self._condition.notify_all()
+        for connection in idle:
+            close_quietly(None, connection)
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    """Return the process-wide pool, creating it on first use."""
+    global _pool
+    pool = _pool
+    if pool is not None and pool.pid == os.getpid():
+        return pool
+    with _pool_lock:
+        # Connections inherited across fork belong to the parent; leave them
+        # alone and start a fresh pool in this process.
+        if _pool is None or _pool.pid != os.getpid():
+            _pool = ConnectionPool()
+        return _pool
+
+
+def configure_pool(**options):
+    """Replace the process-wide pool with one built with these options."""
+    global _pool
+    with _pool_lock:
+        old, _pool = _pool, ConnectionPool(**options)
+    if old is not None and old.pid == os.getpid():
+        old.close()
+    return _pool
+
+
+def column_names(table):
+    """Return the column names of table, in order."""
+    connection = acquire()
+    cursor = None
+    try:
+        cursor = connection.cursor()
+        cursor.execute(f"SELECT * FROM {table} LIMIT 0")
+        names = [d[0] for d in cursor.description]
+        cursor.fetchall()
+        return names
+    finally:
+        release(cursor, connection)
+
+
+def acquire(timeout=None):
+    """
+    Check a connection out of the process-wide pool, waiting up to timeout
+    seconds (DB_POOL_TIMEOUT by default) before raising PoolTimeout.
+    """
+    return get_pool().acquire(timeout)
+
+
+def release(cursor, connection, abandoned=False):
+    """
+    Close cursor and hand connection back to the process-wide pool.
+
+    Pass abandoned=True when the cursor's result set was not read to the
+    end. Backends that stream results over the connection (MySQL) cannot
+    reuse it then, so it is closed rather than drained.
+    """
+    if cursor is not None:
+        try:
+            cursor.close()
+        except Exception:
+            pass
+    if connection is None:
+        return
+    pool = get_pool()
+    if not pool.owns(connection):
+        # Checked out of a pool that configure_pool() has since replaced.
+        close_quietly(None, connection)
+        return
+    pool.release(connection,
+                 discard=abandoned and pool.backend.streams_on_connection)
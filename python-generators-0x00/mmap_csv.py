@@ -0,0 +1,240 @@
+"""
+Memory-mapped CSV reader for user_data.csv style files.
+
+MmapCSVReader maps the file and scans records straight out of the mapping
+instead of copying it through a buffered text stream. records() yields
+fields as memoryview slices of the mapping, undecoded; only quoted fields
+containing doubled quotes ("") are copied.
+
+Iterating the reader decodes fields, so it takes a faster route: a line with
+no quotes, or with every field plainly quoted, is decoded whole and split in
+two C calls, then projected to the requested columns. That decodes every
+field of the line, but costs less than locating each field's bytes in
+Python. Only lines with escaped quotes or embedded line breaks go through
+the field-by-field scanner, which decodes just the requested columns.
+
+Blank lines are skipped, as csv.reader does (a line holding just "" is a
+record with one empty field, not a blank line). When columns are given,
+records too short to have all of them are skipped too, as seed._parse()
+skips short rows.
+
+    with MmapCSVReader("user_data.csv", columns=("email", "age")) as reader:
+        for email, age in reader:
+            ...
+
+It plugs into seed.insert_data() as an iterable of records and into the
+streamers through stream_csv_users() / stream_csv_batches().
+"""
+
+import mmap
+import os
+
+QUOTE = ord('"')
+COMMA = ord(',')
+CR = ord('\r')
+
+
+class MmapCSVReader:
+    """Iterate records of a CSV file through a read-only memory map."""
+
+    def __init__(self, path, columns=None, header=True, encoding="utf-8",
+                 decode=True):
+        self.path = path
+        self.encoding = encoding
+        self.decode = decode
+        self._file = open(path, "rb")
+        size = os.fstat(self._file.fileno()).st_size
+        if size:
+            self._map = mmap.mmap(self._file.fileno(), 0,
+                                  access=mmap.ACCESS_READ)
+        else:
+            self._map = b""
+        self._view = memoryview(self._map)
+        self._body = 0
+        self.header = None
+        if header:
+            first, self._body = self._parse_record(0)
+            if first is not None:
+                self.header = [self._text(field) for field in first]
+        self.indexes = self._resolve(columns)
+        # Records with fewer fields than this lack a requested column.
+        self._width = max(self.indexes) + 1 if self.indexes else 0
+
+    def _resolve(self, columns):
+        if columns is None:
+            return None
+        indexes = []
+        for column in columns:
+            if isinstance(column, int):
+                indexes.append(column)
+            elif self.header is None:
+                raise ValueError("Column names need a header row")
+            else:
+                indexes.append(self.header.index(column))
+        return indexes
+
+    def _text(self, field):
+        if isinstance(field, memoryview):
+            return str(field, self.encoding)
+        return field.decode(self.encoding)
+
+    def _parse_record(self, pos):
+        """Parse one record starting at pos; return (fields, next_pos)."""
+        data = self._map
+        size = len(data)
+        if pos >= size:
+            return None, pos
+        view = self._view
+        eol = data.find(b"\n", pos)
+        if eol < 0:
+            eol = size
+        fields = []
+        while True:
+            if pos < size and data[pos] == QUOTE:
+                start = pos + 1
+                pos = start
+                escaped = False
+                while True:
+                    end = data.find(b'"', pos)
+                    if end < 0:
+                        raise ValueError(
+                            f"Unterminated quoted field at byte {start - 1}")
+                    if end + 1 < size and data[end + 1] == QUOTE:
+                        escaped = True
+                        pos = end + 2
+                        continue
+                    break
+                field = view[start:end]
+                if escaped:
+                    field = bytes(field).replace(b'""', b'"')
+                fields.append(field)
+                pos = end + 1
+                if pos > eol:
+                    # The quoted field contained line breaks.
+                    eol = data.find(b"\n", pos)
+                    if eol < 0:
+                        eol = size
+            else:
+                end = data.find(b",", pos, eol)
+                if end < 0:
+                    end = eol
+                    if end > pos and data[end - 1] == CR:
+                        end -= 1
+                fields.append(view[pos:end])
+                pos = end
+            if pos < size and data[pos] == COMMA:
+                pos += 1
+                continue
+            return fields, eol + 1
+
+    def records(self):
+        """Yield raw field slices (memoryview, or bytes when unescaped)."""
+        data = self._map
+        pos = self._body
+        while True:
+            start = pos
+            fields, pos = self._parse_record(pos)
+            if fields is None:
+                return
+            if (len(fields) == 1 and len(fields[0]) == 0
+                    and data[start] != QUOTE):
+                continue
+            yield fields
+
+    @staticmethod
+    def _split_simple(line):
+        """Split a line with no escaped quotes or embedded separators."""
+        if '"' not in line:
+            return line.split(",")
+        if line[:1] == '"' and line[-1:] == '"':
+            fields = line[1:-1].split('","')
+            if line.count('"') == 2 * len(fields):
+                return fields
+        return None
+
+    def _decoded_records(self, indexes):
+        width = self._width
+        data = self._map
+        size = len(data)
+        encoding = self.encoding
+        text = self._text
+        pos = self._body
+        while pos < size:
+            eol = data.find(b"\n", pos)
+            if eol < 0:
+                eol = size
+            end = eol - 1 if eol > pos and data[eol - 1] == CR else eol
+            if end == pos:
+                pos = eol + 1
+                continue
+            fields = self._split_simple(data[pos:end].decode(encoding))
+            if fields is None:
+                raw, pos = self._parse_record(pos)
+                if len(raw) < width:
+                    continue
+                if indexes is not None:
+                    raw = [raw[i] for i in indexes]
+                yield tuple([text(field) for field in raw])
+                continue
+            pos = eol + 1
+            if indexes is None:
+                yield tuple(fields)
+            elif len(fields) >= width:
+                yield tuple([fields[i] for i in indexes])
+
+    def __iter__(self):
+        indexes = self.indexes
+        if self.decode:
+            yield from self._decoded_records(indexes)
+        elif indexes is None:
+            for fields in self.records():
+                yield tuple(fields)
+        else:
+            width = self._width
+            for fields in self.records():
+                if len(fields) >= width:
+                    yield tuple([fields[i] for i in indexes])
+
+    def close(self):
+        """
+        Release the mapping. Raw field slices from records() must not be used
+        afterwards; if any are still referenced the map is left for the
+        garbage collector to unmap.
+        """
+        self._view.release()
+        if isinstance(self._map, mmap.mmap):
+            try:
+                self._map.close()
+            except BufferError:
+                pass
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+def csv_records(path):
+    """Yield (name, email, age) string records, for seed.insert_data()."""
+    with MmapCSVReader(path, columns=(0, 1, 2)) as reader:
+        yield from reader
+
+
+def stream_csv_users(path, columns=None):
+    """Stream decoded records one by one, like stream_users()."""
+    with MmapCSVReader(path, columns=columns) as reader:
+        yield from reader
+
+
+def stream_csv_batches(path, batch_size, columns=None):
+    """Stream decoded records in lists, like stream_users_in_batches()."""
+    batch = []
+    for record in stream_csv_users(path, columns):
+        batch.append(record)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
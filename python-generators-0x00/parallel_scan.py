@@ -0,0 +1,187 @@
+"""
+Parallel scan of the users table over primary-key ranges.
+
+The key space is split into disjoint ranges (shards). Each shard is streamed
+on its own connection inside a ProcessPoolExecutor worker, and the per-shard
+results are either combined (aggregates) or merged back into one ordered
+stream (rows):
+
+    stats = parallel_age_statistics(workers=4)
+    for row in parallel_filtered_users(col("age") > 25, workers=4):
+        ...
+
+Worker functions must be importable top-level callables so they can be sent
+to the pool.
+"""
+
+import functools
+import heapq
+import operator
+import uuid
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+db = __import__('db')
+predicates = __import__('predicates')
+col = predicates.col
+
+HEX_DIGITS = 8
+
+
+def _is_uuid(value):
+    try:
+        uuid.UUID(str(value))
+    except ValueError:
+        return False
+    return True
+
+
+def key_ranges(shards, key="user_id", connection=None):
+    """
+    Split the key space of users into shards half-open (low, high) ranges.
+
+    None marks an open end. Integer keys are split arithmetically between
+    MIN and MAX, UUID keys by their leading hex digits (uniform for random,
+    lower-case UUIDs), and any other key by probing the key at evenly spaced
+    offsets.
+    """
+    if shards < 1:
+        raise ValueError("shards must be at least 1")
+    name = col(key).name
+    own_connection = connection is None
+    if own_connection:
+        connection = db.acquire()
+    cursor = None
+    try:
+        cursor = connection.cursor()
+        cursor.execute(f"SELECT MIN({name}), MAX({name}), COUNT(*) FROM users")
+        low, high, count = cursor.fetchone()
+        if shards == 1 or count == 0:
+            return [(None, None)]
+
+        if isinstance(low, int) and isinstance(high, int):
+            step = (high - low + 1) / shards
+            bounds = sorted({low + int(step * i) for i in range(1, shards)})
+        elif _is_uuid(low) and _is_uuid(high):
+            space = 16 ** HEX_DIGITS
+            bounds = [format(space * i // shards, f"0{HEX_DIGITS}x")
+                      for i in range(1, shards)]
+        else:
+            marker = db.placeholder(connection)
+            bounds = []
+            for i in range(1, shards):
+                cursor.execute(
+                    f"SELECT {name} FROM users ORDER BY {name} "
+                    f"LIMIT 1 OFFSET {marker}", (count * i // shards,))
+                bounds.append(cursor.fetchone()[0])
+            bounds = sorted(set(bounds))
+    finally:
+        if own_connection:
+            db.release(cursor, connection)
+        elif cursor is not None:
+            cursor.close()
+
+    edges = [None] + bounds + [None]
+    return list(zip(edges[:-1], edges[1:]))
+
+
+def shard_filter(key, low, high):
+    """Return the predicates expression selecting key in [low, high)."""
+    terms = []
+    if low is not None:
+        terms.append(col(key) >= low)
+    if high is not None:
+        terms.append(col(key) < high)
+    if not terms:
+        return None
+    return functools.reduce(operator.and_, terms)
+
+
+def _scan_shard(func, key, low, high, where, batch_size, order_by):
+    batches = __import__('1-batch_processing').stream_users_in_batches
+    shard = shard_filter(key, low, high)
+    if where is not None:
+        shard = where if shard is None else shard & where
+    return func(batches(batch_size, where=shard, order_by=order_by,
+                        raise_errors=True))
+
+
+def parallel_scan(func, combine=None, workers=4, shards=None, key="user_id",
+                  where=None, batch_size=1000, order_by=None, ranges=None):
+    """
+    Run func(batches) on every shard of users in a process pool.
+
+    func receives the batch generator of one shard and returns a partial
+    result. With combine, partial results are folded with
+    combine(accumulated, partial) and the total is returned; otherwise a
+    list of partial results in shard order is returned. shards defaults to
+    workers; ranges overrides key_ranges() entirely.
+    """
+    if ranges is None:
+        ranges = key_ranges(shards or workers, key=key)
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = {
+            pool.submit(_scan_shard, func, key, low, high, where, batch_size,
+                        order_by): index
+            for index, (low, high) in enumerate(ranges)
+        }
+        if combine is not None:
+            total = None
+            for future in as_completed(futures):
+                partial = future.result()
+                total = partial if total is None else combine(total, partial)
+            return total
+        results = [None] * len(ranges)
+        for future in as_completed(futures):
+            results[futures[future]] = future.result()
+        return results
+
+
+def _collect_rows(batches):
+    rows = []
+    for batch in batches:
+        rows.extend(batch)
+    return rows
+
+
+def _column_positions(names):
+    columns = db.column_names("users")
+    return [columns.index(name) for name in names]
+
+
+def _age_statistics(batches):
+    stats = __import__('stream_stats').StreamStatistics()
+    age, = _column_positions(["age"])
+    for batch in batches:
+        for row in batch:
+            stats.update(row[age])
+    return stats
+
+
+def parallel_filtered_users(where=None, workers=4, key="user_id",
+                            order_by=None, batch_size=1000):
+    """
+    Yield the users matching where, scanned in parallel.
+
+    Rows come out in order_by order (the shard key by default): each shard
+    is sorted by the database and the sorted shards are merged with a heap.
+    Shards are materialized in the workers, so this trades memory for speed.
+    """
+    order_by = tuple(order_by or (key,))
+    partials = parallel_scan(_collect_rows, workers=workers, key=key,
+                             where=where, batch_size=batch_size,
+                             order_by=order_by)
+    if order_by == (key,):
+        for rows in partials:
+            yield from rows
+        return
+    positions = _column_positions(order_by)
+    sort_key = operator.itemgetter(*positions)
+    yield from heapq.merge(*partials, key=sort_key)
+
+
+def parallel_age_statistics(workers=4, where=None, key="user_id",
+                            batch_size=1000):
+    """Return a StreamStatistics of ages combined from every shard."""
+    return parallel_scan(_age_statistics, combine=lambda a, b: a.merge(b),
+                         workers=workers, key=key, where=where,
+                         batch_size=batch_size)
@@ -0,0 +1,281 @@
+"""
+Composable generator pipelines with bounded buffers.
+
+A Pipeline chains stages over one of the user streamers:
+
+    report = (Pipeline.users()
+              .filter(lambda user: user[3] > 25)
+              .map(enrich, workers=4)
+              .batch(500)
+              .sink(write_batch))
+
+Every stage runs on its own thread and hands items downstream through a
+queue of at most `buffer` items (see prefetch), so a slow stage stalls the
+stages before it instead of letting memory grow. map() can fan out over a
+thread or process pool while keeping items in order.
+
+Each stage records items in/out and how its time splits between working,
+waiting on its input and being blocked by a full downstream buffer; the stage
+with the most busy time is the bottleneck.
+"""
+
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+prefetcher = __import__('prefetch')
+stream_ops = __import__('stream_ops')
+
+
+class StageStats:
+    """Throughput and time breakdown of one pipeline stage."""
+
+    def __init__(self, name):
+        self.name = name
+        self.items_in = 0
+        self.items_out = 0
+        self.wait_seconds = 0.0
+        self.blocked_seconds = 0.0
+        self.started = None
+        self.finished = None
+
+    @property
+    def elapsed(self):
+        if self.started is None:
+            return 0.0
+        return (self.finished or time.perf_counter()) - self.started
+
+    @property
+    def busy_seconds(self):
+        idle = self.wait_seconds + self.blocked_seconds
+        return max(self.elapsed - idle, 0.0)
+
+    @property
+    def throughput(self):
+        """Items emitted per second of wall time."""
+        return self.items_out / self.elapsed if self.elapsed else 0.0
+
+    def as_dict(self):
+        return {
+            "stage": self.name,
+            "items_in": self.items_in,
+            "items_out": self.items_out,
+            "elapsed": self.elapsed,
+            "busy_seconds": self.busy_seconds,
+            "wait_seconds": self.wait_seconds,
+            "blocked_seconds": self.blocked_seconds,
+            "throughput": self.throughput,
+        }
+
+
+def _instrument(transform, upstream, stats, source=False):
+    """
+    Run transform over upstream, accounting time to the stage stats.
+
+    For the source stage, time spent pulling from upstream is the stage's own
+    work (querying the database), so it is not counted as waiting.
+    """
+    def counted(iterator):
+        while True:
+            started = time.perf_counter()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+            finally:
+                if not source:
+                    stats.wait_seconds += time.perf_counter() - started
+            stats.items_in += 1
+            yield item
+
+    stats.started = time.perf_counter()
+    try:
+        for item in transform(counted(iter(upstream))):
+            stats.items_out += 1
+            started = time.perf_counter()
+            yield item
+            stats.blocked_seconds += time.perf_counter() - started
+    finally:
+        stats.finished = time.perf_counter()
+
+
+def _map(fn):
+    def transform(items):
+        for item in items:
+            yield fn(item)
+    return transform
+
+
+def _parallel_map(fn, workers, mode):
+    if mode == "process":
+        executor_class = ProcessPoolExecutor
+    else:
+        executor_class = ThreadPoolExecutor
+
+    def transform(items):
+        with executor_class(max_workers=workers) as pool:
+            pending = deque()
+            for item in items:
+                pending.append(pool.submit(fn, item))
+                if len(pending) >= workers * 2:
+                    yield pending.popleft().result()
+            while pending:
+                yield pending.popleft().result()
+    return transform
+
+
+def _filter(predicate):
+    def transform(items):
+        for item in items:
+            if predicate(item):
+                yield item
+    return transform
+
+
+def _flatten(items):
+    for group in items:
+        yield from group
+
+
+def _batch(size):
+    def transform(items):
+        batch = []
+        for item in items:
+            batch.append(item)
+            if len(batch) >= size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+    return transform
+
+
+def _window(size, step):
+    def transform(items):
+        return stream_ops.count_windows(items, size, step)
+    return transform
+
+
+def _time_window(time_key, width, step):
+    def transform(items):
+        return stream_ops.time_windows(items, time_key, width, step)
+    return transform
+
+
+class Pipeline:
+    """A source followed by a chain of stages, run lazily."""
+
+    def __init__(self, source, buffer=16, name="source"):
+        self.source = source
+        self.buffer = buffer
+        self.stages = [(name, None)]
+        self.stats = []
+
+    @classmethod
+    def users(cls, **kwargs):
+        """Pipeline over stream_users() rows."""
+        stream_users = __import__('0-stream_users').stream_users
+        return cls(stream_users, name="stream_users", **kwargs)
+
+    @classmethod
+    def user_batches(cls, batch_size, buffer=16, **kwargs):
+        """Pipeline over stream_users_in_batches(batch_size, **kwargs)."""
+        batches = __import__('1-batch_processing').stream_users_in_batches
+        return cls(lambda: batches(batch_size, **kwargs), buffer=buffer,
+                   name="stream_users_in_batches")
+
+    @classmethod
+    def user_pages(cls, pagesize, **kwargs):
+        """Pipeline over lazy_pagination(pagesize) pages."""
+        lazy_pagination = __import__('2-lazy_paginate').lazy_pagination
+        return cls(lambda: lazy_pagination(pagesize), name="lazy_pagination",
+                   **kwargs)
+
+    @classmethod
+    def user_ages(cls, **kwargs):
+        """Pipeline over stream_user_ages() values."""
+        stream_user_ages = __import__('4-stream_ages').stream_user_ages
+        return cls(stream_user_ages, name="stream_user_ages", **kwargs)
+
+    def _add(self, name, transform):
+        self.stages.append((name, transform))
+        return self
+
+    def map(self, fn, workers=1, mode="thread", name="map"):
+        """Apply fn to every item, optionally on a thread or process pool."""
+        if mode not in ("thread", "process"):
+            raise ValueError("mode must be 'thread' or 'process'")
+        if workers > 1:
+            return self._add(name, _parallel_map(fn, workers, mode))
+        return self._add(name, _map(fn))
+
+    def filter(self, predicate, name="filter"):
+        return self._add(name, _filter(predicate))
+
+    def flatten(self, name="flatten"):
+        """Turn a stream of batches or pages back into single items."""
+        return self._add(name, _flatten)
+
+    def batch(self, size, name="batch"):
+        return self._add(name, _batch(size))
+
+    def window(self, size, step=None, name="window"):
+        """
+        Count-based windows of size items, advancing step items each time.
+
+        step defaults to size (tumbling windows), in which case a final
+        partial window is also emitted; a smaller step gives overlapping
+        sliding windows, which are only emitted when full.
+        """
+        return self._add(name, _window(size, step or size))
+
+    def time_window(self, time_key, width, step=None, name="time_window"):
+        """(start, items) windows by time_key; see stream_ops.time_windows."""
+        return self._add(name, _time_window(time_key, width, step))
+
+    def __iter__(self):
+        self.stats = []
+        source = self.source
+        stream = source() if callable(source) else source
+        for name, transform in self.stages:
+            stats = StageStats(name)
+            self.stats.append(stats)
+            stream = prefetcher.prefetch(
+                _instrument(transform or iter, stream, stats,
+                            source=transform is None),
+                depth=self.buffer)
+        return iter(stream)
+
+    def sink(self, fn, name="sink"):
+        """Run the pipeline, passing every output item to fn."""
+        stats = StageStats(name)
+        stats.started = time.perf_counter()
+        items = iter(self)
+        try:
+            while True:
+                started = time.perf_counter()
+                try:
+                    item = next(items)
+                except StopIteration:
+                    break
+                finally:
+                    stats.wait_seconds += time.perf_counter() - started
+                stats.items_in += 1
+                fn(item)
+                stats.items_out += 1
+        finally:
+            stats.finished = time.perf_counter()
+            self.stats.append(stats)
+        return self.report()
+
+    def collect(self):
+        return list(self)
+
+    def report(self):
+        """Per-stage statistics, plus the stage with the most busy time."""
+        stages = [stats.as_dict() for stats in self.stats]
+        bottleneck = max(stages, key=lambda s: s["busy_seconds"], default=None)
+        return {
+            "stages": stages,
+            "bottleneck": bottleneck["stage"] if bottleneck else None,
+        }
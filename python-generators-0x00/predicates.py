@@ -0,0 +1,459 @@
+"""
+Small filter-expression API for the batch streamers.
+
+Expressions are built from col() and compile to a parameterized WHERE clause
+so filtering happens on the database server:
+
+    where = (col("age") > 25) & col("email").like("%@gmail.com")
+    for batch in stream_users_in_batches(1000, where=where):
+        ...
+
+Anything that cannot be expressed in SQL (col(...).test(func)) is evaluated
+in-process instead. split() separates the parts of an expression that can be
+pushed down from the residual that has to run on the client.
+
+evaluate() follows SQL's three-valued logic, so the client keeps exactly
+the rows the server would: a comparison with NULL is unknown (None), NOT
+unknown is unknown, AND/OR combine unknowns as SQL does, and only rows the
+expression is true for pass bind()'s predicate.
+
+mask() evaluates an expression over a batch of NumPy column arrays at
+once, with the same three-valued logic, and returns a boolean array of the
+rows to keep.
+
+may_match() checks an expression against per-column min/max statistics, so
+readers of chunked files (see columnar) can skip chunks no row of which can
+match.
+"""
+
+import operator
+import re
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+_IDENTIFIER = re.compile(r"^[A-Za-z_][A-Za-z0-9_]*$")
+
+
+class NotPushable(Exception):
+    """Raised when an expression cannot be compiled to SQL."""
+
+
+def _like_to_regex(pattern):
+    # Case-insensitive, like LIKE under the default MySQL and SQLite collations.
+    parts = []
+    for char in pattern:
+        if char == "%":
+            parts.append(".*")
+        elif char == "_":
+            parts.append(".")
+        else:
+            parts.append(re.escape(char))
+    return re.compile("^" + "".join(parts) + "$", re.DOTALL | re.IGNORECASE)
+
+
+def _like(value, pattern):
+    return _like_to_regex(pattern).match(str(value)) is not None
+
+
+def _nulls(values):
+    if values.dtype == object:
+        return np.fromiter((value is None for value in values), bool,
+                           len(values))
+    if values.dtype.kind == "f":
+        # Numeric columns holding NULLs are built as floats with NaN.
+        return np.isnan(values)
+    return np.zeros(len(values), bool)
+
+
+class Expr:
+    """Base class for filter expressions."""
+
+    def __and__(self, other):
+        return And(self, other)
+
+    def __or__(self, other):
+        return Or(self, other)
+
+    def __invert__(self):
+        return Not(self)
+
+    def columns(self):
+        """Return the set of column names the expression reads."""
+        raise NotImplementedError
+
+    def to_sql(self, marker="%s"):
+        """Return (sql, params) using marker as the parameter placeholder."""
+        raise NotImplementedError
+
+    def evaluate(self, row):
+        """
+        Evaluate the expression against a mapping of column -> value:
+        True, False, or None where SQL's result would be unknown (NULL).
+        """
+        raise NotImplementedError
+
+    def mask(self, columns):
+        """
+        Evaluate the expression over a mapping of column -> NumPy array;
+        return a boolean array that is True where it is true.
+        """
+        return self.masks(columns)[0]
+
+    def masks(self, columns):
+        """Return boolean arrays (true, unknown) over columns' rows."""
+        raise NotImplementedError
+
+    def may_match(self, stats):
+        """
+        Return False only if no row summarized by stats can match.
+
+        stats maps column names to objects with min, max, null_count and
+        count attributes; columns missing from it are assumed to match.
+        """
+        return True
+
+    def pushable(self):
+        try:
+            self.to_sql()
+        except NotPushable:
+            return False
+        return True
+
+    def bind(self, names):
+        """Return a predicate over row tuples laid out as names."""
+        names = list(names)
+        missing = self.columns() - set(names)
+        if missing:
+            raise KeyError(f"Unknown column(s) in filter: {sorted(missing)}")
+        return lambda row: self.evaluate(dict(zip(names, row))) is True
+
+
+class Column:
+    """A column reference; comparisons on it produce expressions."""
+
+    def __init__(self, name):
+        if not _IDENTIFIER.match(name):
+            raise ValueError(f"Invalid column name: {name!r}")
+        self.name = name
+
+    def __eq__(self, value):
+        return Comparison(self.name, "=", value)
+
+    def __ne__(self, value):
+        return Comparison(self.name, "<>", value)
+
+    def __lt__(self, value):
+        return Comparison(self.name, "<", value)
+
+    def __le__(self, value):
+        return Comparison(self.name, "<=", value)
+
+    def __gt__(self, value):
+        return Comparison(self.name, ">", value)
+
+    def __ge__(self, value):
+        return Comparison(self.name, ">=", value)
+
+    __hash__ = None
+
+    def like(self, pattern):
+        return Comparison(self.name, "LIKE", pattern)
+
+    def isin(self, values):
+        return In(self.name, values)
+
+    def between(self, low, high):
+        return (self >= low) & (self <= high)
+
+    def is_null(self):
+        return IsNull(self.name)
+
+    def test(self, func):
+        """Filter with an arbitrary Python callable (never pushed down)."""
+        return Test(self.name, func)
+
+
+def col(name):
+    return Column(name)
+
+
+class Comparison(Expr):
+    OPERATORS = {
+        "=": operator.eq,
+        "<>": operator.ne,
+        "<": operator.lt,
+        "<=": operator.le,
+        ">": operator.gt,
+        ">=": operator.ge,
+        "LIKE": _like,
+    }
+
+    def __init__(self, column, op, value):
+        self.column = column
+        self.op = op
+        self.value = value
+
+    def columns(self):
+        return {self.column}
+
+    def to_sql(self, marker="%s"):
+        return f"{self.column} {self.op} {marker}", [self.value]
+
+    def evaluate(self, row):
+        value = row[self.column]
+        if value is None or self.value is None:
+            return None
+        return bool(self.OPERATORS[self.op](value, self.value))
+
+    def masks(self, columns):
+        values = columns[self.column]
+        if self.value is None:
+            return np.zeros(len(values), bool), np.ones(len(values), bool)
+        nulls = _nulls(values)
+        true = np.zeros(len(values), bool)
+        known = ~nulls
+        if known.any():
+            present = values[known]
+            if self.op == "LIKE":
+                regex = _like_to_regex(self.value)
+                true[known] = np.fromiter(
+                    (regex.match(str(value)) is not None
+                     for value in present), bool, len(present))
+            else:
+                true[known] = self.OPERATORS[self.op](present, self.value)
+        return true, nulls
+
+    def may_match(self, stats):
+        column = stats.get(self.column)
+        if column is None or self.op in ("LIKE", "<>"):
+            return True
+        if self.value is None or column.null_count == column.count:
+            return False
+        low, high, value = column.min, column.max, self.value
+        if low is None or high is None:
+            return True
+        try:
+            if self.op == "=":
+                return low <= value <= high
+            if self.op == "<":
+                return low < value
+            if self.op == "<=":
+                return low <= value
+            if self.op == ">":
+                return high > value
+            return high >= value
+        except TypeError:
+            return True
+
+    def __repr__(self):
+        return f"col({self.column!r}) {self.op} {self.value!r}"
+
+
+class In(Expr):
+    def __init__(self, column, values):
+        self.column = column
+        self.values = list(values)
+
+    def columns(self):
+        return {self.column}
+
+    def to_sql(self, marker="%s"):
+        if not self.values:
+            return "1 = 0", []
+        markers = ", ".join([marker] * len(self.values))
+        return f"{self.column} IN ({markers})", list(self.values)
+
+    def evaluate(self, row):
+        value = row[self.column]
+        if not self.values:
+            return False
+        if value is None:
+            return None
+        if value in self.values:
+            return True
+        # x IN (..., NULL) is unknown rather than false when x is not found.
+        return None if None in self.values else False
+
+    def masks(self, columns):
+        values = columns[self.column]
+        if not self.values:
+            return np.zeros(len(values), bool), np.zeros(len(values), bool)
+        nulls = _nulls(values)
+        true = np.zeros(len(values), bool)
+        known = ~nulls
+        candidates = [value for value in self.values if value is not None]
+        if known.any() and candidates:
+            true[known] = np.isin(values[known], candidates)
+        unknown = nulls
+        if None in self.values:
+            unknown = unknown | (known & ~true)
+        return true, unknown
+
+    def may_match(self, stats):
+        return any(Comparison(self.column, "=", value).may_match(stats)
+                   for value in self.values)
+
+
+class IsNull(Expr):
+    def __init__(self, column):
+        self.column = column
+
+    def columns(self):
+        return {self.column}
+
+    def to_sql(self, marker="%s"):
+        return f"{self.column} IS NULL", []
+
+    def evaluate(self, row):
+        return row[self.column] is None
+
+    def masks(self, columns):
+        values = columns[self.column]
+        return _nulls(values), np.zeros(len(values), bool)
+
+    def may_match(self, stats):
+        column = stats.get(self.column)
+        return column is None or column.null_count > 0
+
+
+class Test(Expr):
+    def __init__(self, column, func):
+        self.column = column
+        self.func = func
+
+    def columns(self):
+        return {self.column}
+
+    def to_sql(self, marker="%s"):
+        raise NotPushable(f"Python test on {self.column!r} cannot run in SQL")
+
+    def evaluate(self, row):
+        return bool(self.func(row[self.column]))
+
+    def masks(self, columns):
+        values = columns[self.column]
+        nulls = _nulls(values)
+        # Call func with None for NULLs, as evaluate() does.
+        true = np.fromiter(
+            (bool(self.func(None if null else value))
+             for value, null in zip(values.tolist(), nulls)),
+            bool, len(values))
+        return true, np.zeros(len(values), bool)
+
+
+class And(Expr):
+    keyword = "AND"
+
+    def __init__(self, *terms):
+        self.terms = terms
+
+    def columns(self):
+        return set().union(*(term.columns() for term in self.terms))
+
+    def to_sql(self, marker="%s"):
+        clauses, params = [], []
+        for term in self.terms:
+            sql, term_params = term.to_sql(marker)
+            clauses.append(f"({sql})")
+            params.extend(term_params)
+        return f" {self.keyword} ".join(clauses), params
+
+    def evaluate(self, row):
+        result = True
+        for term in self.terms:
+            value = term.evaluate(row)
+            if value is False:
+                return False
+            if value is None:
+                result = None
+        return result
+
+    def masks(self, columns):
+        true, unknown = self.terms[0].masks(columns)
+        false = ~(true | unknown)
+        for term in self.terms[1:]:
+            term_true, term_unknown = term.masks(columns)
+            true = true & term_true
+            false = false | ~(term_true | term_unknown)
+        return true, ~(true | false)
+
+    def may_match(self, stats):
+        return all(term.may_match(stats) for term in self.terms)
+
+
+class Or(And):
+    keyword = "OR"
+
+    def evaluate(self, row):
+        result = False
+        for term in self.terms:
+            value = term.evaluate(row)
+            if value is True:
+                return True
+            if value is None:
+                result = None
+        return result
+
+    def masks(self, columns):
+        true, unknown = self.terms[0].masks(columns)
+        false = ~(true | unknown)
+        for term in self.terms[1:]:
+            term_true, term_unknown = term.masks(columns)
+            true = true | term_true
+            false = false & ~(term_true | term_unknown)
+        return true, ~(true | false)
+
+    def may_match(self, stats):
+        return any(term.may_match(stats) for term in self.terms)
+
+
+class Not(Expr):
+    def __init__(self, term):
+        self.term = term
+
+    def columns(self):
+        return self.term.columns()
+
+    def to_sql(self, marker="%s"):
+        sql, params = self.term.to_sql(marker)
+        return f"NOT ({sql})", params
+
+    def evaluate(self, row):
+        value = self.term.evaluate(row)
+        return None if value is None else not value
+
+    def masks(self, columns):
+        true, unknown = self.term.masks(columns)
+        return ~(true | unknown), unknown
+
+
+def _conjuncts(expr):
+    if type(expr) is And:
+        for term in expr.terms:
+            yield from _conjuncts(term)
+    else:
+        yield expr
+
+
+def split(expr):
+    """
+    Split expr into (pushable, residual), either of which may be None.
+
+    Top-level AND terms are pushed down individually, so a filter mixing SQL
+    comparisons with a Python test still sends the comparisons to the server.
+    """
+    if expr is None:
+        return None, None
+    pushable, residual = [], []
+    for term in _conjuncts(expr):
+        (pushable if term.pushable() else residual).append(term)
+
+    def combine(terms):
+        if not terms:
+            return None
+        return terms[0] if len(terms) == 1 else And(*terms)
+
+    return combine(pushable), combine(residual)
@@ -0,0 +1,71 @@
+"""
+Background prefetching for generators.
+
+prefetch() runs an iterator on a worker thread and hands its items over
+through a bounded queue, so the next batch is fetched from the database while
+the caller is still processing the current one:
+
+    for batch in prefetch(stream_users_in_batches(1000), depth=2):
+        process(batch)
+
+depth bounds how many items may be buffered ahead of the consumer. An
+exception raised by the source is re-raised in the consumer, and closing the
+consumer (break, close() or garbage collection) stops the worker and closes
+the source on the worker thread.
+"""
+
+import queue
+import threading
+
+_DONE = object()
+
+
+class _Failure:
+    def __init__(self, error):
+        self.error = error
+
+
+def prefetch(iterable, depth=2, poll_interval=0.1):
+    """Yield the items of iterable, fetched ahead on a background thread."""
+    if depth < 1:
+        raise ValueError("depth must be at least 1")
+    buffer = queue.Queue(maxsize=depth)
+    stop = threading.Event()
+
+    def put(item):
+        while not stop.is_set():
+            try:
+                buffer.put(item, timeout=poll_interval)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def produce():
+        iterator = iter(iterable)
+        try:
+            for item in iterator:
+                if not put(item):
+                    return
+        except BaseException as error:
+            put(_Failure(error))
+            return
+        finally:
+            close = getattr(iterator, "close", None)
+            if close is not None:
+                close()
+        put(_DONE)
+
+    worker = threading.Thread(target=produce, name="prefetch", daemon=True)
+    worker.start()
+    try:
+        while True:
+            item = buffer.get()
+            if item is _DONE:
+                return
+            if isinstance(item, _Failure):
+                raise item.error
+            yield item
+    finally:
+        stop.set()
+        worker.join()
@@ -2,27 +2,246 @@
 """
 Database seeding script for ALX_prodev MySQL database.
 This script reads user data from CSV file and populates the user_data table.
+
+insert_data() is a bulk loader: the CSV is read in chunks, each chunk is
+written with one batched executemany (or LOAD DATA LOCAL INFILE) inside its
+own transaction, and rows are upserted on user_id. user_id is derived from
+the email address, so re-running the seed updates existing rows instead of
+duplicating them.
 """
 
-seed = __import__('seed')
+import csv
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+import uuid
 
-connection = seed.connect_db()
-if connection:
-    seed.create_database(connection)
-    connection.close()
-    print(f"connection successful")
+db = __import__('db')
+mmap_csv = __import__('mmap_csv')
 
-    connection = seed.connect_to_prodev()
+DB_NAME = "ALX_prodev"
+CHUNK_SIZE = 10000
+USER_ID_NAMESPACE = uuid.UUID("4f1d2c8e-6a55-4c1b-9d7e-2b0f6a9e3c11")
 
-    if connection:
-        seed.create_table(connection)
-        seed.insert_data(connection, 'user_data.csv')
-        cursor = connection.cursor()
-        cursor.execute(f"SELECT SCHEMA_NAME FROM INFORMATION_SCHEMA.SCHEMATA WHERE SCHEMA_NAME = 'ALX_prodev';")
-        result = cursor.fetchone()
-        if result:
-            print(f"Database ALX_prodev is present ")
-        cursor.execute(f"SELECT * FROM user_data LIMIT 5;")
-        rows = cursor.fetchall()
-        print(rows)
+MYSQL_TABLE = """
+CREATE TABLE IF NOT EXISTS user_data (
+    user_id CHAR(36) PRIMARY KEY,
+    name VARCHAR(255) NOT NULL,
+    email VARCHAR(255) NOT NULL,
+    age DECIMAL(3,0) NOT NULL,
+    INDEX idx_email (email)
+)
+"""
+
+SQLITE_TABLE = """
+CREATE TABLE IF NOT EXISTS user_data (
+    user_id TEXT PRIMARY KEY,
+    name TEXT NOT NULL,
+    email TEXT NOT NULL,
+    age INTEGER NOT NULL
+)
+"""
+
+MYSQL_UPSERT = (
+    "INSERT INTO user_data (user_id, name, email, age) "
+    "VALUES (%s, %s, %s, %s) "
+    "ON DUPLICATE KEY UPDATE name = VALUES(name), email = VALUES(email), "
+    "age = VALUES(age)"
+)
+
+SQLITE_UPSERT = (
+    "INSERT INTO user_data (user_id, name, email, age) "
+    "VALUES (?, ?, ?, ?) "
+    "ON CONFLICT(user_id) DO UPDATE SET name = excluded.name, "
+    "email = excluded.email, age = excluded.age"
+)
+
+
+def _is_sqlite(connection):
+    return isinstance(connection, sqlite3.Connection)
+
+
+def _mysql_connect(**extra):
+    import mysql.connector
+
+    try:
+        return mysql.connector.connect(
+            host=os.environ.get("DB_HOST", "localhost"),
+            port=int(os.environ.get("DB_PORT", 3306)),
+            user=os.environ.get("DB_USER", "root"),
+            password=os.environ.get("DB_PASSWORD", "password"),
+            allow_local_infile=True,
+            **extra
+        )
+    except mysql.connector.Error as err:
+        print(f"Error: {err}")
+        return None
+
+
+def connect_db():
+    """Connect to the database server (no database selected)."""
+    if db.engine() == "sqlite":
+        return db.connect()
+    return _mysql_connect()
+
+
+def create_database(connection):
+    if _is_sqlite(connection):
+        return
+    cursor = connection.cursor()
+    cursor.execute(f"CREATE DATABASE IF NOT EXISTS {DB_NAME}")
+    cursor.close()
+
+
+def connect_to_prodev():
+    """Connect to the ALX_prodev database."""
+    if db.engine() == "sqlite":
+        return db.connect()
+    return _mysql_connect(database=DB_NAME)
+
+
+def create_table(connection):
+    cursor = connection.cursor()
+    cursor.execute(SQLITE_TABLE if _is_sqlite(connection) else MYSQL_TABLE)
+    connection.commit()
+    cursor.close()
+
+
+def user_id_for(email):
+    """Deterministic user_id, so reloading the same user is an update."""
+    return str(uuid.uuid5(USER_ID_NAMESPACE, email.strip().lower()))
+
+
+def _parse(record):
+    """Validate one (name, email, age) record; return None to skip it."""
+    if len(record) < 3:
+        return None
+    name, email, age = (field.strip() for field in record[:3])
+    if not name or not email:
+        return None
+    try:
+        age = int(age)
+    except ValueError:
+        return None
+    if not 0 <= age <= 150:
+        return None
+    return (user_id_for(email), name, email, age)
+
+
+def csv_records(csv_file):
+    """Yield raw (name, email, age) records, skipping the CSV header."""
+    with open(csv_file, newline="", encoding="utf-8") as handle:
+        reader = csv.reader(handle)
+        next(reader, None)
+        yield from reader
+
+
+def read_csv_chunks(records, chunk_size=CHUNK_SIZE):
+    """Yield lists of up to chunk_size validated user_data rows."""
+    chunk = []
+    for record in records:
+        row = _parse(record)
+        if row is None:
+            continue
+        chunk.append(row)
+        if len(chunk) >= chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def _load_data_infile(cursor, chunk):
+    """Write a chunk to a temporary file and LOAD DATA LOCAL INFILE it."""
+    with tempfile.NamedTemporaryFile("w", suffix=".csv", newline="",
+                                     encoding="utf-8", delete=False) as handle:
+        csv.writer(handle).writerows(chunk)
+        path = handle.name
+    try:
+        cursor.execute(
+            "LOAD DATA LOCAL INFILE %s REPLACE INTO TABLE user_data "
+            "CHARACTER SET utf8mb4 FIELDS TERMINATED BY ',' "
+            "OPTIONALLY ENCLOSED BY '\"' ESCAPED BY '' "
+            "LINES TERMINATED BY '\\r\\n' "
+            "(user_id, name, email, age)", (path,))
+    finally:
+        os.remove(path)
+
+
+def insert_data(connection, data, chunk_size=CHUNK_SIZE, method="executemany",
+                progress=True, reader="csv"):
+    """
+    Bulk load users into user_data and return the number of rows written.
+
+    data is a CSV path or an iterable of (name, email, age) records. Each
+    chunk is committed on its own, so a failure only rolls back the chunk in
+    flight and a re-run picks up where it stopped. method="load_data" uses
+    LOAD DATA LOCAL INFILE on MySQL (the server must allow local_infile).
+    reader="mmap" parses a CSV path through mmap_csv instead of the csv
+    module.
+    """
+    if method not in ("executemany", "load_data"):
+        raise ValueError(f"Unknown insert method: {method!r}")
+    sqlite = _is_sqlite(connection)
+    if sqlite and method == "load_data":
+        method = "executemany"
+    if reader not in ("csv", "mmap"):
+        raise ValueError(f"Unknown CSV reader: {reader!r}")
+    if isinstance(data, (str, os.PathLike)):
+        if reader == "mmap":
+            records = mmap_csv.csv_records(data)
+        else:
+            records = csv_records(data)
+    else:
+        records = data
+    upsert = SQLITE_UPSERT if sqlite else MYSQL_UPSERT
+
+    cursor = connection.cursor()
+    total = 0
+    started = time.perf_counter()
+    try:
+        for chunk in read_csv_chunks(records, chunk_size):
+            try:
+                if method == "load_data":
+                    _load_data_infile(cursor, chunk)
+                else:
+                    cursor.executemany(upsert, chunk)
+                connection.commit()
+            except Exception:
+                connection.rollback()
+                raise
+            total += len(chunk)
+            if progress:
+                rate = total / max(time.perf_counter() - started, 1e-9)
+                print(f"✓ Processed {total} records ({rate:,.0f} rows/sec)")
+    finally:
         cursor.close()
+    return total
+
+
+if __name__ == "__main__":
+    csv_path = sys.argv[1] if len(sys.argv) > 1 else 'user_data.csv'
+
+    connection = connect_db()
+    if connection:
+        create_database(connection)
+        connection.close()
+        print(f"connection successful")
+
+        connection = connect_to_prodev()
+
+        if connection:
+            create_table(connection)
+            insert_data(connection, csv_path)
+            cursor = connection.cursor()
+            if not _is_sqlite(connection):
+                cursor.execute(f"SELECT SCHEMA_NAME FROM INFORMATION_SCHEMA.SCHEMATA WHERE SCHEMA_NAME = 'ALX_prodev';")
+                result = cursor.fetchone()
+                if result:
+                    print(f"Database ALX_prodev is present ")
+            cursor.execute(f"SELECT * FROM user_data LIMIT 5;")
+            rows = cursor.fetchall()
+            print(rows)
+            cursor.close()
@@ -0,0 +1,346 @@
+"""
+Approximate distinct counts and heavy hitters over streamed columns.
+
+Exact answers need a set or a counter holding every distinct value, which is
+too much memory for tens of millions of emails. These sketches trade a
+bounded, configurable error for a fixed memory footprint:
+
+* HyperLogLog(error) counts distinct values. The relative standard error is
+  about 1.04 / sqrt(2 ** precision), in 2 ** precision bytes.
+* CountMinSketch(epsilon, delta) estimates the frequency of any value. It
+  never underestimates, and overestimates by more than epsilon * total with
+  probability at most delta.
+* SpaceSaving(error) keeps the most frequent values in 1 / error counters.
+  Every value occurring more than error * total times is kept, and each
+  count overestimates by at most its recorded error (<= error * total).
+
+All three have update(value), update_many(values) and merge(other), like the
+statistics in stream_stats. They can be used as Pipeline sinks or fed from
+stream_users_in_batches(), and partial sketches from batches, shards or
+worker processes merge into the sketch of the whole stream:
+
+    summary = user_email_summary(error=0.01)
+    summary["distinct_emails"], summary["top_domains"]
+
+parallel_email_summary() does the same per parallel_scan shard and merges
+the shard sketches.
+"""
+
+import functools
+import hashlib
+import heapq
+import math
+from array import array
+
+MIN_PRECISION = 4
+MAX_PRECISION = 18
+
+
+def _to_bytes(value):
+    if isinstance(value, bytes):
+        return value
+    return str(value).encode("utf-8")
+
+
+def _hash64(value, seed=0):
+    digest = hashlib.blake2b(_to_bytes(value), digest_size=8,
+                             salt=seed.to_bytes(16, "little")).digest()
+    return int.from_bytes(digest, "little")
+
+
+class HyperLogLog:
+    """
+    Distinct counting with HyperLogLog (Flajolet et al.), using a 64-bit
+    hash and linear counting for small cardinalities.
+    """
+
+    def __init__(self, error=0.01, precision=None, seed=0):
+        if precision is None:
+            precision = math.ceil(math.log2((1.04 / error) ** 2))
+        if not MIN_PRECISION <= precision <= MAX_PRECISION:
+            raise ValueError(f"precision must be between {MIN_PRECISION} and "
+                             f"{MAX_PRECISION}, got {precision}")
+        self.precision = precision
+        self.seed = seed
+        self.registers = bytearray(1 << precision)
+
+    @property
+    def relative_error(self):
+        return 1.04 / math.sqrt(len(self.registers))
+
+    def update(self, value):
+        hashed = _hash64(value, self.seed)
+        index = hashed & (len(self.registers) - 1)
+        rest = hashed >> self.precision
+        rank = (64 - self.precision) - rest.bit_length() + 1
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+
+    def update_many(self, values):
+        for value in values:
+            self.update(value)
+        return self
+
+    def merge(self, other):
+        if (other.precision, other.seed) != (self.precision, self.seed):
+            raise ValueError("Can only merge HyperLogLogs with the same "
+                             "precision and seed")
+        self.registers = bytearray(map(max, self.registers, other.registers))
+        return self
+
+    def count(self):
+        m = len(self.registers)
+        if m >= 128:
+            alpha = 0.7213 / (1 + 1.079 / m)
+        else:
+            alpha = {16: 0.673, 32: 0.697, 64: 0.709}[m]
+        estimate = alpha * m * m / sum(2.0 ** -r for r in self.registers)
+        zeros = self.registers.count(0)
+        if estimate <= 2.5 * m and zeros:
+            estimate = m * math.log(m / zeros)
+        return round(estimate)
+
+    def __len__(self):
+        return self.count()
+
+
+class CountMinSketch:
+    """Frequency estimates in a depth x width table of counters."""
+
+    def __init__(self, epsilon=0.001, delta=0.01, seed=0):
+        if not 0 < epsilon < 1 or not 0 < delta < 1:
+            raise ValueError("epsilon and delta must be between 0 and 1")
+        self.epsilon = epsilon
+        self.delta = delta
+        self.seed = seed
+        self.width = math.ceil(math.e / epsilon)
+        self.depth = math.ceil(math.log(1 / delta))
+        self.tables = [array("Q", bytes(8 * self.width))
+                       for _ in range(self.depth)]
+        self.total = 0
+
+    def _columns(self, value):
+        # Double hashing: the i-th row uses h1 + i * h2 (Kirsch-Mitzenmacher).
+        digest = hashlib.blake2b(_to_bytes(value), digest_size=16,
+                                 salt=self.seed.to_bytes(16, "little"))
+        digest = digest.digest()
+        first = int.from_bytes(digest[:8], "little")
+        second = int.from_bytes(digest[8:], "little") | 1
+        return [(first + i * second) % self.width for i in range(self.depth)]
+
+    def update(self, value, count=1):
+        for table, column in zip(self.tables, self._columns(value)):
+            table[column] += count
+        self.total += count
+
+    def update_many(self, values):
+        for value in values:
+            self.update(value)
+        return self
+
+    def estimate(self, value):
+        return min(table[column]
+                   for table, column in zip(self.tables, self._columns(value)))
+
+    __getitem__ = estimate
+
+    def merge(self, other):
+        if ((other.width, other.depth, other.seed)
+                != (self.width, self.depth, self.seed)):
+            raise ValueError("Can only merge CountMinSketches with the same "
+                             "dimensions and seed")
+        for table, other_table in zip(self.tables, other.tables):
+            for column, count in enumerate(other_table):
+                if count:
+                    table[column] += count
+        self.total += other.total
+        return self
+
+
+class SpaceSaving:
+    """
+    Top-k heavy hitters with the Space-Saving algorithm (Metwally et al.).
+
+    counts maps each monitored value to [count, error]; count - error is a
+    guaranteed lower bound on its true frequency.
+    """
+
+    def __init__(self, error=0.001, capacity=None):
+        if capacity is None:
+            capacity = math.ceil(1 / error)
+        if capacity < 1:
+            raise ValueError("capacity must be at least 1")
+        self.capacity = capacity
+        self.counts = {}
+        self.total = 0
+        # Min-heap of (count, tiebreak, value) with stale entries skipped
+        # lazily; the tiebreak keeps values of mixed types from being compared.
+        self._heap = []
+        self._pushes = 0
+
+    def _minimum(self):
+        heap, counts = self._heap, self.counts
+        while True:
+            count, _, value = heap[0]
+            entry = counts.get(value)
+            if entry is not None and entry[0] == count:
+                return value
+            heapq.heappop(heap)
+
+    def _push(self, value, count):
+        self._pushes += 1
+        heapq.heappush(self._heap, (count, self._pushes, value))
+        if len(self._heap) > 4 * self.capacity:
+            self._rebuild_heap()
+
+    def _rebuild_heap(self):
+        self._heap = [
+            (entry[0], index, value)
+            for index, (value, entry) in enumerate(self.counts.items())]
+        self._pushes = len(self._heap)
+        heapq.heapify(self._heap)
+
+    def update(self, value, count=1):
+        self.total += count
+        entry = self.counts.get(value)
+        if entry is not None:
+            entry[0] += count
+        elif len(self.counts) < self.capacity:
+            entry = self.counts[value] = [count, 0]
+        else:
+            evicted = self._minimum()
+            floor = self.counts.pop(evicted)[0]
+            entry = self.counts[value] = [floor + count, floor]
+        self._push(value, entry[0])
+
+    def update_many(self, values):
+        for value in values:
+            self.update(value)
+        return self
+
+    def _floor(self):
+        """What an unmonitored value may have occurred, at most."""
+        if len(self.counts) < self.capacity:
+            return 0
+        return min(count for count, _ in self.counts.values())
+
+    def merge(self, other):
+        """Combine two summaries (Agarwal et al., mergeable summaries)."""
+        if other.capacity != self.capacity:
+            raise ValueError("Can only merge SpaceSaving summaries with the "
+                             "same capacity")
+        floors = (self._floor(), other._floor())
+        merged = {}
+        for value in self.counts.keys() | other.counts.keys():
+            count = error = 0
+            for counts, floor in zip((self.counts, other.counts), floors):
+                entry = counts.get(value)
+                if entry is None:
+                    count += floor
+                    error += floor
+                else:
+                    count += entry[0]
+                    error += entry[1]
+            merged[value] = [count, error]
+        keep = heapq.nlargest(self.capacity, merged.items(),
+                              key=lambda item: item[1][0])
+        self.counts = dict(keep)
+        self.total += other.total
+        self._rebuild_heap()
+        return self
+
+    def top(self, n=10):
+        """Return the n most frequent values as (value, count, error)."""
+        items = heapq.nlargest(n, self.counts.items(),
+                               key=lambda item: item[1][0])
+        return [(value, count, error) for value, (count, error) in items]
+
+    def heavy_hitters(self, phi, guaranteed=False):
+        """
+        Values whose frequency may exceed phi * total, or with guaranteed
+        only those whose lower bound (count - error) does.
+        """
+        threshold = phi * self.total
+        return [(value, count, error)
+                for value, count, error in self.top(len(self.counts))
+                if (count - error if guaranteed else count) > threshold]
+
+
+def sketch_columns(batches, names, feeds):
+    """
+    Feed row batches into sketches in one pass.
+
+    feeds is a list of (column, sketch) or (column, sketch, key) tuples,
+    where key transforms each value first (e.g. email_domain). Several
+    sketches can read the same column.
+    """
+    names = list(names)
+    plan = []
+    for column, sketch, *key in feeds:
+        key = key[0] if key else None
+        plan.append((names.index(column), sketch.update, key))
+    for batch in batches:
+        for position, update, key in plan:
+            if key is None:
+                for row in batch:
+                    update(row[position])
+            else:
+                for row in batch:
+                    update(key(row[position]))
+
+
+def email_domain(email):
+    return email.rpartition("@")[2].lower()
+
+
+def email_sketches(batches, error=0.01, names=None):
+    """Return HyperLogLog/SpaceSaving/CountMin sketches of users' emails."""
+    sketches = {
+        "emails": HyperLogLog(error),
+        "domains": SpaceSaving(error),
+        "domain_counts": CountMinSketch(epsilon=error / 10),
+    }
+    if names is None:
+        names = __import__('db').column_names("users")
+    sketch_columns(batches, names, [
+        ("email", sketches["emails"]),
+        ("email", sketches["domains"], email_domain),
+        ("email", sketches["domain_counts"], email_domain),
+    ])
+    return sketches
+
+
+def merge_sketches(sketches, other):
+    """Merge two dicts of sketches key by key (a parallel_scan combine)."""
+    for name, sketch in other.items():
+        sketches[name].merge(sketch)
+    return sketches
+
+
+def _summary(sketches, top):
+    return {
+        "distinct_emails": sketches["emails"].count(),
+        "top_domains": [
+            {"domain": domain, "count": count, "error": error,
+             "count_min": sketches["domain_counts"].estimate(domain)}
+            for domain, count, error in sketches["domains"].top(top)
+        ],
+        "sketches": sketches,
+    }
+
+
+def user_email_summary(error=0.01, top=10, batch_size=1000, where=None):
+    """Distinct emails and the top email domains of users, in one pass."""
+    batches = __import__('1-batch_processing').stream_users_in_batches
+    return _summary(email_sketches(
+        batches(batch_size, where=where, raise_errors=True), error), top)
+
+
+def parallel_email_summary(error=0.01, top=10, workers=4, where=None,
+                           batch_size=1000):
+    """user_email_summary() computed per shard and merged."""
+    parallel_scan = __import__('parallel_scan')
+    sketches = parallel_scan.parallel_scan(
+        functools.partial(email_sketches, error=error), merge_sketches,
+        workers=workers, where=where, batch_size=batch_size)
+    return _summary(sketches, top)
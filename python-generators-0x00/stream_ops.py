@@ -0,0 +1,318 @@
+"""
+Streaming operators over the user generators, in bounded memory.
+
+* TopK keeps the k largest (or smallest) rows by a key in a heap of k rows.
+* count_windows() and time_windows() cut a stream into tumbling or sliding
+  windows by row count or by a timestamp column. Only the rows of the open
+  windows are held.
+* GroupBy folds rows into one aggregate per group (RunningStats by default)
+  and caps the number of groups.
+
+TopK and GroupBy have update(row)/merge(other)/result() like the sketches,
+so they work as Pipeline sinks and combine across shards. run() feeds one
+pass over a stream to several of them:
+
+    report = run(stream_users(), {
+        "ages": GroupBy(age_bucket(by("age")), value=by("age")),
+        "oldest": TopK(10, key=by("age")),
+    })
+
+daily_report() builds the age-bucket and email-domain cohort report this
+way from a single scan of the users table.
+"""
+
+import datetime
+import heapq
+import itertools
+import operator
+from collections import deque
+
+sketches = __import__('sketches')
+stream_stats = __import__('stream_stats')
+user_batch = __import__('user_batch')
+
+OTHER = "(other)"
+
+
+def by(column, names=user_batch.USER_COLUMNS):
+    """Return a key function reading column from rows laid out as names."""
+    return operator.itemgetter(list(names).index(column))
+
+
+class TopK:
+    """The k rows with the largest key (smallest with largest=False)."""
+
+    def __init__(self, k, key=None, largest=True):
+        if k < 1:
+            raise ValueError("k must be at least 1")
+        self.k = k
+        self.key = key or (lambda row: row)
+        self.largest = largest
+        # Min-heap of the kept rows by (signed) key; the root is evicted
+        # first. The counter keeps rows themselves from being compared.
+        self._heap = []
+        self._seen = 0
+
+    def _entry(self, row):
+        key = self.key(row)
+        self._seen += 1
+        return (key if self.largest else _Reversed(key), -self._seen, row)
+
+    def update(self, row):
+        entry = self._entry(row)
+        if len(self._heap) < self.k:
+            heapq.heappush(self._heap, entry)
+        elif entry[0] > self._heap[0][0]:
+            heapq.heapreplace(self._heap, entry)
+
+    def update_many(self, rows):
+        for row in rows:
+            self.update(row)
+        return self
+
+    def merge(self, other):
+        for entry in other._heap:
+            self.update(entry[2])
+        return self
+
+    def result(self):
+        """The kept rows, best first."""
+        return [row for _, _, row in sorted(self._heap, reverse=True)]
+
+
+class _Reversed:
+    """Inverts the ordering of a key, for smallest-k heaps."""
+
+    __slots__ = ("key",)
+
+    def __init__(self, key):
+        self.key = key
+
+    def __lt__(self, other):
+        return other.key < self.key
+
+    def __gt__(self, other):
+        return other.key > self.key
+
+    def __eq__(self, other):
+        return self.key == other.key
+
+
+def count_windows(rows, size, step=None):
+    """
+    Yield lists of size rows, advancing step rows each time.
+
+    step defaults to size (tumbling windows), in which case a final partial
+    window is also yielded; a smaller step gives overlapping sliding
+    windows, which are only yielded when full.
+    """
+    step = step or size
+    if size < 1 or step < 1:
+        raise ValueError("size and step must be at least 1")
+    window = deque(maxlen=size)
+    pending = 0
+    for row in rows:
+        window.append(row)
+        pending += 1
+        if len(window) == size and pending >= step:
+            yield list(window)
+            pending = 0
+            if step >= size:
+                window.clear()
+    if window and pending and len(window) < size:
+        yield list(window)
+
+
+def _floor(value, width, origin):
+    return origin + ((value - origin) // width) * width
+
+
+def _origin(value):
+    # Align windows to the epoch for dates and datetimes and to 0 for
+    # numbers, so daily windows start at midnight whatever the first row is.
+    if isinstance(value, datetime.datetime):
+        return datetime.datetime(1970, 1, 1, tzinfo=value.tzinfo)
+    if isinstance(value, datetime.date):
+        return datetime.date(1970, 1, 1)
+    return 0
+
+
+def time_windows(rows, time_key, width, step=None):
+    """
+    Yield (start, rows) for windows [start, start + width) by time_key.
+
+    Timestamps may be numbers (width and step numbers) or datetimes (width
+    and step timedeltas). step defaults to width (tumbling windows); a
+    smaller step gives sliding windows. Rows must arrive in time order, e.g.
+    from stream_users_in_batches(..., order_by=(column,)). Windows with no
+    rows are skipped.
+    """
+    step = step or width
+    zero = width - width
+    if width <= zero or step <= zero or step > width:
+        raise ValueError("width must be positive and step between 0 and "
+                         "width")
+    window = deque()
+    start = origin = last = None
+    for row in rows:
+        moment = time_key(row)
+        if last is not None and moment < last:
+            raise ValueError(f"Rows are not in time order: {moment!r} "
+                             f"after {last!r}")
+        last = moment
+        if start is None:
+            origin = _origin(moment)
+            start = _floor(moment, step, origin) - width + step
+        while moment >= start + width:
+            # Everything in window is in [start, start + width) here.
+            if window:
+                yield start, list(window)
+            start += step
+            while window and time_key(window[0]) < start:
+                window.popleft()
+            if not window:
+                # Jump over the gap to the first window holding moment.
+                start = max(start,
+                            _floor(moment, step, origin) - width + step)
+        window.append(row)
+    while window:
+        yield start, list(window)
+        start += step
+        while window and time_key(window[0]) < start:
+            window.popleft()
+
+
+class Count:
+    """The simplest aggregate: how many values were seen."""
+
+    def __init__(self):
+        self.count = 0
+
+    def update(self, value):
+        self.count += 1
+
+    def merge(self, other):
+        self.count += other.count
+        return self
+
+
+class GroupLimitExceeded(Exception):
+    """Raised by GroupBy(overflow="error") on one group too many."""
+
+
+class GroupBy:
+    """
+    One aggregate per group of rows, for at most max_groups groups.
+
+    key(row) names the group and aggregate() makes a new aggregate with
+    update(value) and merge(other); value(row) is what it is updated with.
+    By default every group keeps a RunningStats of value (or a Count
+    without value). Once max_groups groups exist, rows of new groups are
+    folded into an OTHER group (overflow="other"), dropped and counted in
+    dropped ("drop"), or raise GroupLimitExceeded ("error").
+    """
+
+    OVERFLOWS = ("other", "drop", "error")
+
+    def __init__(self, key, value=None, aggregate=None, max_groups=1000,
+                 overflow="other"):
+        if overflow not in self.OVERFLOWS:
+            raise ValueError(f"overflow must be one of {self.OVERFLOWS}")
+        if max_groups < 1:
+            raise ValueError("max_groups must be at least 1")
+        self.key = key
+        self.value = value or (lambda row: row)
+        if aggregate is None:
+            aggregate = stream_stats.RunningStats if value else Count
+        self.aggregate = aggregate
+        self.max_groups = max_groups
+        self.overflow = overflow
+        self.groups = {}
+        self.dropped = 0
+
+    def _group(self, name):
+        group = self.groups.get(name)
+        if group is not None:
+            return group
+        if len(self.groups) >= self.max_groups and name != OTHER:
+            if self.overflow == "error":
+                raise GroupLimitExceeded(
+                    f"More than {self.max_groups} groups (at {name!r})")
+            if self.overflow == "drop":
+                return None
+            name = OTHER
+            group = self.groups.get(name)
+            if group is not None:
+                return group
+        group = self.groups[name] = self.aggregate()
+        return group
+
+    def update(self, row):
+        group = self._group(self.key(row))
+        if group is None:
+            self.dropped += 1
+        else:
+            group.update(self.value(row))
+
+    def update_many(self, rows):
+        for row in rows:
+            self.update(row)
+        return self
+
+    def merge(self, other):
+        for name, aggregate in other.groups.items():
+            group = self._group(name)
+            if group is None:
+                self.dropped += getattr(aggregate, "count", 1)
+            else:
+                group.merge(aggregate)
+        self.dropped += other.dropped
+        return self
+
+    def result(self):
+        return dict(self.groups)
+
+
+def run(rows, operators):
+    """Feed rows to every operator in one pass; return their results."""
+    updates = [op.update for op in operators.values()]
+    for row in rows:
+        for update in updates:
+            update(row)
+    return {name: op.result() for name, op in operators.items()}
+
+
+def age_bucket(age, width=10):
+    """Key function bucketing age(row) into e.g. '20-29'."""
+    def bucket(row):
+        low = int(age(row)) // width * width
+        return f"{low}-{low + width - 1}"
+    return bucket
+
+
+def domain_key(email):
+    """Key function returning sketches.email_domain() of email(row)."""
+    def domain(row):
+        return sketches.email_domain(email(row))
+    return domain
+
+
+def daily_report(top=10, bucket_width=10, max_cohorts=1000, batch_size=1000,
+                 where=None):
+    """
+    Age buckets, email-domain cohorts and the oldest users in one pass.
+
+    Returns {"age_buckets": {bucket: RunningStats of age},
+    "cohorts": {domain: RunningStats of age}, "oldest": [rows]}.
+    """
+    batches = __import__('1-batch_processing').stream_users_in_batches
+    names = __import__('db').column_names("users")
+    age = by("age", names)
+    rows = itertools.chain.from_iterable(
+        batches(batch_size, where=where, raise_errors=True))
+    return run(rows, {
+        "age_buckets": GroupBy(age_bucket(age, bucket_width), value=age),
+        "cohorts": GroupBy(domain_key(by("email", names)), value=age,
+                           max_groups=max_cohorts),
+        "oldest": TopK(top, key=age),
+    })
@@ -0,0 +1,200 @@
+"""
+One-pass, mergeable statistics over streamed values.
+
+RunningStats keeps count, mean, variance (Welford), min and max in O(1)
+memory. KLLSketch answers approximate quantiles in O(k log(n/k)) memory.
+Both can be merged, so partial results computed per batch, per shard or per
+worker process combine into the same answer as a single pass:
+
+    stats = StreamStatistics()
+    for age in stream_user_ages():
+        stats.update(age)
+    stats.quantile(0.5)
+"""
+
+import math
+import random
+
+
+class RunningStats:
+    """Count, mean, variance, min and max using Welford's algorithm."""
+
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.min = None
+        self.max = None
+
+    def update(self, value):
+        value = float(value)
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (value - self.mean)
+        if self.min is None or value < self.min:
+            self.min = value
+        if self.max is None or value > self.max:
+            self.max = value
+
+    def merge(self, other):
+        """Fold another RunningStats into this one (Chan et al.)."""
+        if other.count == 0:
+            return self
+        if self.count == 0:
+            self.count, self.mean, self.m2 = other.count, other.mean, other.m2
+            self.min, self.max = other.min, other.max
+            return self
+        count = self.count + other.count
+        delta = other.mean - self.mean
+        self.mean += delta * other.count / count
+        self.m2 += other.m2 + delta * delta * self.count * other.count / count
+        self.count = count
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        return self
+
+    @property
+    def variance(self):
+        """Population variance."""
+        return self.m2 / self.count if self.count else 0.0
+
+    @property
+    def sample_variance(self):
+        return self.m2 / (self.count - 1) if self.count > 1 else 0.0
+
+    @property
+    def stddev(self):
+        return math.sqrt(self.variance)
+
+
+class _Compactor(list):
+    def compact(self, rng):
+        """Sort, then promote every other item; an odd leftover stays here."""
+        self.sort()
+        leftover = [self.pop()] if len(self) % 2 else []
+        promoted = self[rng.randint(0, 1)::2]
+        self[:] = leftover
+        return promoted
+
+
+class KLLSketch:
+    """
+    KLL quantile sketch (Karnin, Lang and Liberty).
+
+    Items live in a stack of compactors; an item at height h stands for 2**h
+    original values. Rank error is roughly 1.7 / k with high probability.
+    """
+
+    def __init__(self, k=200, c=2 / 3, seed=None):
+        self.k = k
+        self.c = c
+        self.count = 0
+        self.compactors = []
+        self.size = 0
+        self.max_size = 0
+        self._rng = random.Random(seed)
+        self._grow()
+
+    def _capacity(self, height):
+        depth = len(self.compactors) - height - 1
+        return int(math.ceil(self.k * self.c ** depth)) + 1
+
+    def _grow(self):
+        self.compactors.append(_Compactor())
+        self.max_size = sum(self._capacity(h) for h in range(len(self.compactors)))
+
+    def _compress(self):
+        for height, compactor in enumerate(self.compactors):
+            if len(compactor) >= self._capacity(height):
+                if height + 1 >= len(self.compactors):
+                    self._grow()
+                self.compactors[height + 1].extend(compactor.compact(self._rng))
+                self.size = sum(len(c) for c in self.compactors)
+                if self.size < self.max_size:
+                    break
+
+    def update(self, value):
+        self.compactors[0].append(value)
+        self.count += 1
+        self.size += 1
+        if self.size >= self.max_size:
+            self._compress()
+
+    def merge(self, other):
+        while len(self.compactors) < len(other.compactors):
+            self._grow()
+        for height, compactor in enumerate(other.compactors):
+            self.compactors[height].extend(compactor)
+        self.count += other.count
+        self.size = sum(len(c) for c in self.compactors)
+        while self.size >= self.max_size:
+            self._compress()
+        return self
+
+    def _weighted(self):
+        items = []
+        for height, compactor in enumerate(self.compactors):
+            weight = 1 << height
+            items.extend((value, weight) for value in compactor)
+        items.sort(key=lambda item: item[0])
+        return items
+
+    def quantile(self, q):
+        """Return an approximate q-quantile, 0 <= q <= 1."""
+        if not 0 <= q <= 1:
+            raise ValueError("q must be between 0 and 1")
+        items = self._weighted()
+        if not items:
+            return None
+        total = sum(weight for _, weight in items)
+        target = q * total
+        seen = 0
+        for value, weight in items:
+            seen += weight
+            if seen >= target:
+                return value
+        return items[-1][0]
+
+    def quantiles(self, qs):
+        return [self.quantile(q) for q in qs]
+
+
+class StreamStatistics:
+    """RunningStats plus a KLLSketch, updated and merged together."""
+
+    def __init__(self, k=200, seed=None):
+        self.moments = RunningStats()
+        self.sketch = KLLSketch(k=k, seed=seed)
+
+    def update(self, value):
+        value = float(value)
+        self.moments.update(value)
+        self.sketch.update(value)
+
+    def update_many(self, values):
+        for value in values:
+            self.update(value)
+        return self
+
+    def merge(self, other):
+        self.moments.merge(other.moments)
+        self.sketch.merge(other.sketch)
+        return self
+
+    def quantile(self, q):
+        return self.sketch.quantile(q)
+
+    def summary(self, qs=(0.25, 0.5, 0.75, 0.9, 0.99)):
+        moments = self.moments
+        result = {
+            "count": moments.count,
+            "mean": moments.mean,
+            "variance": moments.variance,
+            "stddev": moments.stddev,
+            "min": moments.min,
+            "max": moments.max,
+        }
+        for q in qs:
+            result[f"p{q * 100:g}"] = self.quantile(q)
+        return result
@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+
+import asyncio
+import os
+import subprocess
+import sys
+import tempfile
+import unittest
+from unittest import TestCase
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+if HERE not in sys.path:
+  sys.path.insert(0, HERE)
+
+benchmark = __import__('benchmark')
+async_streams = __import__('async_streams')
+
+ROWS = 2000
+
+SCRIPT = """
+import asyncio
+async_streams = __import__('async_streams')
+
+async def main():
+  count = 0
+  async for row in async_streams.stream_users():
+    count += 1
+  print(count)
+
+asyncio.run(main())
+"""
+
+
+class MarkedDriver(async_streams.AiosqliteDriver):
+  """aiosqlite, flagged as tying up the connection with unread results"""
+  streams_on_connection = True
+
+
+class TestAsyncStreams(TestCase):
+  """Tests of async_streams' pooled connections against SQLite"""
+
+  @classmethod
+  def setUpClass(cls):
+    """Create a users table of ROWS rows in a temporary SQLite file"""
+    cls.directory = tempfile.TemporaryDirectory()
+    cls.path = os.path.join(cls.directory.name, "users.db")
+    benchmark.synthesize(cls.path, ROWS)
+
+  @classmethod
+  def tearDownClass(cls):
+    cls.directory.cleanup()
+
+  def test_script_exits(self):
+    """A script streaming every row exits once asyncio.run() returns"""
+    env = dict(os.environ, DB_ENGINE="sqlite", DB_PATH=self.path)
+    result = subprocess.run([sys.executable, "-c", SCRIPT], cwd=HERE,
+                            env=env, capture_output=True, text=True,
+                            timeout=60)
+    self.assertEqual(result.returncode, 0, result.stderr)
+    self.assertEqual(result.stdout.strip(), str(ROWS))
+
+  def _break_early(self, driver):
+    async def run():
+      async with async_streams.AsyncConnectionPool(driver, size=1) as pool:
+        rows = async_streams.stream_users(pool=pool)
+        async for row in rows:
+          break
+        await rows.aclose()
+        return len(pool._idle)
+    return asyncio.run(run())
+
+  def test_sqlite_connection_reused_after_break(self):
+    """Stopping early hands a SQLite connection back to the pool"""
+    driver = async_streams.AiosqliteDriver(self.path)
+    self.assertEqual(self._break_early(driver), 1)
+
+  def test_streaming_connection_discarded_after_break(self):
+    """Stopping early closes a connection with an unread result set"""
+    self.assertEqual(self._break_early(MarkedDriver(self.path)), 0)
+
+  def test_closed_pool_refuses_connections(self):
+    """A pool closed at shutdown hands out no more connections"""
+    async def run():
+      pool = async_streams.AsyncConnectionPool(
+          async_streams.AiosqliteDriver(self.path))
+      await pool.close()
+      await pool.acquire()
+    with self.assertRaises(RuntimeError):
+      asyncio.run(run())
+
+  def test_release_rolls_back(self):
+    """A returned connection is rolled back before the next user gets it"""
+    async def run():
+      driver = async_streams.AiosqliteDriver(self.path)
+      async with async_streams.AsyncConnectionPool(driver, size=1) as pool:
+        connection = await pool.acquire()
+        await connection.execute("DELETE FROM users")
+        self.assertTrue(connection.in_transaction)
+        await pool.release(connection)
+        again = await pool.acquire()
+        self.assertIs(again, connection)
+        self.assertFalse(again.in_transaction)
+        count = await (await again.execute("SELECT COUNT(*) FROM users")
+                       ).fetchone()
+        await pool.release(again)
+        return count[0]
+    self.assertEqual(asyncio.run(run()), ROWS)
+
+  def test_dead_connection_replaced(self):
+    """A connection failing its liveness check is not handed out again"""
+    async def run():
+      driver = async_streams.AiosqliteDriver(self.path)
+      async with async_streams.AsyncConnectionPool(driver, size=1) as pool:
+        connection = await pool.acquire()
+        await pool.release(connection)
+        await connection.close()
+        fresh = await pool.acquire()
+        self.assertIsNot(fresh, connection)
+        self.assertTrue(await driver.is_alive(fresh))
+        await pool.release(fresh)
+    asyncio.run(run())
+
+
+if __name__ == "__main__":
+  unittest.main()
@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+
+import os
+import sqlite3
+import sys
+import tempfile
+import unittest
+from unittest import TestCase
+from unittest.mock import patch
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+if HERE not in sys.path:
+  sys.path.insert(0, HERE)
+
+benchmark = __import__('benchmark')
+db = __import__('db')
+columnar = __import__('columnar')
+sketches = __import__('sketches')
+stream_ops = __import__('stream_ops')
+
+ROWS = 500
+
+
+class FailingCursor:
+  """A cursor whose second fetchmany() fails, as a dropped link would"""
+
+  def __init__(self, cursor):
+    self._cursor = cursor
+    self.fetches = 0
+
+  def fetchmany(self, size):
+    self.fetches += 1
+    if self.fetches > 1:
+      raise sqlite3.OperationalError("disk I/O error")
+    return self._cursor.fetchmany(size)
+
+  def __getattr__(self, name):
+    return getattr(self._cursor, name)
+
+
+def failing_cursor(connection):
+  return FailingCursor(connection.cursor())
+
+
+class TestExport(TestCase):
+  """export_users() round trips, and aborts when the scan fails"""
+
+  @classmethod
+  def setUpClass(cls):
+    """A users table and a one-connection pool over it"""
+    cls.directory = tempfile.TemporaryDirectory()
+    path = os.path.join(cls.directory.name, "users.db")
+    benchmark.synthesize(path, ROWS)
+    db.configure_pool(backend=db.SQLiteBackend(path), size=1)
+
+  @classmethod
+  def tearDownClass(cls):
+    db.get_pool().close()
+    cls.directory.cleanup()
+
+  def setUp(self):
+    self.path = os.path.join(self.directory.name, "users.col")
+
+  def test_round_trip(self):
+    """Every exported row reads back"""
+    self.assertEqual(columnar.export_users(self.path, batch_size=100), ROWS)
+    with columnar.ColumnarReader(self.path) as reader:
+      self.assertEqual(sum(len(batch) for batch in reader.iter_batches()),
+                       ROWS)
+
+  def test_failed_scan_aborts_export(self):
+    """A database error mid-export raises and leaves no file behind"""
+    with patch.object(db, "server_side_cursor", failing_cursor):
+      with self.assertRaises(sqlite3.OperationalError):
+        columnar.export_users(self.path, batch_size=100)
+    self.assertFalse(os.path.exists(self.path))
+
+  def test_failed_scan_fails_summaries(self):
+    """One-pass summaries raise rather than report a partial scan"""
+    reports = {
+      "user_email_summary": lambda: sketches.user_email_summary(
+          batch_size=100),
+      "daily_report": lambda: stream_ops.daily_report(batch_size=100),
+    }
+    for name, report in reports.items():
+      with self.subTest(report=name):
+        with patch.object(db, "server_side_cursor", failing_cursor):
+          with self.assertRaises(sqlite3.OperationalError):
+            report()
+
+
+if __name__ == "__main__":
+  unittest.main()
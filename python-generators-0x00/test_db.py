@@ -0,0 +1,175 @@
+#!/usr/bin/env python3
+
+import os
+import sqlite3
+import sys
+import tempfile
+import threading
+import unittest
+from unittest import TestCase
+from unittest.mock import Mock, patch
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+if HERE not in sys.path:
+  sys.path.insert(0, HERE)
+
+benchmark = __import__('benchmark')
+db = __import__('db')
+stream_users = __import__('0-stream_users').stream_users
+lazy_paginate = __import__('2-lazy_paginate')
+
+ROWS = 120
+
+
+class ProxyConnection:
+  """An sqlite3 connection behind a type the helpers can't recognize"""
+
+  def __init__(self, connection):
+    self._connection = connection
+
+  def __getattr__(self, name):
+    return getattr(self._connection, name)
+
+
+class ProxyBackend(db.SQLiteBackend):
+  """A registered backend that counts the streaming cursors it creates"""
+  name = "proxy"
+  cursors = 0
+
+  def connect(self):
+    return ProxyConnection(super().connect())
+
+  def server_side_cursor(self, connection):
+    ProxyBackend.cursors += 1
+    return connection.cursor()
+
+
+class TestConnectionPool(TestCase):
+  """Tests of ConnectionPool checkout limits and timeouts"""
+
+  @classmethod
+  def setUpClass(cls):
+    """Create a users table in a temporary SQLite file"""
+    cls.directory = tempfile.TemporaryDirectory()
+    cls.path = os.path.join(cls.directory.name, "users.db")
+    benchmark.synthesize(cls.path, ROWS)
+
+  @classmethod
+  def tearDownClass(cls):
+    cls.directory.cleanup()
+
+  def setUp(self):
+    self.pool = db.ConnectionPool(db.SQLiteBackend(self.path), size=2)
+
+  def tearDown(self):
+    self.pool.close()
+
+  def test_exhausted_pool_times_out(self):
+    """A full pool raises PoolTimeout once the timeout passes"""
+    held = [self.pool.acquire(), self.pool.acquire()]
+    with self.assertRaises(db.PoolTimeout):
+      self.pool.acquire(timeout=0.05)
+    self.pool.release(held.pop())
+    self.pool.release(self.pool.acquire(timeout=0.05))
+    self.pool.release(held.pop())
+    self.assertEqual(self.pool.stats["connects"], 2)
+
+  def test_waiter_gets_released_connection(self):
+    """A caller waiting on a full pool gets the next released connection"""
+    held = [self.pool.acquire(), self.pool.acquire()]
+    got = []
+    waiter = threading.Thread(
+        target=lambda: got.append(self.pool.acquire(timeout=5)))
+    waiter.start()
+    self.pool.release(held[0])
+    waiter.join(5)
+    self.assertIs(got[0], held[0])
+    self.pool.release(got[0])
+    self.pool.release(held[1])
+
+  def test_default_timeout_is_finite(self):
+    """Without a timeout, acquire() waits DB_POOL_TIMEOUT, not forever"""
+    with patch.dict(os.environ, {"DB_POOL_TIMEOUT": "0.05"}):
+      pool = db.ConnectionPool(db.SQLiteBackend(self.path), size=1)
+    held = pool.acquire()
+    try:
+      with self.assertRaises(db.PoolTimeout):
+        pool.acquire()
+    finally:
+      pool.release(held)
+      pool.close()
+
+  def test_pool_timeout_is_a_handled_error(self):
+    """Streamers report PoolTimeout through db.errors() like driver errors"""
+    self.assertIn(db.PoolTimeout, db.errors())
+
+  def test_errors_builds_no_backends(self):
+    """errors() asks the pool's backend only"""
+    db.configure_pool(backend=db.SQLiteBackend(self.path), size=1)
+    factory = Mock(side_effect=AssertionError("backend built"))
+    try:
+      with patch.dict(db.BACKENDS, {"other": factory}):
+        self.assertIn(sqlite3.Error, db.errors())
+    finally:
+      db.get_pool().close()
+    factory.assert_not_called()
+
+  def test_dead_connection_replaced(self):
+    """A connection failing its health check is not handed out again"""
+    connection = self.pool.acquire()
+    self.pool.release(connection)
+    connection.close()
+    fresh = self.pool.acquire()
+    self.assertIsNot(fresh, connection)
+    self.assertEqual(self.pool.stats["failed_checks"], 1)
+    self.pool.release(fresh)
+
+  def test_release_foreign_connection(self):
+    """Releasing a connection the pool never handed out is an error"""
+    with self.assertRaises(ValueError):
+      self.pool.release(sqlite3.connect(":memory:"))
+
+
+class TestRegisteredBackend(TestCase):
+  """Tests that the helpers defer to a backend added by register_backend"""
+
+  @classmethod
+  def setUpClass(cls):
+    """Register the proxy backend and make it the configured engine"""
+    cls.directory = tempfile.TemporaryDirectory()
+    path = os.path.join(cls.directory.name, "users.db")
+    benchmark.synthesize(path, ROWS)
+    db.register_backend("proxy", lambda: ProxyBackend(path))
+    cls.environ = patch.dict(os.environ, {"DB_ENGINE": "proxy"})
+    cls.environ.start()
+    db.configure_pool(size=1)
+
+  @classmethod
+  def tearDownClass(cls):
+    db.get_pool().close()
+    cls.environ.stop()
+    del db.BACKENDS["proxy"]
+    cls.directory.cleanup()
+
+  def test_helpers_use_backend(self):
+    """placeholder() and server_side_cursor() come from the backend"""
+    connection = db.acquire()
+    try:
+      self.assertIsInstance(connection, ProxyConnection)
+      self.assertEqual(db.placeholder(connection), "?")
+      before = ProxyBackend.cursors
+      db.server_side_cursor(connection).close()
+      self.assertEqual(ProxyBackend.cursors, before + 1)
+    finally:
+      db.release(None, connection)
+
+  def test_streamers_run_on_backend(self):
+    """The streamers work end to end on the registered backend"""
+    self.assertEqual(sum(1 for _ in stream_users()), ROWS)
+    pages = list(lazy_paginate.keyset_pages(50))
+    self.assertEqual(sum(len(page) for page, _ in pages), ROWS)
+    self.assertEqual(len(next(lazy_paginate.paginate_users(10, 115))), 5)
+
+
+if __name__ == "__main__":
+  unittest.main()
@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+
+import os
+import sys
+import tempfile
+import unittest
+from unittest import TestCase
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+if HERE not in sys.path:
+  sys.path.insert(0, HERE)
+
+benchmark = __import__('benchmark')
+db = __import__('db')
+lazy_paginate = __import__('2-lazy_paginate')
+
+ROWS = 250
+
+
+class TestKeysetPages(TestCase):
+  """Tests of keyset pagination and its continuation tokens"""
+
+  @classmethod
+  def setUpClass(cls):
+    """Create a users table and a one-connection pool over it"""
+    cls.directory = tempfile.TemporaryDirectory()
+    path = os.path.join(cls.directory.name, "users.db")
+    benchmark.synthesize(path, ROWS)
+    db.configure_pool(backend=db.SQLiteBackend(path), size=1)
+
+  @classmethod
+  def tearDownClass(cls):
+    db.get_pool().close()
+    cls.directory.cleanup()
+
+  def assertPoolFree(self):
+    """The pool's only connection can be checked out right away"""
+    connection = db.acquire(timeout=1)
+    db.release(None, connection)
+
+  def test_pages_cover_table(self):
+    """Pages hold every row once, in user_id order"""
+    pages = list(lazy_paginate.lazy_pagination(100))
+    self.assertEqual([len(page) for page in pages], [100, 100, 50])
+    ids = [row[0] for page in pages for row in page]
+    self.assertEqual(ids, sorted(set(ids)))
+    self.assertPoolFree()
+
+  def test_token_resumes(self):
+    """A page's token resumes with the following page"""
+    pages = lazy_paginate.keyset_pages(100)
+    first, token = next(pages)
+    pages.close()
+    resumed, _ = next(iter(lazy_paginate.keyset_pages(100, token=token)))
+    everything = [row for page in lazy_paginate.lazy_pagination(200)
+                  for row in page]
+    self.assertEqual(first + resumed, everything[:200])
+    self.assertPoolFree()
+
+  def test_invalid_token(self):
+    """Bad tokens raise ValueError without holding a pooled connection"""
+    tokens = ["not base64!", lazy_paginate.encode_token(("a", "b")),
+              "eyJhIjogMX0=", "bnVsbA=="]
+    for token in tokens:
+      with self.subTest(token=token):
+        with self.assertRaises(ValueError):
+          next(lazy_paginate.keyset_pages(10, token=token))
+        self.assertPoolFree()
+
+  def test_abandoned_pages_release(self):
+    """Closing the generator midway returns the connection"""
+    pages = lazy_paginate.keyset_pages(10)
+    next(pages)
+    pages.close()
+    self.assertPoolFree()
+
+  def test_paginate_users(self):
+    """OFFSET pagination returns one page and releases its connection"""
+    page = next(lazy_paginate.paginate_users(40, 230))
+    self.assertEqual(len(page), 20)
+    self.assertPoolFree()
+
+
+if __name__ == "__main__":
+  unittest.main()
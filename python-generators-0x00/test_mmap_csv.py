@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+
+import csv
+import os
+import sqlite3
+import sys
+import tempfile
+import unittest
+from unittest import TestCase
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+if HERE not in sys.path:
+  sys.path.insert(0, HERE)
+
+mmap_csv = __import__('mmap_csv')
+seed = __import__('seed')
+
+# Plain, quoted, escaped and multi-line fields, CRLF and LF endings, blank
+# lines, a lone quoted empty field, and rows too short to seed.
+CONTENT = (
+  'name,email,age\r\n'
+  'Ann Lee,ann@example.com,31\r\n'
+  '"Bob","bob@example.com","42"\r\n'
+  '\r\n'
+  '"Smith, Carl",carl@example.com,27\n'
+  '"Dee ""DJ"" Jones",dee@example.com,55\n'
+  '"Eve\nNewline",eve@example.com,19\n'
+  '\n'
+  'short,row\n'
+  '""\n'
+  'lonely\n'
+  'Fay,fay@example.com,63,extra\n'
+  'Gus,gus@example.com,70'
+)
+
+
+class TestMmapCSVParity(TestCase):
+  """MmapCSVReader against csv.reader on the same file"""
+
+  @classmethod
+  def setUpClass(cls):
+    """Write the sample CSV to a temporary file"""
+    cls.directory = tempfile.TemporaryDirectory()
+    cls.path = os.path.join(cls.directory.name, "users.csv")
+    with open(cls.path, "w", newline="", encoding="utf-8") as handle:
+      handle.write(CONTENT)
+    with open(cls.path, newline="", encoding="utf-8") as handle:
+      cls.expected = [tuple(row) for row in csv.reader(handle) if row][1:]
+
+  @classmethod
+  def tearDownClass(cls):
+    cls.directory.cleanup()
+
+  def test_all_columns(self):
+    """Every record, the quoted empty field included, matches csv"""
+    with mmap_csv.MmapCSVReader(self.path) as reader:
+      self.assertEqual(list(reader), self.expected)
+      self.assertEqual(reader.header, ["name", "email", "age"])
+
+  def test_raw_records(self):
+    """records() yields the same fields, undecoded"""
+    with mmap_csv.MmapCSVReader(self.path, decode=False) as reader:
+      raw = [tuple(bytes(field).decode() for field in fields)
+             for fields in reader.records()]
+    self.assertEqual(raw, self.expected)
+
+  def test_projection_skips_short_records(self):
+    """Projected columns skip records lacking them, in both modes"""
+    expected = [(row[2], row[0]) for row in self.expected if len(row) >= 3]
+    for decode in (True, False):
+      with self.subTest(decode=decode):
+        with mmap_csv.MmapCSVReader(self.path, columns=("age", "name"),
+                                    decode=decode) as reader:
+          rows = [tuple(field if decode else bytes(field).decode()
+                        for field in row) for row in reader]
+        self.assertEqual(rows, expected)
+
+  def test_seed_readers_agree(self):
+    """seed.insert_data() loads the same rows with either reader"""
+    loaded = {}
+    for reader in ("csv", "mmap"):
+      connection = sqlite3.connect(":memory:")
+      seed.create_table(connection)
+      seed.insert_data(connection, self.path, progress=False, reader=reader)
+      loaded[reader] = connection.execute(
+          "SELECT user_id, name, email, age FROM user_data "
+          "ORDER BY user_id").fetchall()
+      connection.close()
+    self.assertEqual(len(loaded["csv"]), 7)
+    self.assertEqual(loaded["mmap"], loaded["csv"])
+
+
+if __name__ == "__main__":
+  unittest.main()
@@ -0,0 +1,56 @@
+#!/usr/bin/env python3
+
+import os
+import sqlite3
+import sys
+import tempfile
+import unittest
+from unittest import TestCase
+from unittest.mock import patch
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+if HERE not in sys.path:
+  sys.path.insert(0, HERE)
+
+benchmark = __import__('benchmark')
+db = __import__('db')
+parallel_scan = __import__('parallel_scan')
+col = parallel_scan.col
+
+ROWS = 2000
+
+
+class TestParallelScan(TestCase):
+  """Shard workers combine complete results or raise"""
+
+  @classmethod
+  def setUpClass(cls):
+    """A users table that the worker processes find through DB_PATH"""
+    cls.directory = tempfile.TemporaryDirectory()
+    path = os.path.join(cls.directory.name, "users.db")
+    benchmark.synthesize(path, ROWS)
+    cls.environ = patch.dict(os.environ, {"DB_ENGINE": "sqlite",
+                                          "DB_PATH": path})
+    cls.environ.start()
+    db.configure_pool(size=2)
+
+  @classmethod
+  def tearDownClass(cls):
+    db.get_pool().close()
+    cls.environ.stop()
+    cls.directory.cleanup()
+
+  def test_shards_cover_table(self):
+    """Per-shard statistics combine to the whole table"""
+    stats = parallel_scan.parallel_age_statistics(workers=2)
+    self.assertEqual(stats.moments.count, ROWS)
+
+  def test_shard_error_raises(self):
+    """A database error in a shard reaches the caller"""
+    with self.assertRaises(sqlite3.OperationalError):
+      parallel_scan.parallel_age_statistics(workers=2,
+                                            where=col("missing") > 1)
+
+
+if __name__ == "__main__":
+  unittest.main()
@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+
+import os
+import sqlite3
+import sys
+import tempfile
+import unittest
+from unittest import TestCase
+
+try:
+  import numpy as np
+except ImportError:
+  np = None
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+if HERE not in sys.path:
+  sys.path.insert(0, HERE)
+
+db = __import__('db')
+predicates = __import__('predicates')
+batch_processing = __import__('1-batch_processing')
+col = predicates.col
+
+USERS = [
+  ("u1", "Ann", "ann@gmail.com", 31),
+  ("u2", "Bob", None, 42),
+  ("u3", None, "carl@example.com", None),
+  ("u4", "Dee", "dee@gmail.com", 19),
+  ("u5", "Eve", None, None),
+  ("u6", "Fay", "fay@example.com", 25),
+]
+
+FILTERS = {
+  "gt": col("age") > 25,
+  "not gt": ~(col("age") > 25),
+  "ne": col("age") != 31,
+  "not ne": ~(col("age") != 31),
+  "like": col("email").like("%@gmail.com"),
+  "not like": ~col("email").like("%@gmail.com"),
+  "in": col("age").isin([19, 42]),
+  "not in": ~col("age").isin([19, 42]),
+  "not in with null": ~col("age").isin([19, None]),
+  "not empty in": ~col("age").isin([]),
+  "is null": col("age").is_null(),
+  "not is null": ~col("age").is_null(),
+  "and": (col("age") > 20) & col("email").like("%@gmail.com"),
+  "not and": ~((col("age") > 20) & col("email").like("%@gmail.com")),
+  "or": (col("age") > 40) | col("email").like("%@gmail.com"),
+  "not or": ~((col("age") > 40) | col("email").like("%@gmail.com")),
+  "not not": ~~(col("age") < 30),
+  "or true masks null": (col("age") > 40) | col("name").is_null(),
+}
+
+
+class TestNullSemantics(TestCase):
+  """Client-side filtering keeps the same rows as SQL, NULLs included"""
+
+  @classmethod
+  def setUpClass(cls):
+    """A users table with NULLs in several columns"""
+    cls.directory = tempfile.TemporaryDirectory()
+    cls.path = os.path.join(cls.directory.name, "users.db")
+    connection = sqlite3.connect(cls.path)
+    connection.execute(
+        "CREATE TABLE users (user_id TEXT PRIMARY KEY, name TEXT, "
+        "email TEXT, age INTEGER)")
+    connection.executemany("INSERT INTO users VALUES (?, ?, ?, ?)", USERS)
+    connection.commit()
+    connection.close()
+    db.configure_pool(backend=db.SQLiteBackend(cls.path), size=1)
+
+  @classmethod
+  def tearDownClass(cls):
+    db.get_pool().close()
+    cls.directory.cleanup()
+
+  def ids(self, where, pushdown):
+    batches = batch_processing.stream_users_in_batches(
+        2, where=where, pushdown=pushdown)
+    return sorted(row[0] for batch in batches for row in batch)
+
+  def test_pushdown_matches_fallback(self):
+    """pushdown=False returns the rows the SQL WHERE clause returns"""
+    for name, where in FILTERS.items():
+      with self.subTest(filter=name):
+        self.assertEqual(self.ids(where, False), self.ids(where, True))
+
+  def test_residual_matches_sql(self):
+    """A filter split around a Python test keeps SQL's rows"""
+    for name, where in FILTERS.items():
+      with self.subTest(filter=name):
+        mixed = where & col("user_id").test(lambda value: True)
+        self.assertEqual(self.ids(mixed, True), self.ids(where, True))
+
+  @unittest.skipIf(np is None, "numpy is not installed")
+  def test_column_masks_match_rows(self):
+    """output="columns" applies residual filters as masks, same rows"""
+    for name, where in FILTERS.items():
+      with self.subTest(filter=name):
+        batches = batch_processing.stream_users_in_batches(
+            4, output="columns", where=where, pushdown=False)
+        ids = sorted(i for batch in batches for i in batch["user_id"])
+        self.assertEqual(ids, self.ids(where, True))
+
+  @unittest.skipIf(np is None, "numpy is not installed")
+  def test_mask_matches_evaluate(self):
+    """mask() agrees with evaluate() row by row, Python tests included"""
+    names = ["user_id", "name", "email", "age"]
+    columns = batch_processing._to_columns(names, USERS)
+    for name, where in FILTERS.items():
+      where = (where | col("name").test(lambda value: value == "Fay")
+               | col("age").test(lambda value: value is None))
+      with self.subTest(filter=name):
+        keep = where.bind(names)
+        self.assertEqual(where.mask(columns).tolist(),
+                         [keep(row) for row in USERS])
+
+  def test_evaluate_unknown(self):
+    """Comparisons with NULL, and NOT of them, are unknown"""
+    self.assertIsNone((col("age") > 25).evaluate({"age": None}))
+    self.assertIsNone((~(col("age") > 25)).evaluate({"age": None}))
+    self.assertIs(((col("age") > 25) & (col("age") < 0)).evaluate(
+        {"age": None}), None)
+    self.assertIs(((col("age") > 25) | col("age").is_null()).evaluate(
+        {"age": None}), True)
+    self.assertIs((col("age") > 25).bind(["age"])((None,)), False)
+
+
+if __name__ == "__main__":
+  unittest.main()
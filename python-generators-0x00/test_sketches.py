@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+
+import collections
+import os
+import random
+import sys
+import unittest
+from unittest import TestCase
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+if HERE not in sys.path:
+  sys.path.insert(0, HERE)
+
+sketches = __import__('sketches')
+
+
+def zipf_stream(n, distinct, s=1.2, seed=3):
+  """n values drawn from a Zipf-like distribution over distinct values"""
+  rng = random.Random(seed)
+  weights = [1 / (rank ** s) for rank in range(1, distinct + 1)]
+  values = [f"user{rank}@example{rank % 97}.com"
+            for rank in range(1, distinct + 1)]
+  return rng.choices(values, weights, k=n)
+
+
+class TestHyperLogLog(TestCase):
+  """HyperLogLog estimates against exact distinct counts"""
+
+  def test_relative_error(self):
+    """Estimates stay within four standard errors of the true count"""
+    for n in (10, 1000, 20000, 200000):
+      with self.subTest(n=n):
+        hll = sketches.HyperLogLog(error=0.01)
+        hll.update_many(f"user{i}@example.com" for i in range(n))
+        bound = 4 * hll.relative_error * n
+        self.assertLessEqual(abs(hll.count() - n), max(bound, 1))
+
+  def test_duplicates_ignored(self):
+    """Seeing values again does not change the estimate"""
+    hll = sketches.HyperLogLog(error=0.02)
+    hll.update_many(range(5000))
+    before = hll.count()
+    hll.update_many(range(5000))
+    self.assertEqual(hll.count(), before)
+
+  def test_merge_is_union(self):
+    """Merged shards estimate the union, the same as one sketch"""
+    left = sketches.HyperLogLog(error=0.01).update_many(range(0, 60000))
+    right = sketches.HyperLogLog(error=0.01).update_many(range(40000, 100000))
+    whole = sketches.HyperLogLog(error=0.01).update_many(range(100000))
+    self.assertEqual(left.merge(right).count(), whole.count())
+    self.assertLessEqual(abs(whole.count() - 100000),
+                         4 * whole.relative_error * 100000)
+
+
+class TestCountMinSketch(TestCase):
+  """Count-Min estimates against exact frequencies"""
+
+  @classmethod
+  def setUpClass(cls):
+    cls.stream = zipf_stream(100000, 5000)
+    cls.exact = collections.Counter(cls.stream)
+
+  def test_error_bounds(self):
+    """Never under, and over by epsilon * total for all but ~delta values"""
+    sketch = sketches.CountMinSketch(epsilon=0.001, delta=0.01)
+    sketch.update_many(self.stream)
+    self.assertEqual(sketch.total, len(self.stream))
+    allowance = sketch.epsilon * sketch.total
+    misses = 0
+    for value, count in self.exact.items():
+      estimate = sketch.estimate(value)
+      self.assertGreaterEqual(estimate, count)
+      misses += estimate - count > allowance
+    self.assertLessEqual(misses / len(self.exact), 2 * sketch.delta)
+
+  def test_merge_is_exact(self):
+    """Merging shard sketches gives the single-pass counters"""
+    half = len(self.stream) // 2
+    left = sketches.CountMinSketch(epsilon=0.01).update_many(self.stream[:half])
+    right = sketches.CountMinSketch(epsilon=0.01).update_many(
+        self.stream[half:])
+    whole = sketches.CountMinSketch(epsilon=0.01).update_many(self.stream)
+    left.merge(right)
+    self.assertEqual(left.tables, whole.tables)
+    self.assertEqual(left.total, whole.total)
+
+
+class TestSpaceSaving(TestCase):
+  """SpaceSaving heavy hitters against exact frequencies"""
+
+  ERROR = 0.01
+
+  @classmethod
+  def setUpClass(cls):
+    cls.stream = zipf_stream(100000, 5000)
+    cls.exact = collections.Counter(cls.stream)
+
+  def assertBounds(self, summary):
+    """Heavy values are kept, with counts over by at most error * total"""
+    total = len(self.stream)
+    for value, count in self.exact.items():
+      if count > self.ERROR * total:
+        self.assertIn(value, summary.counts)
+    for value, (count, error) in summary.counts.items():
+      true = self.exact[value]
+      self.assertGreaterEqual(count, true)
+      self.assertLessEqual(count - error, true)
+      self.assertLessEqual(count - true, self.ERROR * total)
+
+  def test_heavy_hitters_kept(self):
+    """One pass keeps every value above error * total"""
+    summary = sketches.SpaceSaving(self.ERROR).update_many(self.stream)
+    self.assertEqual(summary.total, len(self.stream))
+    self.assertBounds(summary)
+
+  def test_heavy_hitters_query(self):
+    """heavy_hitters() finds all true ones; guaranteed ones are all true"""
+    summary = sketches.SpaceSaving(self.ERROR).update_many(self.stream)
+    phi = 0.02
+    truth = {value for value, count in self.exact.items()
+             if count > phi * len(self.stream)}
+    found = {value for value, _, _ in summary.heavy_hitters(phi)}
+    sure = {value for value, _, _ in summary.heavy_hitters(phi, True)}
+    self.assertLessEqual(truth, found)
+    self.assertLessEqual(sure, truth)
+
+  def test_merged_shards(self):
+    """Summaries merged from shards keep the same guarantees"""
+    merged = sketches.SpaceSaving(self.ERROR)
+    for start in range(0, len(self.stream), 25000):
+      shard = self.stream[start:start + 25000]
+      merged.merge(sketches.SpaceSaving(self.ERROR).update_many(shard))
+    self.assertEqual(merged.total, len(self.stream))
+    self.assertBounds(merged)
+
+
+if __name__ == "__main__":
+  unittest.main()
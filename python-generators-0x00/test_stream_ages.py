@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+
+import os
+import random
+import sys
+import time
+import unittest
+from unittest import TestCase
+
+try:
+  import numpy as np
+except ImportError:
+  np = None
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+if HERE not in sys.path:
+  sys.path.insert(0, HERE)
+
+stream_ages = __import__('4-stream_ages')
+stream_stats = __import__('stream_stats')
+
+QUANTILES = (0.01, 0.1, 0.25, 0.5, 0.75, 0.9, 0.99)
+# KLL's rank error is about 1.7 / k (k=200); allow three times that.
+RANK_ERROR = 3 * 1.7 / 200
+
+
+def datasets():
+  """Random and adversarial inputs, as {name: list of floats}"""
+  rng = random.Random(7)
+  n = 50000
+  ages = [float(rng.randint(18, 100)) for _ in range(n)]
+  return {
+    "uniform ages": ages,
+    "sorted": sorted(ages),
+    "reverse sorted": sorted(ages, reverse=True),
+    "gaussian": [rng.gauss(40, 12) for _ in range(n)],
+    "large offset": [1e9 + rng.random() for _ in range(n)],
+    "heavy tail": [rng.paretovariate(1.5) for _ in range(n)],
+    "constant": [42.0] * 1000,
+    "single": [7.0],
+  }
+
+
+@unittest.skipIf(np is None, "numpy is not installed")
+class TestComputeAgeStatistics(TestCase):
+  """compute_age_statistics() against exact NumPy results"""
+
+  @classmethod
+  def setUpClass(cls):
+    cls.data = datasets()
+
+  def test_moments(self):
+    """count, mean, variance, min and max match NumPy"""
+    for name, values in self.data.items():
+      with self.subTest(data=name):
+        stats = stream_ages.compute_age_statistics(values).moments
+        exact = np.array(values)
+        spread = max(exact.std(), 1e-12)
+        self.assertEqual(stats.count, len(values))
+        # Relative to the spread, plus float rounding of the offset.
+        self.assertLessEqual(abs(stats.mean - exact.mean()),
+                             1e-9 * spread + 1e-13 * abs(exact.mean()))
+        self.assertAlmostEqual(stats.variance / spread ** 2,
+                               exact.var() / spread ** 2, delta=1e-6)
+        self.assertEqual(stats.min, exact.min())
+        self.assertEqual(stats.max, exact.max())
+
+  def test_quantile_ranks(self):
+    """Quantiles land within the sketch's rank error of the exact rank"""
+    for name, values in self.data.items():
+      with self.subTest(data=name):
+        stats = stream_ages.compute_age_statistics(values)
+        exact = np.sort(values)
+        for q in QUANTILES:
+          value = stats.quantile(q)
+          low = np.searchsorted(exact, value, side="left") / len(exact)
+          high = np.searchsorted(exact, value, side="right") / len(exact)
+          self.assertLessEqual(low - RANK_ERROR, q, f"q={q}")
+          self.assertGreaterEqual(high + RANK_ERROR, q, f"q={q}")
+
+  def test_merged_shards(self):
+    """Merging per-shard statistics matches NumPy over the whole input"""
+    values = self.data["large offset"]
+    merged = stream_stats.StreamStatistics()
+    for start in range(0, len(values), 7000):
+      merged.merge(stream_ages.compute_age_statistics(
+          values[start:start + 7000]))
+    exact = np.array(values)
+    self.assertEqual(merged.moments.count, len(values))
+    self.assertAlmostEqual(merged.moments.mean, exact.mean(), delta=1e-6)
+    self.assertAlmostEqual(merged.moments.variance, exact.var(), delta=1e-6)
+
+  def test_throughput(self):
+    """One pass keeps up with at least 50,000 values a second"""
+    values = self.data["uniform ages"]
+    started = time.perf_counter()
+    stream_ages.compute_age_statistics(values)
+    rate = len(values) / (time.perf_counter() - started)
+    self.assertGreater(rate, 50000)
+
+
+if __name__ == "__main__":
+  unittest.main()
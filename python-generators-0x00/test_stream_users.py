@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+
+import os
+import sys
+import tempfile
+import unittest
+from unittest import TestCase
+from unittest.mock import patch
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+if HERE not in sys.path:
+  sys.path.insert(0, HERE)
+
+benchmark = __import__('benchmark')
+
+SMALL = 100000
+LARGE = 1000000
+MB = 1024 * 1024
+
+
+@unittest.skipIf(os.environ.get("SKIP_SLOW_TESTS"),
+                 "builds a 1M-row table (about 15s)")
+class TestStreamUsersMemory(TestCase):
+  """Peak RSS of stream_users() must not grow with the table"""
+
+  @classmethod
+  def setUpClass(cls):
+    """Create a small and a large users table in temporary SQLite files"""
+    cls.directory = tempfile.TemporaryDirectory()
+    cls.paths = {}
+    for rows in (SMALL, LARGE):
+      cls.paths[rows] = os.path.join(cls.directory.name, f"users{rows}.db")
+      benchmark.synthesize(cls.paths[rows], rows)
+
+  @classmethod
+  def tearDownClass(cls):
+    cls.directory.cleanup()
+
+  def measure(self, rows):
+    """
+    Stream every row in a child process, as the benchmark does, so the
+    peak RSS includes what the driver allocates in C.
+    """
+    with patch.dict(os.environ, {"DB_ENGINE": "sqlite",
+                                 "DB_PATH": self.paths[rows]}):
+      result = benchmark.run_case("stream_users")
+    self.assertNotIn("error", result)
+    self.assertEqual(result["rows"], rows)
+    return result["peak_rss_growth_bytes"]
+
+  def test_peak_rss_is_flat(self):
+    """Ten times the rows costs about the same peak RSS"""
+    small = self.measure(SMALL)
+    large = self.measure(LARGE)
+    self.assertLess(large, small + 8 * MB)
+
+  def test_peak_rss_is_small(self):
+    """Peak RSS is far below what buffering the table would take"""
+    # A buffered fetchall() of LARGE rows takes a few hundred megabytes.
+    self.assertLess(self.measure(LARGE), 16 * MB)
+
+
+if __name__ == "__main__":
+  unittest.main()
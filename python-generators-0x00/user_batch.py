@@ -0,0 +1,291 @@
+"""
+Compact in-memory representations for streamed users.
+
+A batch of users is normally a list of tuples, which costs a tuple plus one
+Python object per value for every row. This module offers two leaner forms:
+
+* record_type(names) builds a __slots__ class per column layout (UserRecord
+  for the users table) for code that wants row objects with attributes.
+* UserBatch stores each column in a packed container instead: integers in an
+  array.array of the narrowest fitting type, UUID strings as 16 raw bytes,
+  and other strings either as one UTF-8 buffer plus offsets or, for
+  low-cardinality columns, dictionary-encoded as codes into interned values.
+
+memory_per_row() measures the bytes per row of each form for a set of rows.
+"""
+
+import decimal
+import sys
+import uuid
+from array import array
+
+USER_COLUMNS = ("user_id", "name", "email", "age")
+DICTIONARY_RATIO = 0.5
+
+_record_types = {}
+
+
+def record_type(names):
+    """Return a __slots__ record class for the given column names."""
+    names = tuple(names)
+    cls = _record_types.get(names)
+    if cls is None:
+        cls = type("Record", (_RecordBase,), {"__slots__": names})
+        _record_types[names] = cls
+    return cls
+
+
+class _RecordBase:
+    __slots__ = ()
+
+    def __init__(self, *values):
+        for name, value in zip(self.__slots__, values):
+            setattr(self, name, value)
+
+    @classmethod
+    def from_row(cls, row):
+        return cls(*row)
+
+    def __iter__(self):
+        return (getattr(self, name) for name in self.__slots__)
+
+    def astuple(self):
+        return tuple(self)
+
+    def __eq__(self, other):
+        if not isinstance(other, _RecordBase):
+            return NotImplemented
+        return (self.__slots__ == other.__slots__
+                and tuple(self) == tuple(other))
+
+    def __repr__(self):
+        fields = ", ".join(f"{name}={getattr(self, name)!r}"
+                           for name in self.__slots__)
+        return f"{type(self).__name__}({fields})"
+
+
+UserRecord = record_type(USER_COLUMNS)
+
+
+def _int_typecode(values):
+    low, high = min(values), max(values)
+    for code in ("b", "h", "i", "q"):
+        bits = array(code).itemsize * 8
+        if -(1 << (bits - 1)) <= low and high < (1 << (bits - 1)):
+            return code
+    return None
+
+
+class IntColumn:
+    def __init__(self, values):
+        self.values = array(_int_typecode(values) or "q", values)
+
+    def __getitem__(self, index):
+        return self.values[index]
+
+    def nbytes(self):
+        return sys.getsizeof(self.values)
+
+
+class UUIDColumn:
+    """UUID strings stored as 16 packed bytes each."""
+
+    def __init__(self, values):
+        self.data = bytearray()
+        for value in values:
+            self.data += uuid.UUID(value).bytes
+
+    def __getitem__(self, index):
+        start = index * 16
+        return str(uuid.UUID(bytes=bytes(self.data[start:start + 16])))
+
+    def nbytes(self):
+        return sys.getsizeof(self.data)
+
+
+class StringColumn:
+    """Strings as one UTF-8 buffer plus end offsets (None kept as a mask)."""
+
+    def __init__(self, values):
+        self.data = bytearray()
+        self.offsets = array("Q")
+        self.nulls = None
+        for index, value in enumerate(values):
+            if value is None:
+                if self.nulls is None:
+                    self.nulls = set()
+                self.nulls.add(index)
+            else:
+                self.data += value.encode("utf-8")
+            self.offsets.append(len(self.data))
+
+    def __getitem__(self, index):
+        if self.nulls and index in self.nulls:
+            return None
+        start = self.offsets[index - 1] if index else 0
+        return self.data[start:self.offsets[index]].decode("utf-8")
+
+    def nbytes(self):
+        nulls = sys.getsizeof(self.nulls) if self.nulls else 0
+        return sys.getsizeof(self.data) + sys.getsizeof(self.offsets) + nulls
+
+
+class DictionaryColumn:
+    """Repeated values stored once (interned) and referenced by code."""
+
+    def __init__(self, values):
+        self.dictionary = []
+        lookup = {}
+        codes = []
+        for value in values:
+            code = lookup.get(value)
+            if code is None:
+                if isinstance(value, str):
+                    value = sys.intern(value)
+                code = lookup[value] = len(self.dictionary)
+                self.dictionary.append(value)
+            codes.append(code)
+        self.codes = array(_int_typecode(codes or [0]) or "q", codes)
+
+    def __getitem__(self, index):
+        return self.dictionary[self.codes[index]]
+
+    def nbytes(self):
+        return (sys.getsizeof(self.codes) + sys.getsizeof(self.dictionary)
+                + sum(sys.getsizeof(value) for value in self.dictionary))
+
+
+class ObjectColumn:
+    """Fallback for values no packed column can hold."""
+
+    def __init__(self, values):
+        self.values = list(values)
+
+    def __getitem__(self, index):
+        return self.values[index]
+
+    def nbytes(self):
+        return (sys.getsizeof(self.values)
+                + sum(sys.getsizeof(value) for value in self.values))
+
+
+def _is_uuid_column(values):
+    try:
+        return all(str(uuid.UUID(value)) == value for value in values)
+    except (TypeError, ValueError, AttributeError):
+        return False
+
+
+def _as_ints(values):
+    """
+    Return values as ints if they are ints or integral Decimals (MySQL
+    DECIMAL(3,0) ages), which therefore read back as int.
+    """
+    ints = []
+    for value in values:
+        if type(value) is int:
+            ints.append(value)
+        elif (isinstance(value, decimal.Decimal) and value.is_finite()
+              and value == value.to_integral_value()):
+            ints.append(int(value))
+        else:
+            return None
+    return ints
+
+
+def _build_column(values, dictionary=None):
+    present = [value for value in values if value is not None]
+    strings = all(isinstance(value, str) for value in present)
+    if present and len(present) == len(values):
+        ints = _as_ints(values)
+        if ints is not None:
+            return IntColumn(ints)
+        if strings and _is_uuid_column(values):
+            return UUIDColumn(values)
+    if strings:
+        if dictionary is None:
+            dictionary = len(set(values)) <= DICTIONARY_RATIO * len(values)
+        return DictionaryColumn(values) if dictionary else StringColumn(values)
+    return DictionaryColumn(values) if dictionary else ObjectColumn(values)
+
+
+class UserBatch:
+    """
+    A batch of rows stored column by column in packed containers.
+
+    dictionary maps a column name to True/False to force or forbid
+    dictionary encoding; other string columns are dictionary-encoded when at
+    most half of their values are distinct.
+    """
+
+    def __init__(self, names, rows, dictionary=None):
+        self.names = tuple(names)
+        self._length = len(rows)
+        dictionary = dictionary or {}
+        columns = list(zip(*rows)) if rows else [()] * len(self.names)
+        self.columns = {
+            name: _build_column(list(values), dictionary.get(name))
+            for name, values in zip(self.names, columns)
+        }
+
+    @classmethod
+    def from_rows(cls, names, rows, dictionary=None):
+        return cls(names, rows, dictionary)
+
+    def __len__(self):
+        return self._length
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += self._length
+        if not 0 <= index < self._length:
+            raise IndexError("UserBatch index out of range")
+        return tuple(self.columns[name][index] for name in self.names)
+
+    def __iter__(self):
+        for index in range(self._length):
+            yield self[index]
+
+    def record(self, index):
+        return record_type(self.names).from_row(self[index])
+
+    def records(self):
+        cls = record_type(self.names)
+        return [cls.from_row(row) for row in self]
+
+    def column(self, name):
+        """Return one column as a list of Python values."""
+        column = self.columns[name]
+        if isinstance(column, IntColumn):
+            return column.values.tolist()
+        return [column[index] for index in range(self._length)]
+
+    def nbytes(self):
+        """Approximate memory held by the batch's columns."""
+        return sys.getsizeof(self) + sum(column.nbytes()
+                                         for column in self.columns.values())
+
+
+def _tuple_list_nbytes(rows):
+    return sys.getsizeof(rows) + sum(
+        sys.getsizeof(row) + sum(sys.getsizeof(value) for value in row)
+        for row in rows)
+
+
+def _record_list_nbytes(records):
+    return sys.getsizeof(records) + sum(
+        sys.getsizeof(record) + sum(sys.getsizeof(value) for value in record)
+        for record in records)
+
+
+def memory_per_row(names, rows):
+    """Approximate bytes per row as tuples, slotted records and a UserBatch."""
+    if not rows:
+        return {}
+    count = len(rows)
+    records = [record_type(names).from_row(row) for row in rows]
+    return {
+        "tuples": _tuple_list_nbytes(rows) / count,
+        "records": _record_list_nbytes(records) / count,
+        "user_batch": UserBatch(names, rows).nbytes() / count,
+    }